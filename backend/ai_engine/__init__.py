@@ -1,14 +1,11 @@
 # Initialize all AI engine components
-from .model_downloader import ensure_model
+# Models are not constructed here; model_registry loads each one on first use.
+from .model_downloader import ensure_model, MODEL_PATHS
+from .model_registry import registry as model_registry
 from .person_pose import infer_keypoints
+from .person_analysis import analyze_person
 from .warp_mesh import warp_rgba_mesh
 from .cloth_cleaner import clean_cloth
 from .segmentation import ClothSegmentation
 
-__all__ = ['ensure_model', 'infer_keypoints', 'warp_rgba_mesh', 'clean_cloth', 'segmentation']
-
-# Initialize models
-MODEL_PATHS = ensure_model()
-
-# Initialize models
-segmentation = ClothSegmentation()
+__all__ = ['ensure_model', 'MODEL_PATHS', 'model_registry', 'infer_keypoints', 'analyze_person', 'warp_rgba_mesh', 'clean_cloth', 'ClothSegmentation']
@@ -0,0 +1,185 @@
+# backend/ai_engine/cache_store.py
+"""
+Small caching building blocks shared by the try-on engine.
+
+LRUCache keeps hot entries in memory, DiskStore spills pickled entries to a
+size-bounded directory, and TieredCache combines the two.
+"""
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def content_key(*parts) -> str:
+    """Stable hex key for a mix of bytes, str, numpy arrays and other values."""
+    h = hashlib.blake2b(digest_size=20)
+    for part in parts:
+        if hasattr(part, "tobytes") and hasattr(part, "shape"):
+            h.update(str((part.shape, str(part.dtype))).encode())
+            h.update(part.tobytes())
+        elif isinstance(part, bytes):
+            h.update(part)
+        else:
+            h.update(str(part).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU cache bounded by item count."""
+
+    def __init__(self, max_items: int = 128):
+        self.max_items = max(1, int(max_items))
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"items": len(self._data), "max_items": self.max_items, "hits": self.hits, "misses": self.misses}
+
+
+class DiskStore:
+    """
+    Pickled key/value store in a directory, bounded by total size.
+
+    Reads refresh an entry's mtime, and eviction removes the entries with the
+    oldest mtime first, which gives LRU behaviour across processes sharing
+    the same directory.
+    """
+
+    def __init__(self, root: str, max_bytes: int = 1024 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.pkl")
+
+    def get(self, key: str, default=None):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            os.utime(path, None)
+            return value
+        except FileNotFoundError:
+            return default
+        except Exception as e:
+            print(f"⚠️ Dropping unreadable cache entry {path}: {e}")
+            self.delete(key)
+            return default
+
+    def put(self, key: str, value):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self._evict()
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.is_file() and entry.name.endswith(".pkl"):
+                try:
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                except OSError:
+                    continue
+        return entries
+
+    def _evict(self):
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                return
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    continue
+                if total <= self.max_bytes:
+                    break
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._entries()
+        return {"items": len(entries), "bytes": sum(size for _, size, _ in entries), "max_bytes": self.max_bytes}
+
+
+class TieredCache:
+    """In-memory LRU in front of an optional DiskStore."""
+
+    def __init__(self, memory: LRUCache, disk: Optional[DiskStore] = None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str, default=None):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+                return value
+        return default
+
+    def put(self, key: str, value):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.put(key, value)
+            except Exception as e:
+                print(f"⚠️ Could not write cache entry to disk: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"memory": self.memory.stats(), "disk": self.disk.stats() if self.disk is not None else None}
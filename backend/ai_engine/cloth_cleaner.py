@@ -1,60 +1,360 @@
 # backend/ai_engine/cloth_cleaner.py
+"""
+Garment cleaning: background removal plus mannequin-skin filtering.
+
+Every clean_cloth() in the codebase delegates here. Background removal is
+done by a named backend, chosen per request or by cloth type (see
+resolve_backend()); available_backends() lists them.
+"""
 import io
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
 from PIL import Image
-from rembg import remove
 import numpy as np
 import cv2
+from . import image_utils, matting
+from .metrics import metrics
+from .model_registry import registry as model_registry
+
+# --- Clean-background fast path ---
+# Most marketplace product shots sit on a flat or transparent backdrop; those
+# get their alpha from thresholding instead of the neural model.
+FAST_BACKGROUND = os.getenv("VTRY_FAST_BACKGROUND", "1") != "0"
+BORDER_FRACTION = 0.01  # border strip sampled for the backdrop, per side
+BORDER_TOLERANCE = 12   # max channel deviation of a backdrop pixel from the backdrop colour
+BORDER_AGREEMENT = 0.97  # share of a side's pixels that must match the backdrop
+CLEAN_SIDES = 3  # sides that must be pure backdrop; garments are often cropped at one edge
+FOREGROUND_TOLERANCE = 20  # pixels further than this from the backdrop are garment
+MIN_SPECK_FRACTION = 0.0005  # foreground blobs smaller than this share of the image are dropped
+# Backends that cut out the salient object, which is all the threshold approximates.
+# Garment segmenters (u2net_cloth_seg) always run: on a flat backdrop a worn or
+# modelled garment would come back with the model's hair, skin and outline.
+FAST_PATH_BACKENDS = {"u2net", "classical"}
+
+
+def _border_strips(arr: np.ndarray) -> list:
+    """Top, bottom, left and right border strips, each flattened to pixels."""
+    h, w = arr.shape[:2]
+    b = max(2, round(min(h, w) * BORDER_FRACTION))
+    strips = [arr[:b], arr[-b:], arr[:, :b], arr[:, -b:]]
+    return [s.reshape(-1, *arr.shape[2:]) for s in strips]
+
+
+def _clean_sides(matches: list) -> bool:
+    return sum(np.count_nonzero(m) >= BORDER_AGREEMENT * m.size for m in matches) >= CLEAN_SIDES
+
+
+def classify_background(cloth_img: Image.Image) -> dict:
+    """
+    Cheap look at the border and alpha channel of a garment photo.
+
+    Returns {"kind": "transparent"|"flat"|"complex", "color": backdrop RGB or None}.
+    "transparent" images are already cut out, "flat" ones sit on a single
+    backdrop colour; everything else needs the matting model.
+    """
+    arr = np.asarray(cloth_img.convert("RGBA"))
+    alpha = arr[:, :, 3]
+    if alpha.min() < 250:
+        if _clean_sides([a < 16 for a in _border_strips(alpha)]):
+            return {"kind": "transparent", "color": None}
+        return {"kind": "complex", "color": None}
+
+    strips = _border_strips(arr[:, :, :3])
+    color = np.median(np.concatenate(strips), axis=0).astype(np.int16)
+    if _clean_sides([np.abs(s.astype(np.int16) - color).max(axis=1) <= BORDER_TOLERANCE for s in strips]):
+        return {"kind": "flat", "color": tuple(int(c) for c in color)}
+    return {"kind": "complex", "color": None}
+
+
+def threshold_cutout(cloth_img: Image.Image, background: dict) -> Optional[Image.Image]:
+    """
+    RGBA cutout for a classify_background() result of "transparent" or "flat",
+    or None when the result does not look like a single garment.
+
+    Backdrop-coloured regions are removed only where they connect to the image
+    border, so white prints and collars inside the garment are kept.
+    """
+    arr = np.array(cloth_img.convert("RGBA"))
+    h, w = arr.shape[:2]
+    if background["kind"] == "transparent":
+        foreground = (arr[:, :, 3] >= 128).astype(np.uint8)
+    else:
+        r, g, b = background["color"]
+        dist = cv2.split(cv2.absdiff(arr[:, :, :3], (float(r), float(g), float(b), 0.0)))
+        dist = cv2.max(cv2.max(dist[0], dist[1]), dist[2])
+        backdrop = (dist <= FOREGROUND_TOLERANCE).astype(np.uint8)
+        n, labels = cv2.connectedComponents(backdrop, connectivity=4)
+        outside = np.zeros(n, dtype=bool)
+        outside[np.unique(np.concatenate(_border_strips(labels)))] = True
+        outside[0] = False  # label 0 is the garment side of the threshold
+        foreground = (~outside[labels]).astype(np.uint8)
+        foreground = cv2.morphologyEx(foreground, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(foreground, connectivity=8)
+    keep = stats[:, cv2.CC_STAT_AREA] >= MIN_SPECK_FRACTION * h * w
+    keep[0] = False
+    foreground = keep[labels]
+    coverage = np.count_nonzero(foreground) / (h * w)
+    if not 0.02 <= coverage <= 0.98:
+        return None
+
+    if background["kind"] == "transparent":
+        # Keep the existing soft alpha around the garment, drop specks
+        near = cv2.dilate(foreground.astype(np.uint8), np.ones((5, 5), np.uint8))
+        arr[near == 0, 3] = 0
+    else:
+        # Slight feathering stands in for the model's soft edge
+        arr[:, :, 3] = cv2.GaussianBlur(foreground.astype(np.uint8) * 255, (0, 0), 0.7)
+    return Image.fromarray(arr, "RGBA")
+
+
+def remove_background(cloth_img: Image.Image, model_remove: Callable[[Image.Image], Image.Image],
+                      fast_path: bool = True) -> Image.Image:
+    """
+    Background-removed RGBA garment, via the threshold fast path when
+    fast_path is set and the backdrop is clean, and model_remove(cloth_img)
+    otherwise. Pass fast_path only for FAST_PATH_BACKENDS.
+
+    Counts each path in metrics as garment_background:<path> and times it as
+    garment_background_seconds:<path> (path: transparent, flat or model).
+    """
+    start = time.perf_counter()
+    cutout, path = _fast_path_cutout(cloth_img) if FAST_BACKGROUND and fast_path else (None, "model")
+    if cutout is None:
+        cutout = model_remove(cloth_img)
+    _record_background(path, time.perf_counter() - start)
+    return cutout
+
+
+def _fast_path_cutout(cloth_img: Image.Image) -> Tuple[Optional[Image.Image], str]:
+    """(threshold cutout, "transparent"|"flat") on a clean backdrop, else (None, "model")."""
+    background = classify_background(cloth_img)
+    if background["kind"] != "complex":
+        cutout = threshold_cutout(cloth_img, background)
+        if cutout is not None:
+            print(f"⚡ Clean {background['kind']} backdrop; skipping the matting model")
+            return cutout, background["kind"]
+    return None, "model"
+
+
+def _record_background(path: str, seconds: float):
+    metrics.incr(f"garment_background:{path}")
+    metrics.observe(f"garment_background_seconds:{path}", seconds)
+
+
+# --- Cleaning backends ---
+
+MAX_SIDE = 1024  # garments are cleaned at most this large
+# Mannequin skin in HSV; not applied to dresses, whose necklines legitimately show skin
+SKIN_LOWER = np.array([0, 20, 70], dtype=np.uint8)
+SKIN_UPPER = np.array([20, 255, 255], dtype=np.uint8)
+SKIN_EXEMPT = {"dress"}
+
+# Backend per cloth type; anything else uses DEFAULT_BACKEND.
+# VTRY_CLEANING_BACKEND forces one backend for every cloth type.
+BACKEND_BY_CLOTH_TYPE = {"dress": "u2net_cloth_seg", "shirt": "u2net_cloth_seg", "top": "u2net_cloth_seg"}
+DEFAULT_BACKEND = "u2net"
+FORCED_BACKEND = os.getenv("VTRY_CLEANING_BACKEND", "")
+
+# name -> (remove(RGBA image) -> RGBA cutout, description)
+_backends: Dict[str, tuple] = {}
+# name -> remove_batch(list of RGBA images) -> list of RGBA cutouts, for backends
+# whose model runs several garments per inference
+_batch_backends: Dict[str, Callable[[List[Image.Image]], List[Image.Image]]] = {}
+
+
+def register_backend(name: str, description: str = ""):
+    """Decorator registering a background-removal function under name."""
+    def decorator(fn: Callable[[Image.Image], Image.Image]):
+        _backends[name] = (fn, description)
+        return fn
+    return decorator
+
+
+def register_batch_backend(name: str):
+    """Decorator registering the batched counterpart of backend name (see clean_cloth_batch())."""
+    def decorator(fn: Callable[[List[Image.Image]], List[Image.Image]]):
+        _batch_backends[name] = fn
+        return fn
+    return decorator
 
-def clean_cloth(cloth_img: Image.Image, cloth_type: str = "shirt") -> Image.Image:
+
+def available_backends() -> Dict[str, str]:
+    return {name: description for name, (_, description) in _backends.items()}
+
+
+def get_backend(name: str) -> Callable[[Image.Image], Image.Image]:
+    """The background-removal function registered as name."""
+    if name not in _backends:
+        raise ValueError(f"Unknown cleaning backend '{name}'; expected one of {sorted(_backends)}")
+    return _backends[name][0]
+
+
+def resolve_backend(cloth_type: str = "shirt", backend: Optional[str] = None) -> str:
+    """Backend name for a request: backend if given, else VTRY_CLEANING_BACKEND, else by cloth type."""
+    name = backend or FORCED_BACKEND or BACKEND_BY_CLOTH_TYPE.get(cloth_type.lower(), DEFAULT_BACKEND)
+    get_backend(name)
+    return name
+
+
+@register_backend("u2net_cloth_seg", "rembg u2net_cloth_seg, garment classes merged into one mask")
+def _remove_u2net_cloth_seg(img: Image.Image) -> Image.Image:
+    with model_registry.checkout("rembg_u2net_cloth_seg") as session:
+        def predict(im):
+            return matting.union_mask(session.predict(im))
+        if matting.MATTING_MODE == "lowres":
+            return matting.lowres_remove(img, predict, matting.lowres_side_for("u2net_cloth_seg"))
+        mask = predict(img)
+    return Image.composite(img, Image.new("RGBA", img.size, 0), mask)
+
+
+@register_backend("u2net", "generic u2net salient-object matting on the batched ONNX engine")
+def _remove_u2net(img: Image.Image) -> Image.Image:
+    return model_registry.get("matting_u2net").remove(img)
+
+
+@register_batch_backend("u2net")
+def _remove_u2net_batch(images: List[Image.Image]) -> List[Image.Image]:
+    return model_registry.get("matting_u2net").remove_batch(images)
+
+
+@register_backend("classical", "backdrop thresholding, else GrabCut; no neural model")
+def _remove_classical(img: Image.Image) -> Image.Image:
+    background = classify_background(img)
+    if background["kind"] != "complex":
+        cutout = threshold_cutout(img, background)
+        if cutout is not None:
+            return cutout
+    return grabcut_cutout(img)
+
+
+def grabcut_cutout(img: Image.Image, side: int = 320, iterations: int = 4) -> Image.Image:
     """
-    Removes background and filters out skin-like regions from cloth image.
-    
+    GrabCut seeded with everything but a thin frame as probable garment,
+    run on a copy no larger than side and guided-upsampled back.
+    """
+    small = matting.downscale(img, side)
+    bgr = cv2.cvtColor(np.asarray(small.convert("RGB")), cv2.COLOR_RGB2BGR)
+    h, w = bgr.shape[:2]
+    margin = max(2, round(min(h, w) * 0.02))
+    mask = np.zeros((h, w), np.uint8)
+    bgd_model = np.zeros((1, 65), np.float64)
+    fgd_model = np.zeros((1, 65), np.float64)
+    cv2.grabCut(bgr, mask, (margin, margin, w - 2 * margin, h - 2 * margin), bgd_model, fgd_model,
+                iterations, cv2.GC_INIT_WITH_RECT)
+    fg = np.where((mask == cv2.GC_FGD) | (mask == cv2.GC_PR_FGD), 255, 0).astype(np.uint8)
+    fg = Image.fromarray(cv2.morphologyEx(fg, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8)), mode="L")
+    if small is not img:
+        fg = matting.refine_mask(fg, img, small)
+    return Image.composite(img.convert("RGBA"), Image.new("RGBA", img.size, 0), fg)
+
+
+def remove_skin(np_img: np.ndarray) -> np.ndarray:
+    """Makes mannequin-skin pixels of an RGBA array transparent, in place."""
+    hsv = cv2.cvtColor(np_img[:, :, :3], cv2.COLOR_RGB2HSV)
+    np_img[cv2.inRange(hsv, SKIN_LOWER, SKIN_UPPER) > 0] = (0, 0, 0, 0)
+    return np_img
+
+
+def prepare_garment(cloth_img: Image.Image) -> Image.Image:
+    """RGBA copy of cloth_img, at most MAX_SIDE, sharpened and contrast-boosted for segmentation."""
+    cloth_img = cloth_img.convert("RGBA")  # always a copy; callers keep their image
+    if max(cloth_img.size) > MAX_SIDE:
+        cloth_img.thumbnail((MAX_SIDE, MAX_SIDE), Image.LANCZOS)
+    return image_utils.enhance_garment(cloth_img)
+
+
+def clean_cloth(cloth_img: Image.Image, cloth_type: str = "shirt", backend: Optional[str] = None,
+                fast_path: bool = True) -> Image.Image:
+    """
+    Removes background and mannequin skin from a cloth image.
+
     Args:
         cloth_img: PIL Image of the clothing
         cloth_type: Type of clothing (shirt, dress, etc.)
-        
+        backend: Background-removal backend name; None picks one by cloth type
+        fast_path: False always runs the backend model, even on a flat backdrop
+
     Returns:
-        PIL Image with clean clothing on transparent background
-    """
-    print(f"🧹 Cleaning {cloth_type} image...")
-    
-    # Step 1: Ensure RGBA mode
-    if cloth_img.mode != "RGBA":
-        print(f"Converting image from {cloth_img.mode} to RGBA")
-        cloth_img = cloth_img.convert("RGBA")
-    
-    # Step 2: Remove background
-    print("Removing background...")
-    try:
-        no_bg = remove(cloth_img)  # Still might have face/hands
-        print("✅ Background removal successful")
-    except Exception as e:
-        print(f"❌ Background removal failed: {e}")
-        raise
-
-    try:
-        print("Converting to OpenCV format for skin removal...")
-        # Step 3: Convert to OpenCV for skin removal
-        np_img = np.array(no_bg)
-        bgr = cv2.cvtColor(np_img, cv2.COLOR_RGBA2BGR)
-        hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
-
-        # Skin color range (tune if needed)
-        lower_skin = np.array([0, 40, 0], dtype=np.uint8)
-        upper_skin = np.array([25, 255, 255], dtype=np.uint8)
-
-        print("Removing skin-colored regions...")
-        mask = cv2.inRange(hsv, lower_skin, upper_skin)
-
-        # Step 4: Remove skin pixels by making them transparent
-        np_img[mask > 0] = (0, 0, 0, 0)
-
-        # Step 5: Back to PIL
-        cleaned = Image.fromarray(np_img, "RGBA")
-        print("✅ Skin removal and cleaning completed")
-        return cleaned
-        
-    except Exception as e:
-        print(f"❌ Skin removal processing failed: {e}")
-        print("⚠️ Returning original background-removed image as fallback")
-        return no_bg
+        PIL Image with clean clothing on transparent background, at most MAX_SIDE
+    """
+    name = resolve_backend(cloth_type, backend)
+    print(f"🧹 Cleaning {cloth_type} image with the {name} backend...")
+
+    cloth_img = prepare_garment(cloth_img)
+
+    np_img = None
+    for attempt in dict.fromkeys([name, DEFAULT_BACKEND]):
+        try:
+            # Flat or transparent product-shot backdrops skip salient-object models
+            with metrics.timer(f"cleaning_seconds:{attempt}"):
+                np_img = np.array(remove_background(cloth_img, get_backend(attempt),
+                                                    fast_path=fast_path and attempt in FAST_PATH_BACKENDS))
+            break
+        except Exception as e:
+            print(f"⚠️ {attempt} background removal failed: {e}")
+    if np_img is None:
+        print("⚠️ Using the original image")
+        np_img = np.array(cloth_img)
+    return _finish_garment(np_img, cloth_type)
+
+
+def clean_cloth_batch(cloth_imgs: List[Image.Image], cloth_types: List[str], backend: Optional[str] = None,
+                      fast_path: bool = True) -> List[Image.Image]:
+    """
+    clean_cloth() for several garments at once.
+
+    Garments whose backend has a batched model (register_batch_backend())
+    are matted together, several per inference; clean backdrops still take
+    the fast path. The rest, and every garment of a batch that fails, go
+    through clean_cloth() one at a time.
+    """
+    results: List[Optional[Image.Image]] = [None] * len(cloth_imgs)
+    groups: Dict[str, List[int]] = {}
+    for i, cloth_type in enumerate(cloth_types):
+        name = resolve_backend(cloth_type, backend)
+        if name in _batch_backends:
+            groups.setdefault(name, []).append(i)
+
+    for name, indices in groups.items():
+        print(f"🧹 Cleaning {len(indices)} garments with the {name} backend in one batch...")
+        cutouts, pending = {}, []
+        for i in indices:
+            img = prepare_garment(cloth_imgs[i])
+            start = time.perf_counter()
+            cutout, path = (_fast_path_cutout(img) if FAST_BACKGROUND and fast_path and name in FAST_PATH_BACKENDS
+                            else (None, "model"))
+            if cutout is None:
+                pending.append((i, img))
+            else:
+                _record_background(path, time.perf_counter() - start)
+                metrics.observe(f"cleaning_seconds:{name}", time.perf_counter() - start)
+                cutouts[i] = cutout
+        try:
+            start = time.perf_counter()
+            if pending:
+                cutouts.update(zip([i for i, _ in pending], _batch_backends[name]([img for _, img in pending])))
+            seconds = (time.perf_counter() - start) / max(1, len(pending))
+            for _ in pending:
+                _record_background("model", seconds)
+                metrics.observe(f"cleaning_seconds:{name}", seconds)
+        except Exception as e:
+            print(f"⚠️ Batched {name} background removal failed ({e}); cleaning one at a time")
+            continue
+        for i in indices:
+            results[i] = _finish_garment(np.array(cutouts[i]), cloth_types[i])
+
+    return [result if result is not None else clean_cloth(img, cloth_type, backend, fast_path)
+            for img, cloth_type, result in zip(cloth_imgs, cloth_types, results)]
+
+
+def _finish_garment(np_img: np.ndarray, cloth_type: str) -> Image.Image:
+    """Mannequin-skin filtering (skipped for SKIN_EXEMPT types) on a cutout array."""
+    if cloth_type.lower() not in SKIN_EXEMPT:
+        try:
+            remove_skin(np_img)
+        except Exception as e:
+            print(f"⚠️ Skin removal failed: {e}")
+    print("✅ Cloth cleaning completed")
+    return Image.fromarray(np_img, "RGBA")
@@ -249,6 +249,13 @@ def _resample_polygon(pts: np.ndarray, n_points: int) -> np.ndarray:
     return np.array(res, dtype=np.float32)
 
 
+def resample_source_points(pts: np.ndarray, n_points: int) -> np.ndarray:
+    """Resample points from get_source_points() (e.g. a cached contour) to n_points."""
+    if n_points and n_points > 0 and pts.shape[0] != n_points:
+        return _resample_polygon(pts, n_points)
+    return pts
+
+
 def get_source_points(cloth_img, n_points: int = None):
     """Return a set of source points (np.ndarray Nx2) for the given cloth image.
     Attempts to extract the main garment contour from the alpha channel. Falls
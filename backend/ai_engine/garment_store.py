@@ -0,0 +1,175 @@
+# backend/ai_engine/garment_store.py
+"""
+Persistent store of cleaned garment assets.
+
+Popular product links are tried on over and over; cleaning the garment
+(enhancement, rembg, skin removal) is the same work every time. An asset
+holds the cleaned RGBA garment, its alpha contour, the source mesh for the
+warp and the cloth type it was cleaned for. Assets are keyed by a hash of
+the garment pixels and the cleaning backend, and a second index maps
+canonical product URLs to those keys so a repeat link can skip the download
+entirely.
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import numpy as np
+from PIL import Image
+
+from . import cache_store, cloth_cleaner, fit_polygons, matting
+
+# Bump whenever cleaning changes, so stale assets are ignored.
+GARMENT_STORE_VERSION = "5"
+
+# create_realistic_polygon() always returns this many destination points
+MESH_POINTS = 15
+
+DEFAULT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads", "cache", "garments"))
+
+# Query parameters that identify a visit rather than a product
+_TRACKING_PARAMS = {
+    "ref", "ref_", "tag", "psc", "th", "smid", "sr", "qid", "keywords", "crid", "sprefix",
+    "dib", "dib_tag", "_encoding", "content-id", "affid", "affextparam", "gclid", "fbclid",
+    "lid", "marketplace", "store", "srno", "otracker", "fm", "iid", "ppt", "ppn", "ssid",
+}
+
+
+def canonical_url(url: str) -> str:
+    """Normalise a product URL so tracking variants of the same link share a key."""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = parts.path.rstrip("/") or "/"
+
+    # Amazon: /<slug>/dp/<ASIN>/<tracking> -> /dp/<ASIN>
+    if "amazon." in host:
+        segments = path.split("/")
+        for marker in ("dp", "product"):
+            if marker in segments:
+                i = segments.index(marker)
+                if i + 1 < len(segments):
+                    return urlunsplit(("https", host, f"/dp/{segments[i + 1]}", "", ""))
+
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=False)
+        if not k.lower().startswith(("utm_", "pd_rd_", "pf_rd_")) and k.lower() not in _TRACKING_PARAMS
+    )
+    return urlunsplit(("https", host, path, urlencode(query), ""))
+
+
+def build_mesh(contour: np.ndarray, n_points: int = MESH_POINTS) -> Optional[Dict[str, np.ndarray]]:
+    """Source points resampled to n_points plus their Delaunay triangles, or None."""
+    try:
+        from .warp_mesh import _triangulate
+        src_pts = fit_polygons.resample_source_points(contour, n_points)
+        return {"src_pts": src_pts, "triangles": _triangulate(src_pts)}
+    except Exception as e:
+        print(f"⚠️ Could not build garment mesh: {e}")
+        return None
+
+
+class GarmentStore:
+    """
+    Two-level garment cache: assets by content key, plus a URL -> key index.
+
+    Both are TieredCaches (small in-memory LRU over a size-bounded DiskStore).
+    Assets are dicts: cloth_rgba (HxWx4 uint8), contour (Nx2 float32 from
+    fit_polygons.get_source_points), mesh (build_mesh() or None),
+    cloth_type, backend, key, created_at. Returned arrays are shared and must
+    not be modified. backend=None everywhere means the cloth type's default
+    cloth_cleaner backend.
+    """
+
+    def __init__(self, root: str = DEFAULT_ROOT, max_bytes: int = 2048 * 1024 * 1024,
+                 memory_items: int = 64):
+        self.root = root
+        self.assets = cache_store.TieredCache(
+            cache_store.LRUCache(memory_items),
+            cache_store.DiskStore(os.path.join(root, "assets"), max_bytes),
+        )
+        self.urls = cache_store.TieredCache(
+            cache_store.LRUCache(1024),
+            cache_store.DiskStore(os.path.join(root, "urls"), 16 * 1024 * 1024),
+        )
+
+    @staticmethod
+    def content_key(cloth_img: Image.Image, cloth_type: str, backend: Optional[str] = None) -> str:
+        """Key for a garment image: its decoded pixels, the cloth type, cleaning backend and matting mode."""
+        return cache_store.content_key("garment", GARMENT_STORE_VERSION, matting.MATTING_MODE, cloth_type.lower(),
+                                       cloth_cleaner.resolve_backend(cloth_type, backend),
+                                       np.asarray(cloth_img.convert("RGBA")))
+
+    @staticmethod
+    def _url_key(url: str, cloth_type: str, backend: Optional[str] = None) -> str:
+        return cache_store.content_key("garment-url", GARMENT_STORE_VERSION, matting.MATTING_MODE, cloth_type.lower(),
+                                       cloth_cleaner.resolve_backend(cloth_type, backend), canonical_url(url))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.assets.get(key)
+
+    def lookup_url(self, url: str, cloth_type: str, backend: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Asset previously stored for this product URL, or None."""
+        key = self.urls.get(self._url_key(url, cloth_type, backend))
+        return self.assets.get(key) if key is not None else None
+
+    def link_url(self, url: str, cloth_type: str, key: str, backend: Optional[str] = None):
+        self.urls.put(self._url_key(url, cloth_type, backend), key)
+
+    def get_or_create(self, cloth_img: Image.Image, cloth_type: str,
+                      cleaner: Callable[[Image.Image, str], Image.Image],
+                      source_url: Optional[str] = None, backend: Optional[str] = None,
+                      use_cache: bool = True) -> Dict[str, Any]:
+        """
+        Cleaned asset for cloth_img, running cleaner(cloth_img, cloth_type) on a miss.
+
+        cleaner must use the given backend. With source_url, the URL index is
+        updated to point at the asset. use_cache=False always runs cleaner
+        and neither reads nor writes the store.
+        """
+        key = self.content_key(cloth_img, cloth_type, backend)
+        asset = self.assets.get(key) if use_cache else None
+        if asset is not None:
+            print("⚡ Garment store hit (content)")
+        else:
+            cleaned = cleaner(cloth_img, cloth_type).convert("RGBA")
+            contour = fit_polygons.get_source_points(cleaned)
+            asset = {
+                "key": key,
+                "cloth_rgba": np.asarray(cleaned),
+                "contour": contour,
+                "mesh": build_mesh(contour),
+                "cloth_type": cloth_type.lower(),
+                "backend": cloth_cleaner.resolve_backend(cloth_type, backend),
+                "created_at": time.time(),
+            }
+            if not use_cache:
+                return asset
+            self.assets.put(key, asset)
+        if source_url:
+            self.link_url(source_url, cloth_type, key, backend)
+        return asset
+
+    def stats(self) -> Dict[str, Any]:
+        return {"assets": self.assets.stats(), "urls": self.urls.stats()}
+
+
+_garment_store = None
+_garment_store_lock = threading.Lock()
+
+
+def get_garment_store() -> GarmentStore:
+    """Process-wide GarmentStore configured from VTRY_GARMENT_* environment variables."""
+    global _garment_store
+    if _garment_store is None:
+        with _garment_store_lock:
+            if _garment_store is None:
+                _garment_store = GarmentStore(
+                    os.getenv("VTRY_GARMENT_CACHE_DIR", DEFAULT_ROOT),
+                    int(os.getenv("VTRY_GARMENT_CACHE_MB", "2048")) * 1024 * 1024,
+                    int(os.getenv("VTRY_GARMENT_CACHE_ITEMS", "64")),
+                )
+    return _garment_store
@@ -1,23 +1,20 @@
 # backend/ai_engine/human_parsing.py
 import cv2, numpy as np
-import mediapipe as mp
+from .model_registry import registry
+from .image_utils import read_rgb
 
-_selfie = None
+def infer_person_mask(img_path: str, thresh: float = 0.5) -> np.ndarray:
+    return infer_person_mask_rgb(read_rgb(img_path), thresh)
 
-def _load_seg():
-    global _selfie
-    if _selfie is None:
-        _selfie = mp.solutions.selfie_segmentation.SelfieSegmentation(model_selection=1)
-    return _selfie
+def infer_person_mask_rgb(rgb: np.ndarray, thresh: float = 0.5) -> np.ndarray:
+    """rgb: HxWx3 uint8 RGB array (already decoded)"""
+    with registry.checkout("mediapipe_selfie_segmentation") as segmenter:
+        seg = segmenter.process(rgb)
+    return person_mask_from_probabilities(seg.segmentation_mask, thresh)
 
-def infer_person_mask(img_path: str, thresh: float = 0.5) -> np.ndarray:
-    img = cv2.imread(img_path)
-    if img is None:
-        raise RuntimeError(f"cannot read image: {img_path}")
-    h, w = img.shape[:2]
-    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    seg = _load_seg().process(rgb)
-    m = (seg.segmentation_mask >= thresh).astype(np.uint8) * 255
+def person_mask_from_probabilities(prob: np.ndarray, thresh: float = 0.5) -> np.ndarray:
+    """Threshold a float person-probability map and clean it into a 0/255 mask."""
+    m = (prob >= thresh).astype(np.uint8) * 255
     # clean up
     kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5,5))
     m = cv2.morphologyEx(m, cv2.MORPH_CLOSE, kernel, 2)
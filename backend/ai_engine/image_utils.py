@@ -1,6 +1,39 @@
 import os
+import cv2
+import numpy as np
 from PIL import Image
 
+
+def read_rgb(img_path: str) -> np.ndarray:
+    """
+    Decodes an image file into a contiguous HxWx3 uint8 RGB array.
+    """
+    img_bgr = cv2.imread(img_path)
+    if img_bgr is None:
+        raise RuntimeError(f"cannot read image: {img_path}")
+    return cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+
+
+def to_rgb_array(img) -> np.ndarray:
+    """
+    Returns a contiguous HxWx3 uint8 RGB array for a PIL image or an
+    RGB/RGBA/grayscale ndarray, so an already decoded image can be shared by
+    every analysis stage without another round trip through the disk.
+    """
+    if isinstance(img, Image.Image):
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        return np.asarray(img)
+    arr = np.asarray(img)
+    if arr.ndim == 2:
+        arr = cv2.cvtColor(arr, cv2.COLOR_GRAY2RGB)
+    elif arr.shape[2] == 4:
+        arr = arr[:, :, :3]
+    if arr.dtype != np.uint8:
+        arr = np.clip(arr, 0, 255).astype(np.uint8)
+    return np.ascontiguousarray(arr)
+
+
 def validate_and_preprocess_image(img: Image.Image, min_size: int = 256, max_size: int = 1024) -> Image.Image:
     """
     Validates and preprocesses an image for the try-on pipeline.
@@ -28,6 +61,56 @@ def validate_and_preprocess_image(img: Image.Image, min_size: int = 256, max_siz
         
     return img
 
+# PIL's ImageFilter.SMOOTH, the "degenerate" image ImageEnhance.Sharpness blends against
+_SMOOTH_KERNEL = np.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], dtype=np.float32) / 13.0
+
+
+def _blend_lut(degenerate: float, factor: float) -> np.ndarray:
+    """PIL Image.blend(degenerate, x, factor) as a 256-entry table (truncating, clipped)."""
+    x = np.arange(256, dtype=np.float32)
+    return np.clip(degenerate + factor * (x - degenerate), 0, 255).astype(np.uint8)
+
+
+def enhance_garment(img: Image.Image, sharpness: float = 1.3, color: float = 1.1,
+                    tone: tuple = ((1.15, 1.05), (1.2, 1.1))) -> Image.Image:
+    """
+    Single-pass equivalent of ImageEnhance Sharpness -> (Contrast, Brightness)
+    -> Color -> (Contrast, Brightness) for each (contrast, brightness) in tone.
+
+    Sharpening is one unsharp-mask pass against PIL's SMOOTH kernel. Contrast
+    and brightness are per-value maps that commute with the colour step, so
+    they collapse into a single lookup table; each contrast pivot (the mean
+    luma PIL would measure at that point) is derived from the luma histogram
+    instead of another pass over the image. Alpha is passed through. Output
+    matches the PIL chain up to rounding at clipped extremes.
+    """
+    arr = np.asarray(img.convert("RGBA"))
+    rgb = cv2.cvtColor(arr, cv2.COLOR_RGBA2RGB)
+
+    # Sharpness: blend with the 3x3 smoothed image; PIL leaves the 1px border unfiltered.
+    # PIL truncates where addWeighted rounds, hence gamma=-0.5 in the blends below.
+    smooth = cv2.filter2D(rgb, -1, _SMOOTH_KERNEL, borderType=cv2.BORDER_REPLICATE)
+    smooth[0], smooth[-1], smooth[:, 0], smooth[:, -1] = rgb[0], rgb[-1], rgb[:, 0], rgb[:, -1]
+    sharp = cv2.addWeighted(rgb, sharpness, smooth, 1.0 - sharpness, -0.5)
+
+    # Tone curve: chain the contrast/brightness tables, tracking the mean luma each contrast pivots on
+    luma = cv2.cvtColor(sharp, cv2.COLOR_RGB2GRAY)
+    hist = np.bincount(luma.ravel(), minlength=256).astype(np.float64)
+    hist /= hist.sum()
+    lut = np.arange(256, dtype=np.uint8)
+    for contrast, brightness in tone:
+        mean = int(float(np.dot(hist, lut)) + 0.5)
+        lut = _blend_lut(mean, contrast)[lut]
+        lut = _blend_lut(0.0, brightness)[lut]
+
+    # Colour: blend each channel with the pixel's luma, then apply the tone table
+    out = cv2.addWeighted(sharp, color, cv2.cvtColor(luma, cv2.COLOR_GRAY2RGB), 1.0 - color, -0.5)
+    out = cv2.cvtColor(cv2.LUT(out, lut), cv2.COLOR_RGB2RGBA)
+    out[:, :, 3] = arr[:, :, 3]
+
+    return Image.fromarray(out, "RGBA")
+
+
 def cleanup_temp_files(file_list: list):
     """
     Safely removes temporary files created during processing.
@@ -0,0 +1,282 @@
+# backend/ai_engine/matting.py
+"""
+Batched garment matting on ONNX Runtime.
+
+rembg.remove() runs one image at a time on a session created with default
+options. MattingEngine loads the same u2net-family model with explicit
+thread and graph-optimisation settings, caches the optimised graph on disk
+so later sessions start faster, and runs several garments per inference
+when the model accepts a batch dimension.
+
+The models resize every input to a fixed size (320px for u2net, 768px for
+u2net_cloth_seg), so in "lowres" mode the garment is matted on a copy no
+larger than that and the alpha is brought back to full resolution with a
+fast guided filter, which snaps the mask edges to the garment's own edges
+instead of blurring them with a plain resize.
+"""
+import os
+from typing import Callable, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image, ImageChops
+
+ONNX_CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads", "cache", "onnx"))
+
+# Models sharing u2net's pre/post-processing (320x320 input, ImageNet normalisation)
+U2NET_FAMILY = {"u2net", "u2netp", "u2net_human_seg", "silueta"}
+INPUT_SIZE = (320, 320)
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# "full" mattes the image as given; "lowres" mattes a copy no larger than the
+# model input and guided-upsamples the alpha
+MATTING_MODES = ("full", "lowres")
+MATTING_MODE = os.getenv("VTRY_MATTING_MODE", "full")
+# 0 means each model's own input side
+LOWRES_SIDE = int(os.getenv("VTRY_MATTING_LOWRES_SIDE", "0"))
+# rembg models that do not resize to INPUT_SIZE
+MODEL_INPUT_SIDE = {"u2net_cloth_seg": 768}
+
+_OPT_LEVELS = {"disable": "ORT_DISABLE_ALL", "basic": "ORT_ENABLE_BASIC",
+               "extended": "ORT_ENABLE_EXTENDED", "all": "ORT_ENABLE_ALL"}
+
+
+def rembg_model_path(model_name: str) -> str:
+    """Path of rembg's ONNX file for model_name, downloading it if rembg can."""
+    try:
+        from rembg.sessions import sessions_class
+        for cls in sessions_class:
+            if cls.name() == model_name:
+                return cls.download_models()
+    except (ImportError, AttributeError) as e:
+        print(f"⚠️ rembg model lookup unavailable ({e}); using the default model directory")
+    home = os.path.expanduser(os.getenv("U2NET_HOME", os.path.join("~", ".u2net")))
+    return os.path.join(home, f"{model_name}.onnx")
+
+
+def lowres_side_for(model_name: str) -> int:
+    """Longest side used for "lowres" matting with model_name."""
+    return LOWRES_SIDE or MODEL_INPUT_SIDE.get(model_name, INPUT_SIZE[0])
+
+
+def downscale(img: Image.Image, side: int) -> Image.Image:
+    """img with its longest side reduced to side (area filter); smaller images are returned as is."""
+    if max(img.size) <= side:
+        return img
+    scale = side / max(img.size)
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    arr = np.asarray(img.convert("RGB"))
+    return Image.fromarray(cv2.resize(arr, size, interpolation=cv2.INTER_AREA))
+
+
+def guided_coefficients(alpha: np.ndarray, guide: np.ndarray, radius: int = 1,
+                        eps: float = 1e-4) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Guided filter coefficients (a, b) with alpha ~ a * guide + b locally.
+
+    alpha and guide are float32 images of the same size with values in 0..1.
+    Fitted at low resolution, a and b can be upsampled and applied to the
+    full-resolution guide (fast guided filter upsampling).
+    """
+    ksize = (2 * radius + 1, 2 * radius + 1)
+
+    def box(x):
+        return cv2.boxFilter(x, -1, ksize, borderType=cv2.BORDER_REFLECT)
+
+    mean_i = box(guide)
+    mean_p = box(alpha)
+    cov_ip = box(guide * alpha) - mean_i * mean_p
+    var_i = box(guide * guide) - mean_i * mean_i
+    a = cov_ip / (var_i + eps)
+    b = mean_p - a * mean_i
+    return box(a), box(b)
+
+
+def _background_distance(rgb: np.ndarray, bg_color: np.ndarray) -> np.ndarray:
+    """Chebyshev distance of each ...x3 uint8 pixel from bg_color, as float32 in 0..1."""
+    d = np.abs(rgb.astype(np.float32) - bg_color)
+    return np.maximum(np.maximum(d[..., 0], d[..., 1]), d[..., 2]) * (1.0 / 255)
+
+
+def refine_mask(mask: Image.Image, img: Image.Image, small: Optional[Image.Image] = None) -> Image.Image:
+    """
+    Low-resolution mode "L" mask brought to img's size.
+
+    small is the downscaled image the mask was predicted on, if at hand.
+    The guide is each pixel's distance from the background colour (estimated
+    where the mask is clearly background), which separates garment from
+    backdrop far better than luminance does. Only the uncertain band around
+    the mask edge is evaluated against the full-resolution guide; elsewhere
+    a bilinear upsample is already exact.
+    """
+    alpha_lo = np.asarray(mask, dtype=np.float32) * (1.0 / 255)
+    rgb = np.asarray(img.convert("RGB"))
+    h, w = rgb.shape[:2]
+    alpha = cv2.resize(alpha_lo, (w, h), interpolation=cv2.INTER_LINEAR)
+
+    if small is not None and small.size == mask.size:
+        rgb_lo = np.asarray(small.convert("RGB"))
+    else:
+        rgb_lo = cv2.resize(rgb, (alpha_lo.shape[1], alpha_lo.shape[0]), interpolation=cv2.INTER_AREA)
+    background = (alpha_lo < 0.05).astype(np.uint8)
+    if cv2.countNonZero(background):
+        bg_color = np.array(cv2.mean(rgb_lo, mask=background)[:3], dtype=np.float32)
+        a, b = guided_coefficients(alpha_lo, _background_distance(rgb_lo, bg_color))
+
+        unsure = ((alpha_lo > 0.02) & (alpha_lo < 0.98)).astype(np.uint8)
+        unsure = cv2.resize(cv2.dilate(unsure, np.ones((3, 3), np.uint8)), (w, h), interpolation=cv2.INTER_NEAREST)
+        idx = np.flatnonzero(unsure)
+        guide = _background_distance(rgb.reshape(-1, 3)[idx], bg_color)
+        a = cv2.resize(a, (w, h), interpolation=cv2.INTER_LINEAR).ravel()[idx]
+        b = cv2.resize(b, (w, h), interpolation=cv2.INTER_LINEAR).ravel()[idx]
+        alpha.ravel()[idx] = np.clip(a * guide + b, 0.0, 1.0)
+    return Image.fromarray(cv2.convertScaleAbs(alpha, alpha=255), mode="L")
+
+
+def lowres_remove(img: Image.Image, predict_mask: Callable[[Image.Image], Image.Image],
+                  side: int) -> Image.Image:
+    """
+    RGBA cutout of img using predict_mask() on a downscaled copy.
+
+    predict_mask takes an image and returns a mode "L" mask of the same size,
+    e.g. lambda im: union_mask(session.predict(im)) for a rembg session.
+    """
+    small = downscale(img, side)
+    mask = predict_mask(small)
+    if small is not img:
+        mask = refine_mask(mask, img, small)
+    return Image.composite(img.convert("RGBA"), Image.new("RGBA", img.size, 0), mask)
+
+
+def union_mask(masks: List[Image.Image]) -> Image.Image:
+    """Pixel-wise max of rembg's masks (u2net_cloth_seg predicts one per garment class)."""
+    mask = masks[0]
+    for other in masks[1:]:
+        mask = ImageChops.lighter(mask, other)
+    return mask
+
+
+class MattingEngine:
+    """
+    u2net-family background removal with tunable ONNX Runtime sessions.
+
+    InferenceSession.run is thread-safe, so one engine serves every worker
+    thread; intra_op_threads bounds how many cores a single run may use.
+    mode is one of MATTING_MODES.
+    """
+
+    def __init__(self, model_name: str = "u2net", model_path: Optional[str] = None,
+                 intra_op_threads: int = 0, inter_op_threads: int = 0,
+                 optimization_level: str = "all", batch_size: int = 4,
+                 cache_dir: Optional[str] = ONNX_CACHE_DIR, providers: Optional[List[str]] = None,
+                 mode: str = "full", lowres_side: Optional[int] = None):
+        if model_name not in U2NET_FAMILY:
+            raise ValueError(f"Unsupported matting model '{model_name}'; expected one of {sorted(U2NET_FAMILY)}")
+        if optimization_level not in _OPT_LEVELS:
+            raise ValueError(f"Unknown optimization level '{optimization_level}'")
+        if mode not in MATTING_MODES:
+            raise ValueError(f"Unknown matting mode '{mode}'; expected one of {MATTING_MODES}")
+        import onnxruntime as ort
+
+        self.model_name = model_name
+        self.batch_size = max(1, int(batch_size))
+        self.intra_op_threads = int(intra_op_threads)
+        self.inter_op_threads = int(inter_op_threads)
+        self.optimization_level = optimization_level
+        self.mode = mode
+        self.lowres_side = int(lowres_side or lowres_side_for(model_name))
+        model_path = model_path or rembg_model_path(model_name)
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = self.intra_op_threads  # 0 lets ORT use every core
+        opts.inter_op_num_threads = self.inter_op_threads
+        if self.inter_op_threads > 1:
+            opts.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+
+        # Reuse a previously optimised graph instead of re-running the optimiser
+        cached = None
+        if cache_dir and optimization_level != "disable":
+            os.makedirs(cache_dir, exist_ok=True)
+            # Keyed on the source file too, so a replaced model is re-optimised
+            stat = os.stat(model_path)
+            cached = os.path.join(cache_dir, f"{model_name}.{optimization_level}.{stat.st_size:x}-{int(stat.st_mtime):x}.onnx")
+        if cached and os.path.exists(cached):
+            opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            load_path = cached
+            self.optimized_from_cache = True
+        else:
+            opts.graph_optimization_level = getattr(ort.GraphOptimizationLevel, _OPT_LEVELS[optimization_level])
+            if cached:
+                opts.optimized_model_filepath = cached
+            load_path = model_path
+            self.optimized_from_cache = False
+
+        self.session = ort.InferenceSession(load_path, sess_options=opts,
+                                            providers=providers or ort.get_available_providers())
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # A symbolic or missing leading dimension means the graph accepts batches
+        self.batched = not isinstance(model_input.shape[0], int) or model_input.shape[0] != 1
+
+    def _preprocess(self, img: Image.Image) -> np.ndarray:
+        im = np.asarray(img.convert("RGB").resize(INPUT_SIZE, Image.LANCZOS), dtype=np.float32)
+        im = im / max(float(im.max()), 1e-6)
+        im = (im - MEAN) / STD
+        return im.transpose(2, 0, 1)
+
+    def _run(self, batch: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: batch})[0][:, 0, :, :]
+
+    def predict_masks(self, images: List[Image.Image]) -> List[Image.Image]:
+        """Alpha mask (mode "L", original size) for each image."""
+        if self.mode == "lowres":
+            small = [downscale(img, self.lowres_side) for img in images]
+            return [refine_mask(mask, img, s) if s is not img else mask
+                    for img, s, mask in zip(images, small, self._predict_masks(small))]
+        return self._predict_masks(images)
+
+    def _predict_masks(self, images: List[Image.Image]) -> List[Image.Image]:
+        tensors = [self._preprocess(img) for img in images]
+        preds = []
+        for start in range(0, len(tensors), self.batch_size):
+            chunk = np.stack(tensors[start:start + self.batch_size]).astype(np.float32)
+            if self.batched and len(chunk) > 1:
+                try:
+                    preds.extend(self._run(chunk))
+                    continue
+                except Exception as e:
+                    print(f"⚠️ Batched matting failed ({e}); falling back to one image per run")
+                    self.batched = False
+            preds.extend(self._run(t[None])[0] for t in chunk)
+
+        masks = []
+        for img, pred in zip(images, preds):
+            lo, hi = float(pred.min()), float(pred.max())
+            pred = (pred - lo) / (hi - lo) if hi > lo else np.zeros_like(pred)
+            mask = Image.fromarray((pred * 255).astype(np.uint8), mode="L")
+            masks.append(mask.resize(img.size, Image.LANCZOS))
+        return masks
+
+    def remove_batch(self, images: List[Image.Image]) -> List[Image.Image]:
+        """Background-removed RGBA cutouts, equivalent to rembg.remove() per image."""
+        cutouts = []
+        for img, mask in zip(images, self.predict_masks(images)):
+            empty = Image.new("RGBA", img.size, 0)
+            cutouts.append(Image.composite(img.convert("RGBA"), empty, mask))
+        return cutouts
+
+    def remove(self, img: Image.Image) -> Image.Image:
+        return self.remove_batch([img])[0]
+
+
+def engine_from_env(model_name: str = "u2net") -> MattingEngine:
+    """MattingEngine configured from the VTRY_MATTING_* environment variables."""
+    return MattingEngine(
+        model_name,
+        intra_op_threads=int(os.getenv("VTRY_MATTING_INTRA_THREADS", "0")),
+        inter_op_threads=int(os.getenv("VTRY_MATTING_INTER_THREADS", "0")),
+        optimization_level=os.getenv("VTRY_MATTING_OPT_LEVEL", "all"),
+        batch_size=int(os.getenv("VTRY_MATTING_BATCH", "4")),
+        mode=MATTING_MODE,
+    )
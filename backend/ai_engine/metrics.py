@@ -0,0 +1,62 @@
+# backend/ai_engine/metrics.py
+"""
+Process-wide counters and timing histograms for the try-on engine.
+
+Kept deliberately tiny: values live in memory and are exposed through the
+/debug/metrics route.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float):
+        """Record one duration (in seconds) under name."""
+        with self._lock:
+            t = self._timings.get(name)
+            if t is None:
+                t = self._timings[name] = {"count": 0, "total": 0.0, "max": 0.0}
+            t["count"] += 1
+            t["total"] += seconds
+            if seconds > t["max"]:
+                t["max"] = seconds
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            timings = {
+                name: {
+                    "count": t["count"],
+                    "total_seconds": round(t["total"], 6),
+                    "mean_seconds": round(t["total"] / t["count"], 6) if t["count"] else 0.0,
+                    "max_seconds": round(t["max"], 6),
+                }
+                for name, t in self._timings.items()
+            }
+            return {"counters": dict(self._counters), "timings": timings}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+
+
+metrics = Metrics()
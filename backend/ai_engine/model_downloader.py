@@ -5,8 +5,6 @@ import requests
 MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "models")
 VITON_DIR = os.path.join(MODEL_DIR, "viton")
 
-from huggingface_hub import hf_hub_download
-
 # Model paths - Using ACGPN models and pose estimation
 MODEL_FILES = {
     "gen_latest.pth": {
@@ -171,6 +169,7 @@ def ensure_model():
                     
         # Try Hugging Face download
         try:
+            from huggingface_hub import hf_hub_download
             print(f"⚠️ Trying Hugging Face download...")
             downloaded_path = hf_hub_download(
                 repo_id=info["repo_id"],
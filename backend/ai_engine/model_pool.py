@@ -0,0 +1,120 @@
+# backend/ai_engine/model_pool.py
+"""
+Bounded pools of model instances.
+
+MediaPipe graphs and rembg sessions keep per-call state and must not be
+used from several threads at once. A ModelPool hands each worker thread its
+own instance for the duration of a call and grows lazily up to its size, so
+an idle worker still only holds one instance.
+"""
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from .metrics import metrics
+
+# Number of threads running try-on jobs; pools default to one instance per thread.
+WORKER_THREADS = int(os.getenv("VTRY_WORKER_THREADS", str(min(4, os.cpu_count() or 1))))
+POOL_SIZE = int(os.getenv("VTRY_MODEL_POOL_SIZE", str(WORKER_THREADS)))
+
+
+class ModelPool:
+    def __init__(self, name: str, factory: Callable[[], Any], size: int = POOL_SIZE):
+        self.name = name
+        self.size = max(1, int(size))
+        self._factory = factory
+        self._idle = queue.LifoQueue()  # LIFO keeps the warmest instance in use
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._closed = False
+
+    def prime(self):
+        """Create the first instance eagerly so load errors surface immediately."""
+        with self._lock:
+            if self._created:
+                return
+            self._created += 1
+        try:
+            instance = self._factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+        self._idle.put(instance)
+
+    def _acquire(self, timeout: Optional[float]):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        create = False
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"Model pool '{self.name}' is closed")
+            if self._created < self.size:
+                self._created += 1
+                create = True
+        if create:
+            try:
+                return self._factory()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"Timed out waiting for a '{self.name}' instance")
+
+    @contextmanager
+    def checkout(self, timeout: Optional[float] = None):
+        """Borrow an instance for the duration of the with-block."""
+        start = time.perf_counter()
+        instance = self._acquire(timeout)
+        metrics.observe(f"pool_wait_seconds:{self.name}", time.perf_counter() - start)
+        with self._lock:
+            self._in_use += 1
+        try:
+            yield instance
+        finally:
+            with self._lock:
+                self._in_use -= 1
+                closed = self._closed
+            if closed:
+                self._close_instance(instance)
+            else:
+                self._idle.put(instance)
+
+    def _close_instance(self, instance):
+        close = getattr(instance, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception as e:
+                print(f"⚠️ Error closing '{self.name}' instance: {e}")
+
+    def close(self):
+        """Close idle instances now and in-use ones as they are returned."""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                instance = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close_instance(instance)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+            }
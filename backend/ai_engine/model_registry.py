@@ -0,0 +1,269 @@
+# backend/ai_engine/model_registry.py
+"""
+Central registry for every model the try-on engine uses.
+
+Models are registered by name together with a loader function and are only
+constructed the first time somebody asks for them, so importing ai_engine
+(or starting a uvicorn worker) no longer pays for rembg/MediaPipe/VITON-HD.
+
+Models that are not safe to call from several threads at once are
+registered with a pool size; callers borrow an instance with
+registry.checkout(name) instead of sharing a single one.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from .model_pool import POOL_SIZE, ModelPool
+
+
+def _rss_bytes() -> Optional[int]:
+    """Resident set size of the current process, or None if unavailable."""
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class _ModelEntry:
+    def __init__(self, name: str, loader: Callable[[], Any], description: str = "",
+                 pool_size: Optional[int] = None):
+        self.name = name
+        self.loader = loader
+        self.description = description
+        self.pool_size = pool_size
+        self.lock = threading.Lock()
+        self.instance = None
+        self.pool: Optional[ModelPool] = None
+        self.instances = 0
+        self.loaded = False
+        self.loaded_at = None
+        self.load_seconds = None
+        self.rss_delta = None
+        self.error = None
+
+
+class ModelRegistry:
+    """
+    Lazily loads and owns model instances.
+
+    Each model has its own lock so loading one model never blocks requests
+    that only need another. The reported memory is the process RSS growth
+    observed while the loader ran (summed over pooled instances), which is
+    an approximation when several models load concurrently.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, _ModelEntry] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable[[], Any], description: str = "",
+                 pool_size: Optional[int] = None):
+        """
+        Register a loader under name. Re-registering replaces an unloaded entry.
+
+        With pool_size set, up to that many instances are created on demand
+        and handed out one thread at a time through checkout().
+        """
+        with self._lock:
+            existing = self._entries.get(name)
+            if existing is not None and existing.loaded:
+                raise RuntimeError(f"Model '{name}' is already loaded and cannot be re-registered")
+            self._entries[name] = _ModelEntry(name, loader, description, pool_size)
+
+    def _entry(self, name: str) -> _ModelEntry:
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f"Unknown model: {name}")
+        return entry
+
+    def _create_instance(self, entry: _ModelEntry) -> Any:
+        print(f"📦 Loading model '{entry.name}'...")
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        try:
+            instance = entry.loader()
+        except Exception as e:
+            entry.error = str(e)
+            print(f"❌ Failed to load model '{entry.name}': {e}")
+            raise
+        rss_after = _rss_bytes()
+
+        seconds = time.perf_counter() - start
+        if entry.load_seconds is None:
+            entry.load_seconds = seconds
+        if rss_before is not None and rss_after is not None:
+            entry.rss_delta = (entry.rss_delta or 0) + (rss_after - rss_before)
+        entry.instances += 1
+        entry.error = None
+        print(f"✅ Loaded model '{entry.name}' in {seconds:.2f}s")
+        return instance
+
+    def load(self, name: str):
+        """Load the model (the first pool instance for pooled models) if needed."""
+        entry = self._entry(name)
+        if entry.loaded:
+            return
+
+        with entry.lock:
+            if entry.loaded:
+                return
+            if entry.pool_size:
+                pool = ModelPool(name, lambda: self._create_instance(entry), entry.pool_size)
+                pool.prime()
+                entry.pool = pool
+            else:
+                entry.instance = self._create_instance(entry)
+            entry.loaded = True
+            entry.loaded_at = time.time()
+
+    def get(self, name: str) -> Any:
+        """Return the shared model instance, loading it on first use."""
+        entry = self._entry(name)
+        if entry.pool_size:
+            raise TypeError(f"Model '{name}' is pooled; use registry.checkout('{name}')")
+        self.load(name)
+        return entry.instance
+
+    @contextmanager
+    def checkout(self, name: str, timeout: Optional[float] = None):
+        """
+        Borrow an instance for the duration of the with-block.
+
+        Pooled models give each caller its own instance; unpooled models
+        yield their single shared instance.
+        """
+        entry = self._entry(name)
+        self.load(name)
+        if entry.pool is None:
+            yield entry.instance
+            return
+        with entry.pool.checkout(timeout) as instance:
+            yield instance
+
+    def is_loaded(self, name: str) -> bool:
+        return self._entry(name).loaded
+
+    def unload(self, name: str):
+        """Drop a loaded model, closing it first if it supports close()."""
+        entry = self._entry(name)
+        with entry.lock:
+            if not entry.loaded:
+                return
+            instance, pool = entry.instance, entry.pool
+            entry.instance = None
+            entry.pool = None
+            entry.loaded = False
+            entry.loaded_at = None
+            entry.load_seconds = None
+            entry.rss_delta = None
+            entry.instances = 0
+        if pool is not None:
+            pool.close()
+            return
+        close = getattr(instance, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception as e:
+                print(f"⚠️ Error closing model '{name}': {e}")
+
+    def close_all(self):
+        """Unload every model; called on application shutdown."""
+        for name in self.names():
+            try:
+                self.unload(name)
+            except Exception as e:
+                print(f"⚠️ Error unloading model '{name}': {e}")
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._entries.keys())
+
+    def status(self) -> List[Dict[str, Any]]:
+        """Report every registered model, whether it is loaded and what it cost."""
+        report = []
+        for name in self.names():
+            entry = self._entry(name)
+            report.append({
+                "name": name,
+                "description": entry.description,
+                "loaded": entry.loaded,
+                "loaded_at": entry.loaded_at,
+                "load_seconds": entry.load_seconds,
+                "memory_mb": round(entry.rss_delta / (1024 * 1024), 1) if entry.rss_delta is not None else None,
+                "instances": entry.instances,
+                "pool": entry.pool.stats() if entry.pool is not None else None,
+                "error": entry.error,
+            })
+        return report
+
+
+# --- Default model loaders ---
+
+def _load_rembg_cloth_seg():
+    from rembg import new_session
+    return new_session("u2net_cloth_seg")
+
+
+def _load_rembg_u2net():
+    from rembg import new_session
+    return new_session("u2net")
+
+
+def _load_mediapipe_holistic():
+    import mediapipe as mp
+    return mp.solutions.holistic.Holistic(
+        static_image_mode=True, model_complexity=1, enable_segmentation=False
+    )
+
+
+def _load_mediapipe_pose_segmentation():
+    import mediapipe as mp
+    return mp.solutions.pose.Pose(
+        static_image_mode=True,
+        model_complexity=2,
+        enable_segmentation=True,
+        min_detection_confidence=0.5
+    )
+
+
+def _load_mediapipe_selfie_segmentation():
+    import mediapipe as mp
+    return mp.solutions.selfie_segmentation.SelfieSegmentation(model_selection=1)
+
+
+def _load_matting_u2net():
+    from .matting import engine_from_env
+    return engine_from_env("u2net")
+
+
+def _load_viton_hd():
+    from .viton_hd import VITONHD
+    model = VITONHD()
+    model.load_models()
+    return model
+
+
+registry = ModelRegistry()
+registry.register("rembg_u2net_cloth_seg", _load_rembg_cloth_seg, "rembg u2net_cloth_seg session (garment segmentation)", POOL_SIZE)
+registry.register("rembg_u2net", _load_rembg_u2net, "rembg u2net session (generic background removal)", POOL_SIZE)
+registry.register("mediapipe_holistic", _load_mediapipe_holistic, "MediaPipe Holistic, model_complexity=1", POOL_SIZE)
+registry.register("mediapipe_pose_segmentation", _load_mediapipe_pose_segmentation, "MediaPipe Pose with segmentation, model_complexity=2", POOL_SIZE)
+registry.register("mediapipe_selfie_segmentation", _load_mediapipe_selfie_segmentation, "MediaPipe SelfieSegmentation, model_selection=1", POOL_SIZE)
+registry.register("matting_u2net", _load_matting_u2net, "Batched u2net matting engine on a tuned ONNX Runtime session")
+registry.register("viton_hd", _load_viton_hd, "VITON-HD generator, segmentation and warping weights")
+
+
+def get_model(name: str) -> Any:
+    """Shortcut for registry.get(name)."""
+    return registry.get(name)
@@ -0,0 +1,45 @@
+# backend/ai_engine/person_analysis.py
+"""
+Single-pass person analysis.
+
+person_pose (Holistic), segmentation.ClothSegmentation (Pose with
+segmentation) and human_parsing (SelfieSegmentation) each run their own
+MediaPipe graph over the same photo. analyze_person() runs one Pose
+inference with segmentation enabled and derives all of their outputs from it.
+"""
+from typing import Any, Dict
+
+import numpy as np
+
+from .human_parsing import person_mask_from_probabilities
+from .model_registry import registry
+from .person_pose import keypoints_from_landmarks
+from .segmentation import upper_body_clothing_mask
+
+
+def analyze_person(img_rgb: np.ndarray, person_thresh: float = 0.6) -> Dict[str, Any]:
+    """
+    img_rgb: HxWx3 uint8 RGB array (already decoded)
+    Returns:
+      {
+        "pose": dict in the infer_keypoints_rgb() format (kps, conf, index_map, size),
+        "person_mask": HxW uint8 (0/255) or None,
+        "clothing_mask": HxW uint8 (0/255) or None,
+        "body_bbox": (x_min, y_min, x_max, y_max) or None
+      }
+    Masks are None when no person was detected.
+    """
+    h, w = img_rgb.shape[:2]
+
+    with registry.checkout("mediapipe_pose_segmentation") as pose:
+        res = pose.process(img_rgb)
+
+    seg = res.segmentation_mask if res.pose_landmarks else None
+    clothing_mask, body_bbox = upper_body_clothing_mask(res.pose_landmarks, seg)
+
+    return {
+        "pose": keypoints_from_landmarks(w, h, res.pose_landmarks),
+        "person_mask": person_mask_from_probabilities(seg, person_thresh) if seg is not None else None,
+        "clothing_mask": clothing_mask,
+        "body_bbox": body_bbox,
+    }
@@ -1,20 +1,16 @@
 # backend/ai_engine/person_pose.py
 import cv2, numpy as np
 from typing import Dict, Any
-import mediapipe as mp
-
-_mp_holistic = None
-
-def _load_holistic():
-    global _mp_holistic
-    if _mp_holistic is None:
-        _mp_holistic = mp.solutions.holistic.Holistic(
-            static_image_mode=True, model_complexity=1, enable_segmentation=False
-        )
-    return _mp_holistic
+from .model_registry import registry
+from .image_utils import read_rgb
 
 def infer_keypoints(img_path: str) -> Dict[str, Any]:
+    """Path wrapper around infer_keypoints_rgb()."""
+    return infer_keypoints_rgb(read_rgb(img_path))
+
+def infer_keypoints_rgb(img_rgb: np.ndarray) -> Dict[str, Any]:
     """
+    img_rgb: HxWx3 uint8 RGB array (already decoded)
     Returns:
       {
         "kps": np.ndarray (N,2)  in pixel coords (N >= 75),
@@ -22,15 +18,20 @@ def infer_keypoints(img_path: str) -> Dict[str, Any]:
         "index_map": dict  # name -> index for common joints
       }
     """
-    img_bgr = cv2.imread(img_path)
-    if img_bgr is None:
-        raise RuntimeError(f"cannot read image: {img_path}")
-    h, w = img_bgr.shape[:2]
-    img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
+    h, w = img_rgb.shape[:2]
 
-    holistic = _load_holistic()
-    res = holistic.process(img_rgb)
+    # Holistic graphs are not thread-safe; borrow one from the pool per call.
+    with registry.checkout("mediapipe_holistic") as holistic:
+        res = holistic.process(img_rgb)
 
+    return keypoints_from_landmarks(w, h, res.pose_landmarks, res.left_hand_landmarks, res.right_hand_landmarks)
+
+def keypoints_from_landmarks(w: int, h: int, pose_landmarks, left_hand_landmarks=None,
+                             right_hand_landmarks=None) -> Dict[str, Any]:
+    """
+    Build the infer_keypoints_rgb() result from MediaPipe landmark lists, so any
+    graph that produces pose landmarks (Holistic or Pose) can feed the fitter.
+    """
     kps = []
     conf = []
     index_map = {}
@@ -59,9 +60,9 @@ def infer_keypoints(img_path: str) -> Dict[str, Any]:
             for name, pid in names.items():
                 index_map[name] = start + pid
 
-    _add_landmarks(res.pose_landmarks, "pose")
-    _add_landmarks(res.left_hand_landmarks, "lh")
-    _add_landmarks(res.right_hand_landmarks, "rh")
+    _add_landmarks(pose_landmarks, "pose")
+    _add_landmarks(left_hand_landmarks, "lh")
+    _add_landmarks(right_hand_landmarks, "rh")
 
     kps = np.array(kps, dtype=np.float32) if kps else np.zeros((0,2), np.float32)
     conf = np.array(conf, dtype=np.float32) if conf else np.zeros((0,), np.float32)
@@ -0,0 +1,158 @@
+# backend/ai_engine/result_encoder.py
+"""
+Result encoding stage.
+
+A finished try-on image is converted once to a single BGR buffer, and every
+output a client asked for is encoded from it (a downscaled preview shares
+one resize) on a small dedicated thread pool, so encoding several formats
+costs about as long as the slowest one. submit_result() returns the
+futures without waiting, so a try-on worker can hand the encode off and
+free its model slot. cv2.imencode releases the GIL and is faster than PIL
+for WebP.
+
+Outputs are named: "webp", "jpeg" and "png" are full size, "preview" is
+a WebP whose long side is PREVIEW_SIZE. Each encoded output is a dict
+with media_type, data (bytes), width, height, bytes and encode_ms.
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Optional
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Media types the result endpoint can serve, in server preference order
+RESULT_FORMATS = {"image/webp": ".webp", "image/jpeg": ".jpg", "image/png": ".png"}
+
+# output name -> (media type, long side in px or None for full size)
+PREVIEW_SIZE = int(os.getenv("VTRY_PREVIEW_SIZE", "256"))
+OUTPUTS = {
+    "webp": ("image/webp", None),
+    "jpeg": ("image/jpeg", None),
+    "png": ("image/png", None),
+    "preview": ("image/webp", PREVIEW_SIZE),
+}
+
+DEFAULT_OUTPUTS = tuple(name.strip() for name in os.getenv("VTRY_RESULT_OUTPUTS", "webp,preview").split(",") if name.strip())
+RESULT_QUALITY = int(os.getenv("VTRY_RESULT_QUALITY", "85"))
+PNG_COMPRESSION = int(os.getenv("VTRY_PNG_COMPRESSION", "6"))
+ENCODE_THREADS = int(os.getenv("VTRY_ENCODE_THREADS", "2"))
+
+
+def resolve_outputs(outputs: Optional[Iterable[str]] = None) -> tuple:
+    """Output names to encode; None gives VTRY_RESULT_OUTPUTS. Raises ValueError for unknown names."""
+    names = DEFAULT_OUTPUTS if outputs is None else outputs
+    if isinstance(names, str):
+        names = names.split(",")
+    names = tuple(dict.fromkeys(name.strip().lower() for name in names if name.strip()))
+    unknown = [name for name in names if name not in OUTPUTS]
+    if unknown or not names:
+        raise ValueError(f"Unknown result output(s) {unknown or names!r}; expected some of {', '.join(OUTPUTS)}")
+    return names
+
+
+_encode_pool = None
+_encode_pool_lock = threading.Lock()
+
+
+def get_encode_pool() -> ThreadPoolExecutor:
+    """Process-wide encode pool (VTRY_ENCODE_THREADS threads)."""
+    global _encode_pool
+    if _encode_pool is None:
+        with _encode_pool_lock:
+            if _encode_pool is None:
+                _encode_pool = ThreadPoolExecutor(max_workers=ENCODE_THREADS, thread_name_prefix="encode")
+    return _encode_pool
+
+
+def shutdown():
+    global _encode_pool
+    with _encode_pool_lock:
+        if _encode_pool is not None:
+            _encode_pool.shutdown(wait=False)
+            _encode_pool = None
+
+
+def _to_bgr(img) -> np.ndarray:
+    """Contiguous HxWx3 BGR uint8 from a PIL image or an RGB/RGBA array."""
+    arr = np.asarray(img.convert("RGB") if isinstance(img, Image.Image) and img.mode != "RGB" else img)
+    if arr.ndim == 2:
+        return cv2.cvtColor(arr, cv2.COLOR_GRAY2BGR)
+    return cv2.cvtColor(arr, cv2.COLOR_RGBA2BGR if arr.shape[2] == 4 else cv2.COLOR_RGB2BGR)
+
+
+def _imencode(bgr: np.ndarray, media_type: str, quality: int) -> bytes:
+    ext = RESULT_FORMATS[media_type]
+    if ext == ".webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+    elif ext == ".jpg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    else:
+        params = [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION]
+    ok, buf = cv2.imencode(ext, bgr, params)
+    if not ok:
+        raise RuntimeError(f"Could not encode {media_type}")
+    return buf.tobytes()
+
+
+def _encode_one(bgr: np.ndarray, media_type: str, quality: int) -> Dict[str, Any]:
+    start = time.perf_counter()
+    data = _imencode(bgr, media_type, quality)
+    return {
+        "media_type": media_type,
+        "data": data,
+        "width": bgr.shape[1],
+        "height": bgr.shape[0],
+        "bytes": len(data),
+        "encode_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+
+def encode_image(img, media_type: str = "image/png", quality: Optional[int] = None) -> bytes:
+    """One full-size encode of img as a RESULT_FORMATS media type, on the calling thread."""
+    return _imencode(_to_bgr(img), media_type, RESULT_QUALITY if quality is None else quality)
+
+
+def submit_result(img, outputs: Optional[Iterable[str]] = None,
+                  quality: Optional[int] = None) -> Dict[str, Future]:
+    """
+    Start encoding img (PIL image or RGB/RGBA array) to each named output on
+    the encode pool and return at once: output name -> Future of the encoded
+    output. quality (default VTRY_RESULT_QUALITY) applies to WebP and JPEG.
+    """
+    names = resolve_outputs(outputs)
+    quality = RESULT_QUALITY if quality is None else int(quality)
+    bgr = _to_bgr(img)
+    h, w = bgr.shape[:2]
+    scaled = {}
+    for name in names:
+        size = OUTPUTS[name][1]
+        if size and max(h, w) > size and size not in scaled:
+            scale = size / max(h, w)
+            scaled[size] = cv2.resize(bgr, (max(1, round(w * scale)), max(1, round(h * scale))),
+                                      interpolation=cv2.INTER_AREA)
+
+    pool = get_encode_pool()
+    futures = {}
+    for name in names:
+        media_type, size = OUTPUTS[name]
+        futures[name] = pool.submit(_encode_one, scaled.get(size, bgr), media_type, quality)
+    return futures
+
+
+def encode_result(img, outputs: Optional[Iterable[str]] = None,
+                  quality: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    submit_result() and wait for all of its outputs.
+
+    Do not call from an encode pool thread.
+    """
+    return {name: future.result() for name, future in submit_result(img, outputs, quality).items()}
+
+
+def encode_report(encoded: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """encode_result() output without the image bytes, for logs and job records."""
+    return {name: {k: v for k, v in out.items() if k != "data"} for name, out in encoded.items()}
@@ -1,90 +1,185 @@
+import os
+import threading
+
 import cv2
 import numpy as np
-import mediapipe as mp
+from .image_utils import read_rgb
+from .model_registry import registry
+
+# Inpainting cost grows with the masked area, so it runs on the smallest
+# region that can contain the clothing and, if that region is still larger
+# than the budget, on a pyramid level below it.
+INPAINT_MAX_PIXELS = int(os.getenv("VTRY_INPAINT_MAX_PIXELS", str(512 * 512)))
+INPAINT_MIN_LEVEL = int(os.getenv("VTRY_INPAINT_PYRAMID_LEVEL", "0"))
+INPAINT_RADIUS = 3
+
+
+def upper_body_clothing_mask(pose_landmarks, segmentation_mask) -> tuple:
+    """
+    Clothing mask and padded upper-body bbox from MediaPipe Pose outputs.
+
+    Returns:
+        tuple: (clothing_mask, upper_body_bbox), or (None, None) when the pose
+        or the segmentation mask is missing
+    """
+    if not pose_landmarks:
+        print("⚠️ No pose landmarks detected")
+        return None, None
+    
+    # Get person segmentation mask
+    if segmentation_mask is None:
+        print("⚠️ No segmentation mask available")
+        return None, None
+    h, w = segmentation_mask.shape[:2]
+    
+    # Convert mask to binary
+    person_mask = (segmentation_mask > 0.5).astype(np.uint8) * 255
+        
+    # Extract upper body landmarks for clothing region
+    landmarks = pose_landmarks.landmark
+    
+    # Get upper body bounding box
+    upper_body_points = []
+    for idx in [11, 12, 23, 24]:  # shoulders and hips
+        point = landmarks[idx]
+        x, y = int(point.x * w), int(point.y * h)
+        upper_body_points.append((x, y))
+        
+    # Calculate bounding box
+    upper_body_points = np.array(upper_body_points)
+    x_min, y_min = np.min(upper_body_points, axis=0)
+    x_max, y_max = np.max(upper_body_points, axis=0)
+    
+    # Add padding
+    padding = int(0.1 * (x_max - x_min))  # 10% padding
+    x_min = max(0, x_min - padding)
+    x_max = min(w, x_max + padding)
+    y_min = max(0, y_min - padding)
+    y_max = min(h, y_max + padding)
+    
+    upper_body_bbox = (x_min, y_min, x_max, y_max)
+    
+    # Refine clothing mask using pose information
+    clothing_mask = person_mask.copy()
+    clothing_mask[:y_min, :] = 0  # Remove above upper body
+    clothing_mask[y_max:, :] = 0  # Remove below upper body
+    
+    return clothing_mask, upper_body_bbox
+
 
 class ClothSegmentation:
-    def __init__(self):
-        # Initialize MediaPipe
-        self.mp_pose = mp.solutions.pose
-        self.pose = self.mp_pose.Pose(
-            static_image_mode=True,
-            model_complexity=2,
-            enable_segmentation=True,
-            min_detection_confidence=0.5
-        )
+    """
+    Clothing segmentation on top of the pooled MediaPipe Pose graphs.
+
+    The segmenter no longer owns a Pose graph: each call borrows one from the
+    model registry, so a single long-lived instance (get_cloth_segmenter())
+    can serve every request and thread. Pass pose= to use a dedicated graph
+    instead; it is closed by close() / on leaving a with-block.
+    """
+
+    def __init__(self, pose=None):
+        self.pose = pose
+
+    def close(self):
+        if self.pose is not None:
+            self.pose.close()
+            self.pose = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
     
     def segment_clothing(self, image_path: str) -> tuple:
+        """Path wrapper around segment_clothing_rgb()."""
+        return self.segment_clothing_rgb(read_rgb(image_path))
+
+    def segment_clothing_rgb(self, rgb: np.ndarray) -> tuple:
         """
         Segments the clothing region using MediaPipe Pose.
         
+        Args:
+            rgb: HxWx3 uint8 RGB array (already decoded)
         Returns:
             tuple: (clothing_mask, upper_body_bbox)
         """
-        # Read and process image
-        img = cv2.imread(image_path)
-        rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        h, w = img.shape[:2]
-        
         # Process image with MediaPipe Pose
-        results_pose = self.pose.process(rgb)
-        
-        if not results_pose.pose_landmarks:
-            print("⚠️ No pose landmarks detected")
-            return None, None
-        
-        # Get person segmentation mask
-        mask = results_pose.segmentation_mask
-        if mask is None:
-            print("⚠️ No segmentation mask available")
-            return None, None
-        
-        # Convert mask to binary
-        person_mask = (mask > 0.5).astype(np.uint8) * 255
-            
-        # Extract upper body landmarks for clothing region
-        landmarks = results_pose.pose_landmarks.landmark
+        if self.pose is not None:
+            results_pose = self.pose.process(rgb)
+        else:
+            with registry.checkout("mediapipe_pose_segmentation") as pose:
+                results_pose = pose.process(rgb)
         
-        # Get upper body bounding box
-        upper_body_points = []
-        for idx in [11, 12, 23, 24]:  # shoulders and hips
-            point = landmarks[idx]
-            x, y = int(point.x * w), int(point.y * h)
-            upper_body_points.append((x, y))
-            
-        # Calculate bounding box
-        upper_body_points = np.array(upper_body_points)
-        x_min, y_min = np.min(upper_body_points, axis=0)
-        x_max, y_max = np.max(upper_body_points, axis=0)
-        
-        # Add padding
-        padding = int(0.1 * (x_max - x_min))  # 10% padding
-        x_min = max(0, x_min - padding)
-        x_max = min(w, x_max + padding)
-        y_min = max(0, y_min - padding)
-        y_max = min(h, y_max + padding)
-        
-        upper_body_bbox = (x_min, y_min, x_max, y_max)
-        
-        # Refine clothing mask using pose information
-        clothing_mask = person_mask.copy()
-        clothing_mask[:y_min, :] = 0  # Remove above upper body
-        clothing_mask[y_max:, :] = 0  # Remove below upper body
-        
-        return clothing_mask, upper_body_bbox
+        return upper_body_clothing_mask(results_pose.pose_landmarks, results_pose.segmentation_mask)
 
-    def remove_existing_clothing(self, image: np.ndarray, clothing_mask: np.ndarray) -> np.ndarray:
+    def remove_existing_clothing(self, image: np.ndarray, clothing_mask: np.ndarray,
+                                 upper_body_bbox: tuple = None, max_pixels: int = None,
+                                 min_level: int = None) -> np.ndarray:
         """
         Removes the existing clothing from the image using the clothing mask.
         Uses inpainting to fill the removed region naturally.
+
+        Only the padded upper_body_bbox (or the mask's bounding box) is
+        inpainted. The crop is pyrDown-ed at least min_level times and until
+        it fits in max_pixels, and the result is upsampled and written back
+        under the mask only, so pixels outside it stay untouched.
         """
-        # Create a copy of the image
-        result = image.copy()
+        max_pixels = INPAINT_MAX_PIXELS if max_pixels is None else max_pixels
+        min_level = INPAINT_MIN_LEVEL if min_level is None else min_level
+        h, w = image.shape[:2]
         
         # Dilate the mask slightly to ensure complete removal
         kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3,3))
         dilated_mask = cv2.dilate(clothing_mask, kernel, iterations=2)
         
+        # Restrict to the region that can contain clothing, with enough margin
+        # around it for the inpainting to sample known pixels
+        if upper_body_bbox is not None:
+            x_min, y_min, x_max, y_max = (int(v) for v in upper_body_bbox)
+            dilated_mask[:max(0, y_min), :] = 0
+            dilated_mask[min(h, y_max):, :] = 0
+            dilated_mask[:, :max(0, x_min)] = 0
+            dilated_mask[:, min(w, x_max):] = 0
+        x, y, bw, bh = cv2.boundingRect(dilated_mask)
+        if bw == 0 or bh == 0:
+            return image.copy()
+        margin = 4 * INPAINT_RADIUS + int(0.05 * max(bw, bh))
+        x0, y0 = max(0, x - margin), max(0, y - margin)
+        x1, y1 = min(w, x + bw + margin), min(h, y + bh + margin)
+        
+        roi = image[y0:y1, x0:x1]
+        roi_mask = dilated_mask[y0:y1, x0:x1]
+        
+        # Descend the pyramid until the crop fits the pixel budget
+        small, small_mask, level = roi, roi_mask, 0
+        while level < min_level or (small.shape[0] * small.shape[1] > max_pixels and min(small.shape[:2]) > 32):
+            small = cv2.pyrDown(small)
+            small_mask = cv2.resize(small_mask, (small.shape[1], small.shape[0]), interpolation=cv2.INTER_NEAREST)
+            level += 1
+        
         # Inpaint the clothing region
-        result = cv2.inpaint(result, dilated_mask, 3, cv2.INPAINT_TELEA)
+        filled = cv2.inpaint(small, small_mask, INPAINT_RADIUS, cv2.INPAINT_TELEA)
+        if level:
+            filled = cv2.resize(filled, (roi.shape[1], roi.shape[0]), interpolation=cv2.INTER_LINEAR)
+        
+        result = image.copy()
+        result_roi = result[y0:y1, x0:x1]
+        np.copyto(result_roi, filled, where=(roi_mask > 0)[:, :, None])
         
-        return result
\ No newline at end of file
+        return result
+
+
+_cloth_segmenter = None
+_cloth_segmenter_lock = threading.Lock()
+
+
+def get_cloth_segmenter() -> ClothSegmentation:
+    """Process-wide ClothSegmentation instance."""
+    global _cloth_segmenter
+    if _cloth_segmenter is None:
+        with _cloth_segmenter_lock:
+            if _cloth_segmenter is None:
+                _cloth_segmenter = ClothSegmentation()
+    return _cloth_segmenter
@@ -4,13 +4,10 @@ import cv2
 import base64
 import numpy as np
 from PIL import Image
-import rembg
-from rembg import remove
-import person_pose
-import fit_polygons
-import warp_mesh
-
-cloth_session = rembg.new_session("u2net_cloth_seg")
+from . import cloth_cleaner
+from . import person_pose
+from . import fit_polygons
+from . import warp_mesh
 
 DEBUG_DIR = "uploads/debug"
 os.makedirs(DEBUG_DIR, exist_ok=True)
@@ -33,36 +30,11 @@ def resize_image_pil(img, max_size=800):
 
 def clean_cloth(cloth_img: Image.Image, cloth_type: str = "shirt") -> Image.Image:
 
-    """Remove background & mannequin."""
+    """Remove background & mannequin (see cloth_cleaner.clean_cloth)."""
     print("🟢 Step 1: Cleaning cloth image...")
-    cloth_img = resize_image_pil(cloth_img, max_size=800)
-
-    try:
-        no_bg = remove(cloth_img, session=cloth_session if cloth_type.lower() == "dress" else None)
-        np_img = np.array(no_bg)
-    except Exception as e:
-        print("⚠ Background removal failed:", e)
-        np_img = np.array(cloth_img)
-
-    save_debug_image(Image.fromarray(np_img), "cloth_clean.png")
-
-    # Remove mannequin skin
-    try:
-        if np_img.shape[2] == 4:
-            bgr = cv2.cvtColor(np_img, cv2.COLOR_RGBA2BGR)
-        else:
-            bgr = np_img
-
-        if cloth_type.lower() != "dress":
-            hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
-            lower_skin = np.array([0, 30, 60], dtype=np.uint8)
-            upper_skin = np.array([25, 255, 255], dtype=np.uint8)
-            mask = cv2.inRange(hsv, lower_skin, upper_skin)
-            np_img[mask > 0] = (0, 0, 0, 0)
-    except Exception as e:
-        print("⚠ Mannequin cleaning failed:", e)
-
-    return Image.fromarray(np_img, "RGBA")
+    cleaned = cloth_cleaner.clean_cloth(cloth_img, cloth_type)
+    save_debug_image(cleaned, "cloth_clean.png")
+    return cleaned
 
 
 def recommend_size(kps, idx_map):
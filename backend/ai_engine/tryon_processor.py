@@ -10,13 +10,12 @@ from requests.adapters import HTTPAdapter
 import urllib3
 
 from PIL import Image, ImageFilter, ImageEnhance, ImageDraw
-from rembg import remove, new_session
 import cv2
 import numpy as np
-from scipy import ndimage
-from sklearn.cluster import KMeans
 
-from ai_engine import warp_mesh, fit_polygons, person_pose, viton_hd
+from ai_engine import (warp_mesh, fit_polygons, person_analysis, image_utils, cache_store, garment_store, cloth_cleaner,
+                       blend_utils, result_encoder)
+from ai_engine.model_registry import registry as model_registry
 
 # --- Setup & Configuration ---
 
@@ -28,58 +27,84 @@ DEBUG_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file_
 print(f"Debug directory: {DEBUG_DIR}")
 os.makedirs(DEBUG_DIR, exist_ok=True)
 
-# Initialize the background removal session for clothing
-try:
-    cloth_session = new_session("u2net_cloth_seg")
-except Exception as e:
-    print(f"Warning: Could not initialize cloth segmentation: {e}")
-    cloth_session = None
+# Persistent caches live next to the debug directory
+CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads", "cache"))
+
+# Per-user-photo analysis cache (pose, masks, inpainted base, measurements).
+# Bump PERSON_ANALYSIS_VERSION whenever the analysis output changes.
+PERSON_ANALYSIS_VERSION = "4"
+person_analysis_cache = cache_store.TieredCache(
+    cache_store.LRUCache(int(os.getenv("VTRY_PERSON_CACHE_ITEMS", "32"))),
+    cache_store.DiskStore(os.path.join(CACHE_DIR, "person"), int(os.getenv("VTRY_PERSON_CACHE_MB", "1024")) * 1024 * 1024)
+    if os.getenv("VTRY_PERSON_CACHE_DISK", "1") != "0" else None,
+)
 
-# Initialize VITON-HD model
-viton_model = viton_hd.get_viton_model()
+# Result encodings for the progressive preview stage of tryon_stages(); a
+# full-size JPEG is the quickest to encode
+PREVIEW_OUTPUTS = os.getenv("VTRY_PREVIEW_OUTPUTS", "jpeg")
 
 
-def process_tryon(user_img_source: str, cloth_img_source: str, cloth_type: str = "shirt"):
+def encode_output(img: Image.Image, outputs=None, quality: int = None, wait: bool = True) -> dict:
+    """
+    Result fields for a finished image, encoded once per output on the
+    result_encoder pool: "outputs" (name -> encoded output with its bytes)
+    and "encodings" (the same without bytes). outputs=None keeps the legacy
+    single PNG as an "output_image_base64" data URL.
+
+    With wait=False (and outputs), "outputs" holds the futures from
+    result_encoder.submit_result() and there are no "encodings" yet.
+    """
+    if not wait and outputs is not None:
+        return {"outputs": result_encoder.submit_result(img, outputs, quality)}
+    encoded = result_encoder.encode_result(img, outputs or ("png",), quality)
+    report = result_encoder.encode_report(encoded)
+    print("🗜 Encoded " + ", ".join(f"{name} {r['bytes'] / 1024:.0f}KB in {r['encode_ms']:.0f}ms"
+                                   for name, r in report.items()))
+    if outputs is None:
+        return {"output_image_base64": "data:image/png;base64," + base64.b64encode(encoded["png"]["data"]).decode()}
+    return {"outputs": encoded, "encodings": report}
+
+
+def process_tryon(user_img_source: str, cloth_img_source: str, cloth_type: str = "shirt",
+                  source_url: str = None, cleaning_backend: str = None, warp_mode: str = None,
+                  blend_mode: str = None, outputs=None, quality: int = None, use_cache: bool = True):
     """
     Process virtual try-on request.
     Args:
         user_img_source: URL or base64 of user image
-        cloth_img_source: URL or base64 of clothing image
+        cloth_img_source: URL or base64 of clothing image (may be None when
+            source_url is already in the garment store)
         cloth_type: Type of clothing ("shirt", "dress", etc.)
+        source_url: Product page the cloth image came from, used as a garment store key
+        cleaning_backend: cloth_cleaner backend name; None picks one by cloth type
+        warp_mode, blend_mode: geometric fallback warp and compositing, see tryon_process()
+        outputs, quality: result encodings, see encode_output()
+        use_cache: False bypasses the garment store and person analysis cache (warm-up)
     Returns:
         dict: Result with processed image or error
     """
     try:
+        warp_mode = warp_mesh.resolve_warp_mode(warp_mode)
+        blend_mode = blend_utils.resolve_blend_mode(blend_mode)
+        if outputs is not None:
+            outputs = result_encoder.resolve_outputs(outputs)
         print(f"\n🔄 Processing try-on request for {cloth_type}")
         print(f"📸 User image source: {user_img_source[:50]}...")
-        print(f"👕 Cloth image source: {cloth_img_source[:50]}...")
+        print(f"👕 Cloth image source: {(cloth_img_source or source_url or '')[:50]}...")
         
         # Get image paths
         print("🔍 Converting image sources to paths...")
         user_path = get_image_path(user_img_source, "user")
-        cloth_path = get_image_path(cloth_img_source, "cloth")
         
         print(f"📁 User image path: {user_path}")
-        print(f"📁 Cloth image path: {cloth_path}")
         
         # Verify paths exist
         if not os.path.exists(user_path):
             print(f"❌ User image not found at: {user_path}")
             raise FileNotFoundError(f"User image not found at: {user_path}")
-            
-        if not os.path.exists(cloth_path):
-            print(f"❌ Cloth image not found at: {cloth_path}")
-            raise FileNotFoundError(f"Cloth image not found at: {cloth_path}")
         
         # Process images
         print("🖼 Opening images...")
-        try:
-            cloth_img = Image.open(cloth_path)
-            print(f"✅ Cloth image opened successfully: {cloth_img.size} {cloth_img.mode}")
-        except Exception as e:
-            print(f"❌ Failed to open cloth image: {e}")
-            raise
-            
         try:
             user_img = Image.open(user_path)
             print(f"✅ User image opened successfully: {user_img.size} {user_img.mode}")
@@ -87,10 +112,12 @@ def process_tryon(user_img_source: str, cloth_img_source: str, cloth_type: str =
             print(f"❌ Failed to open user image: {e}")
             raise
 
-        # Clean cloth image
+        # Clean cloth image (served from the garment store when seen before)
         print("🧹 Cleaning cloth image...")
         try:
-            cleaned_cloth = clean_cloth(cloth_img, cloth_type)
+            garment = load_garment(cloth_img_source, cloth_type, source_url, cleaning_backend=cleaning_backend,
+                                   use_cache=use_cache)
+            cleaned_cloth = Image.fromarray(garment["cloth_rgba"])
             print(f"✅ Cloth image cleaned successfully: {cleaned_cloth.size} {cleaned_cloth.mode}")
             save_debug_image(cleaned_cloth, "cleaned_cloth.png")
             print("✅ Debug image saved: cleaned_cloth.png")
@@ -101,6 +128,7 @@ def process_tryon(user_img_source: str, cloth_img_source: str, cloth_type: str =
         try:
             print("🔄 Attempting VITON-HD processing...")
             # Try VITON-HD first
+            viton_model = model_registry.get("viton_hd")
             result_img = viton_model.process(user_img, cleaned_cloth)
             save_debug_image(result_img, "viton_result.png")
             print("✅ Successfully used VITON-HD")
@@ -114,13 +142,16 @@ def process_tryon(user_img_source: str, cloth_img_source: str, cloth_type: str =
             print("🏃 Starting geometric warping fallback...")
             
             try:
-                # Get user pose and measurements
+                # Get user pose and measurements (cached per user photo)
                 print("👤 Detecting pose keypoints...")
-                pose_info = person_pose.infer_keypoints(user_path)
+                analysis = analyze_person_image(user_img, include_masks=False, use_cache=use_cache)
+                pose_info = analysis["pose"]
+                if not pose_info or analysis["measurements"] is None:
+                    raise RuntimeError("Pose detection failed")
                 print("✅ Pose detection successful")
                 print(f"Found {len(pose_info['kps'])} keypoints")
                 
-                measurements = get_body_measurements(pose_info["kps"], pose_info["index_map"])
+                measurements = analysis["measurements"]
                 print("✅ Body measurements calculated")
                 
                 # Create warping mesh
@@ -130,13 +161,14 @@ def process_tryon(user_img_source: str, cloth_img_source: str, cloth_type: str =
                 
                 # Warp cloth onto user
                 print("👕 Warping cloth onto user...")
-                result_img = warp_mesh.warp_rgba_mesh(
-                    np.array(cleaned_cloth),
-                    src_pts=fit_polygons.get_source_points(cleaned_cloth),
-                    dst_pts=dst_poly,
-                    out_wh=user_img.size
-                )
-                result_img = Image.fromarray(result_img)
+                mesh = garment.get("mesh")
+                if mesh is not None and len(mesh["src_pts"]) == len(dst_poly):
+                    src_pts, triangles = mesh["src_pts"], mesh["triangles"]
+                else:
+                    src_pts, triangles = garment["contour"], None
+                patch, offset = advanced_mesh_warp(cleaned_cloth, src_pts, dst_poly, user_img.size, warp_mode, triangles)
+                result_img = Image.fromarray(blend_utils.blend_garment(
+                    np.array(user_img.convert("RGBA")), patch, offset, mode=blend_mode))
                 print("✅ Cloth warping completed")
                 
             except Exception as fallback_error:
@@ -146,26 +178,11 @@ def process_tryon(user_img_source: str, cloth_img_source: str, cloth_type: str =
                 traceback.print_exc()
                 raise
         
-        # Save result and convert to base64
+        # Encode the result once per requested output
         try:
-            print("💾 Saving result image...")
-            result_path = os.path.join(DEBUG_DIR, "result.png")
-            result_img.save(result_path, "PNG")
-            print(f"✅ Result saved to: {result_path}")
-            
-            print("🔄 Converting result to base64...")
-            # Convert to base64
-            buffered = io.BytesIO()
-            result_img.save(buffered, format="PNG")
-            img_data = base64.b64encode(buffered.getvalue()).decode()
-            output_image_base64 = f"data:image/png;base64,{img_data}"
-            print("✅ Base64 conversion successful")
-
-            # Return a consistent key expected by the routes (output_image_base64)
-            return {
-                "output_image_base64": output_image_base64
-            }
-            
+            print("🔄 Encoding result...")
+            return encode_output(result_img, outputs, quality)
+
         except Exception as save_error:
             print(f"❌ Error saving/converting result: {save_error}")
             raise RuntimeError(f"Failed to process output image: {save_error}")
@@ -294,6 +311,72 @@ def get_image_path(source: str, prefix: str) -> str:
 
 # --- Try-On Core Logic ---
 
+def load_garment(cloth_img_source: str, cloth_type: str = "shirt", source_url: str = None,
+                 preprocess=None, cleaning_backend: str = None, use_cache: bool = True) -> dict:
+    """
+    Cleaned garment asset (see garment_store) for a try-on.
+
+    A product URL already in the store skips the download and cleaning
+    entirely. Otherwise the image is loaded (from cloth_img_source, or
+    source_url when no image was supplied), passed through preprocess and
+    looked up by content hash, and only cleaned if that misses too.
+    Assets are kept per cleaning backend (cleaning_backend, or the cloth
+    type's default). use_cache=False skips the store and the flat-backdrop
+    fast path, so the cleaning model always runs.
+    """
+    store = garment_store.get_garment_store()
+    backend = cloth_cleaner.resolve_backend(cloth_type, cleaning_backend)
+    if source_url and use_cache:
+        asset = store.lookup_url(source_url, cloth_type, backend)
+        if asset is not None:
+            print("⚡ Garment store hit (URL)")
+            return asset
+
+    cloth_path = get_image_path(cloth_img_source or source_url, "cloth")
+    cloth_img = Image.open(cloth_path)
+    print(f"✅ Cloth image opened successfully: {cloth_img.size} {cloth_img.mode}")
+    if preprocess is not None:
+        cloth_img = preprocess(cloth_img)
+    return store.get_or_create(cloth_img, cloth_type, lambda img, t: clean_cloth(img, t, backend, use_cache),
+                               source_url, backend, use_cache)
+
+def load_garments(cloth_img_sources, cloth_types, source_urls=None, cleaning_backend: str = None) -> list:
+    """
+    load_garment() for several garments: store misses are cleaned together
+    with cloth_cleaner.clean_cloth_batch(), so the u2net backend mattes them
+    in MattingEngine batches. Returns one asset per source, or the exception
+    that garment failed with.
+    """
+    store = garment_store.get_garment_store()
+    source_urls = source_urls or [None] * len(cloth_img_sources)
+    results = [None] * len(cloth_img_sources)
+    misses = []
+    for i, (source, cloth_type, url) in enumerate(zip(cloth_img_sources, cloth_types, source_urls)):
+        try:
+            backend = cloth_cleaner.resolve_backend(cloth_type, cleaning_backend)
+            asset = store.lookup_url(url, cloth_type, backend) if url else None
+            if asset is None:
+                cloth_img = Image.open(get_image_path(source or url, "cloth"))
+                cloth_img.load()
+                if store.get(store.content_key(cloth_img, cloth_type, backend)) is None:
+                    misses.append((i, cloth_img, backend))
+                    continue
+                asset = store.get_or_create(cloth_img, cloth_type, lambda img, t: clean_cloth(img, t, backend), url, backend)
+            results[i] = asset
+        except Exception as e:
+            results[i] = e
+
+    if misses:
+        cleaned = cloth_cleaner.clean_cloth_batch([img for _, img, _ in misses], [cloth_types[i] for i, _, _ in misses],
+                                                  cleaning_backend)
+        for (i, cloth_img, backend), clean in zip(misses, cleaned):
+            try:
+                results[i] = store.get_or_create(cloth_img, cloth_types[i], lambda img, t, clean=clean: clean,
+                                                 source_urls[i], backend)
+            except Exception as e:
+                results[i] = e
+    return results
+
 def save_debug_image(img_pil, name):
     """Saves an image to the debug directory."""
     try:
@@ -360,7 +443,11 @@ def resize_image_pil(img, max_size=1024):
     return img
 
 def enhance_cloth_quality(cloth_img: Image.Image) -> Image.Image:
-    """Enhances cloth image quality with improved color and detail preservation."""
+    """
+    Enhances cloth image quality with improved color and detail preservation.
+
+    Reference PIL chain; clean_cloth uses the fused image_utils.enhance_garment().
+    """
     # Convert to RGBA if not already
     if cloth_img.mode != 'RGBA':
         cloth_img = cloth_img.convert('RGBA')
@@ -383,51 +470,13 @@ def enhance_cloth_quality(cloth_img: Image.Image) -> Image.Image:
     
     return cloth_img
 
-def clean_cloth(cloth_img: Image.Image, cloth_type: str = "shirt") -> Image.Image:
-    """Removes background & mannequin from a cloth image with improved precision."""
+def clean_cloth(cloth_img: Image.Image, cloth_type: str = "shirt", backend: str = None,
+                fast_path: bool = True) -> Image.Image:
+    """Removes background & mannequin from a cloth image (see cloth_cleaner.clean_cloth)."""
     print("🟢 Step 1: Cleaning and preparing cloth image...")
-    
-    # Resize while maintaining aspect ratio
-    cloth_img = resize_image_pil(cloth_img, max_size=1024)
-    
-    # Enhance image quality
-    cloth_img = enhance_cloth_quality(cloth_img)
-    
-    # Adjust contrast and brightness for better segmentation
-    enhancer = ImageEnhance.Contrast(cloth_img)
-    cloth_img = enhancer.enhance(1.2)  # Increase contrast
-    enhancer = ImageEnhance.Brightness(cloth_img)
-    cloth_img = enhancer.enhance(1.1)  # Slight brightness boost
-    
-    save_debug_image(cloth_img, "cloth_original.png")
-
-    try:
-        session = cloth_session if cloth_type.lower() in ["dress", "shirt", "top"] else None
-        no_bg = remove(cloth_img, session=session)
-        np_img = np.array(no_bg)
-    except Exception as e:
-        print(f"⚠ Background removal failed: {e}. Using original image.")
-        np_img = np.array(cloth_img.convert('RGBA'))
-
-    if np_img.shape[2] == 3: # Ensure RGBA
-        alpha = np.full((np_img.shape[0], np_img.shape[1], 1), 255, dtype=np_img.dtype)
-        np_img = np.concatenate([np_img, alpha], axis=2)
-
-    save_debug_image(Image.fromarray(np_img), "cloth_after_bg_removal.png")
-
-    # Additional cleaning for better quality
-    try:
-        # Remove skin tones if detected
-        if cloth_type.lower() != "dress":
-            hsv = cv2.cvtColor(np_img[:, :, :3], cv2.COLOR_RGB2HSV)
-            lower_skin = np.array([0, 20, 70], dtype=np.uint8)
-            upper_skin = np.array([20, 255, 255], dtype=np.uint8)
-            skin_mask = cv2.inRange(hsv, lower_skin, upper_skin)
-            np_img[skin_mask > 0] = (0, 0, 0, 0)
-    except Exception as e:
-        print(f"⚠ Skin removal failed: {e}")
-
-    return Image.fromarray(np_img, "RGBA")
+    cleaned = cloth_cleaner.clean_cloth(cloth_img, cloth_type, backend, fast_path)
+    save_debug_image(cleaned, "cloth_after_bg_removal.png")
+    return cleaned
 
 def get_body_measurements(kps, idx_map):
     """Extract body measurements from keypoints with improved accuracy."""
@@ -654,87 +703,268 @@ def improved_overlay(user_img: Image.Image, cloth_img: Image.Image, cloth_type:
         # Return original user image as last resort
         return user_img.convert("RGBA")
 
-def advanced_mesh_warp(src_img, src_poly, dst_poly, out_shape):
-    """Perform advanced mesh warping using the ai_engine."""
+def advanced_mesh_warp(src_img, src_poly, dst_poly, out_wh, warp_mode: str = None, triangles=None):
+    """
+    Perform advanced mesh warping using the ai_engine (warp_mode: see warp_mesh.WARP_MODES).
+    triangles is the garment store's precomputed mesh over src_poly, if any.
+
+    Returns (patch, (x0, y0)): the warped garment over its box on the (W, H)
+    out_wh canvas; see warp_mesh.warp_rgba_patch().
+    """
     try:
-        return warp_mesh.warp_rgba_mesh(np.array(src_img), src_poly, dst_poly, out_shape)
+        patch, offset = warp_mesh.warp_rgba_patch(np.array(src_img), src_poly, dst_poly, out_wh, mode=warp_mode,
+                                                  triangles=triangles)
+        if patch is None:
+            raise ValueError("warped garment does not overlap the photo")
+        return patch, offset
     except Exception as e:
         print(f"❌ Error in advanced_mesh_warp: {e}")
         raise
 
+def _frame_mask(mask: np.ndarray, w: int, h: int) -> np.ndarray:
+    return mask if mask.shape[:2] == (h, w) else cv2.resize(mask, (w, h))
+
+
 def enhanced_blend(user_img: Image.Image, warped: np.ndarray, person_mask: np.ndarray = None, 
-                clothing_mask: np.ndarray = None) -> Image.Image:
-    """Enhanced blending of warped cloth onto user image with realistic integration."""
+                clothing_mask: np.ndarray = None, offset=None) -> Image.Image:
+    """
+    Enhanced blending of warped cloth onto user image with realistic integration.
+
+    warped is either a full-frame RGBA canvas or, with offset=(x0, y0), a
+    garment patch from warp_mesh.warp_rgba_patch(). With a patch, all work is
+    limited to the patch box plus blend_utils.BLEND_PAD and the rest of the
+    photo is left untouched.
+
+    tryon_process uses blend_utils.composite_garment(), the float32 fused
+    version of this; this one is kept as its reference for run_benchmark.py.
+    """
     try:
         print("✨ Applying enhanced blending with clothing replacement...")
-        
-        # Convert to numpy arrays for processing
+        if offset is None:
+            return Image.fromarray(_blend_region(np.array(user_img.convert("RGBA")), warped, person_mask, clothing_mask))
+
         user_np = np.array(user_img.convert("RGBA"))
-        warped_np = warped.astype(np.float32)
-        h, w = user_np.shape[:2]
-        
-        # Create base alpha channel
-        alpha = warped_np[:, :, 3] / 255.0
-        
-        # Enhanced edge processing
-        alpha_blurred = cv2.GaussianBlur(alpha, (3, 3), 0.8)  # Reduced blur for sharper edges
-        
-        # Create detailed edge mask for better transitions
-        edge_detector = cv2.Canny((alpha_blurred * 255).astype(np.uint8), 50, 150)
-        edge_mask = cv2.dilate(edge_detector, np.ones((3, 3), np.uint8), iterations=1)
-        edge_blend = cv2.GaussianBlur(edge_mask.astype(float) / 255.0, (5, 5), 1.0)
-        
-        # Use person segmentation mask to improve blending if available
-        if person_mask is not None:
-            # Scale person mask to match image size
-            person_mask = cv2.resize(person_mask, (user_np.shape[1], user_np.shape[0]))
-            # Use person mask to refine alpha channel
-            alpha_blurred = alpha_blurred * (person_mask / 255.0)
-        
-        # Use clothing mask to ensure proper replacement
-        if clothing_mask is not None:
-            # Scale clothing mask to match image size
-            clothing_mask = cv2.resize(clothing_mask, (user_np.shape[1], user_np.shape[0]))
-            # Create refined mask for clothing region
-            refined_mask = cv2.GaussianBlur(clothing_mask.astype(float) / 255.0, (5, 5), 1.0)
-            # Enhance alpha in clothing region with smooth transition
-            alpha_blurred = cv2.addWeighted(alpha_blurred, 0.7, refined_mask, 0.3, 0)
-        
-        # Apply edge-aware blending
-        edge_mask = cv2.Canny((alpha_blurred * 255).astype(np.uint8), 50, 150)
-        edge_mask = cv2.dilate(edge_mask, np.ones((3, 3), np.uint8), iterations=1)
-        edge_mask_soft = cv2.GaussianBlur(edge_mask.astype(float) / 255.0, (5, 5), 1.0)
-        
-        # Combine all masks for final blending
-        final_alpha = alpha_blurred * (1 - edge_mask_soft * 0.5)
-        
-        # Create the blended image
-        blended = np.zeros_like(user_np, dtype=np.float32)
-        for c in range(3):
-            blended[:, :, c] = (user_np[:, :, c] * (1 - final_alpha) + 
-                               warped_np[:, :, c] * final_alpha)
-        blended[:, :, 3] = (user_np[:, :, 3] * (1 - final_alpha) + 
-                           warped_np[:, :, 3] * final_alpha)
-        
-        return Image.fromarray(blended.astype(np.uint8))
-        
+        H, W = user_np.shape[:2]
+        ph, pw = warped.shape[:2]
+        pad = blend_utils.BLEND_PAD
+        x0, y0 = max(0, offset[0] - pad), max(0, offset[1] - pad)
+        x1, y1 = min(W, offset[0] + pw + pad), min(H, offset[1] + ph + pad)
+        region = np.zeros((y1 - y0, x1 - x0, 4), dtype=np.uint8)
+        px, py = offset[0] - x0, offset[1] - y0
+        region[py:py + ph, px:px + pw] = warped
+        crop = lambda m: _frame_mask(m, W, H)[y0:y1, x0:x1] if m is not None else None
+        user_np[y0:y1, x0:x1] = _blend_region(user_np[y0:y1, x0:x1], region, crop(person_mask), crop(clothing_mask))
+        return Image.fromarray(user_np)
+
     except Exception as e:
         print(f"❌ Error in enhanced_blend: {e}")
         return user_img
 
+
+def _blend_region(user_np: np.ndarray, warped: np.ndarray, person_mask: np.ndarray = None,
+                  clothing_mask: np.ndarray = None) -> np.ndarray:
+    """enhanced_blend() on same-sized RGBA arrays; returns the blended uint8 RGBA."""
+    warped_np = warped.astype(np.float32)
+    h, w = user_np.shape[:2]
+    
+    # Create base alpha channel
+    alpha = warped_np[:, :, 3] / 255.0
+    
+    # Enhanced edge processing
+    alpha_blurred = cv2.GaussianBlur(alpha, (3, 3), 0.8)  # Reduced blur for sharper edges
+    
+    # Create detailed edge mask for better transitions
+    edge_detector = cv2.Canny((alpha_blurred * 255).astype(np.uint8), 50, 150)
+    edge_mask = cv2.dilate(edge_detector, np.ones((3, 3), np.uint8), iterations=1)
+    edge_blend = cv2.GaussianBlur(edge_mask.astype(float) / 255.0, (5, 5), 1.0)
+    
+    # Use person segmentation mask to improve blending if available
+    if person_mask is not None:
+        # Scale person mask to match image size
+        person_mask = cv2.resize(person_mask, (user_np.shape[1], user_np.shape[0]))
+        # Use person mask to refine alpha channel
+        alpha_blurred = alpha_blurred * (person_mask / 255.0)
+    
+    # Use clothing mask to ensure proper replacement
+    if clothing_mask is not None:
+        # Scale clothing mask to match image size
+        clothing_mask = cv2.resize(clothing_mask, (user_np.shape[1], user_np.shape[0]))
+        # Create refined mask for clothing region
+        refined_mask = cv2.GaussianBlur(clothing_mask.astype(float) / 255.0, (5, 5), 1.0)
+        # Enhance alpha in clothing region with smooth transition
+        alpha_blurred = cv2.addWeighted(alpha_blurred, 0.7, refined_mask, 0.3, 0)
+    
+    # Apply edge-aware blending
+    edge_mask = cv2.Canny((alpha_blurred * 255).astype(np.uint8), 50, 150)
+    edge_mask = cv2.dilate(edge_mask, np.ones((3, 3), np.uint8), iterations=1)
+    edge_mask_soft = cv2.GaussianBlur(edge_mask.astype(float) / 255.0, (5, 5), 1.0)
+    
+    # Combine all masks for final blending
+    final_alpha = alpha_blurred * (1 - edge_mask_soft * 0.5)
+    
+    # Create the blended image
+    blended = np.zeros_like(user_np, dtype=np.float32)
+    for c in range(3):
+        blended[:, :, c] = (user_np[:, :, c] * (1 - final_alpha) + 
+                           warped_np[:, :, c] * final_alpha)
+    blended[:, :, 3] = (user_np[:, :, 3] * (1 - final_alpha) + 
+                       warped_np[:, :, 3] * final_alpha)
+    
+    return blended.astype(np.uint8)
+
+# --- Person Analysis ---
+
+def pose_upper_body_bbox(pose: dict, shape) -> tuple:
+    """
+    Padded shoulder-to-hip bbox (x_min, y_min, x_max, y_max) from the pose
+    keypoints, as segmentation.upper_body_clothing_mask() pads it, or None
+    without the four joints.
+    """
+    names = ("left_shoulder", "right_shoulder", "left_hip", "right_hip")
+    if not pose or not all(name in pose.get("index_map", {}) for name in names):
+        return None
+    h, w = shape[:2]
+    points = np.array([pose["kps"][pose["index_map"][name]] for name in names]).astype(int)
+    x_min, y_min = points.min(axis=0)
+    x_max, y_max = points.max(axis=0)
+    padding = int(0.1 * (x_max - x_min))  # 10% padding
+    return (max(0, x_min - padding), max(0, y_min - padding), min(w, x_max + padding), min(h, y_max + padding))
+
+def _segment_user_image(user_rgb: np.ndarray, clothing_mask: np.ndarray, body_bbox, pose: dict = None) -> dict:
+    """
+    Inpainted base image, given the clothing mask from analyze_person().
+
+    Without a clothing mask the whole frame is treated as clothing, and only
+    the pose's upper body (body_bbox, else pose_upper_body_bbox()) is inpainted.
+    """
+    from . import segmentation
+    result = {"clothing_mask": None, "body_bbox": None, "base_rgba": None}
+
+    # Convert to OpenCV format for processing
+    user_cv = cv2.cvtColor(user_rgb, cv2.COLOR_RGB2BGR)
+
+    if clothing_mask is None:
+        print("⚠ Warning: Could not detect clothing region, falling back to basic processing")
+        clothing_mask = np.ones((user_cv.shape[0], user_cv.shape[1]), dtype=np.uint8) * 255
+        if body_bbox is None:
+            body_bbox = pose_upper_body_bbox(pose, user_cv.shape)
+
+        # Remove existing clothing with more robust error handling
+        try:
+            print("🔍 Removing existing clothing...")
+            cloth_segmenter = segmentation.get_cloth_segmenter()
+            user_no_cloth = cloth_segmenter.remove_existing_clothing(user_cv, clothing_mask, body_bbox)
+            result["base_rgba"] = cv2.cvtColor(user_no_cloth, cv2.COLOR_BGR2RGBA)
+            save_debug_image(Image.fromarray(result["base_rgba"]), "user_no_clothing.png")
+        except Exception as e:
+            print(f"⚠ Warning: Error removing existing clothing: {e}")
+            result["base_rgba"] = cv2.cvtColor(user_cv, cv2.COLOR_BGR2RGBA)
+
+    result["clothing_mask"] = clothing_mask
+    result["body_bbox"] = body_bbox
+    return result
+
+def analyze_person_image(user_img: Image.Image, user_rgb: np.ndarray = None, include_masks: bool = True,
+                         use_cache: bool = True) -> dict:
+    """
+    Runs everything that depends only on the user photo: pose keypoints and
+    body measurements, plus (with include_masks) the clothing/person masks
+    and the inpainted base image.
+
+    Results are cached by a hash of the decoded pixels and
+    PERSON_ANALYSIS_VERSION, so repeat try-ons with the same photo skip
+    straight to warping. Cached arrays are shared and must not be modified.
+    use_cache=False neither reads nor writes the cache.
+    """
+    if user_rgb is None:
+        user_rgb = image_utils.to_rgb_array(user_img)
+    key = cache_store.content_key("person", PERSON_ANALYSIS_VERSION, user_rgb)
+
+    cached = person_analysis_cache.get(key) if use_cache else None
+    if cached is not None and (cached["has_masks"] or not include_masks):
+        print("⚡ Person analysis cache hit")
+        return cached
+
+    analysis = dict(cached) if cached is not None else {"has_masks": False}
+    cacheable = True
+
+    if "pose" not in analysis:
+        analysis["pose"] = None
+        analysis["measurements"] = None
+        analysis["clothing_mask"] = None
+        analysis["body_bbox"] = None
+        analysis["person_mask"] = None
+        try:
+            # One pose+segmentation pass gives keypoints and the clothing mask together
+            print("🔍 Detecting pose, segmenting person and processing measurements...")
+            person = person_analysis.analyze_person(user_rgb)
+            pose_result = person["pose"]
+            analysis["pose"] = pose_result
+            analysis["clothing_mask"] = person["clothing_mask"]
+            analysis["body_bbox"] = person["body_bbox"]
+            # The same segmentation pass gives the person mask used when blending
+            analysis["person_mask"] = person["person_mask"]
+            if pose_result and "kps" in pose_result and len(pose_result["kps"]) >= 5:
+                analysis["measurements"] = get_body_measurements(pose_result["kps"], pose_result["index_map"])
+        except Exception as e:
+            # Don't cache transient failures (e.g. a model that failed to load)
+            print(f"⚠ Warning: Pose analysis failed: {e}")
+            cacheable = False
+
+    if include_masks and not analysis["has_masks"]:
+        analysis.update(_segment_user_image(user_rgb, analysis["clothing_mask"], analysis["body_bbox"], analysis["pose"]))
+        analysis["has_masks"] = True
+
+    if cacheable and use_cache:
+        person_analysis_cache.put(key, analysis)
+    return analysis
+
 # --- Main Process ---
 
-def tryon_process(user_img_source: str, cloth_img_source: str, cloth_type: str = "shirt"):
+def _viton_render(person_img: Image.Image, cloth_img: Image.Image):
+    """VITON-HD result for the original photo, or None when the model is unavailable or fails."""
+    try:
+        print("🔄 Attempting VITON-HD processing...")
+        result_img = model_registry.get("viton_hd").process(person_img, cloth_img)
+        save_debug_image(result_img, "viton_result.png")
+        print("✅ Successfully used VITON-HD")
+        return result_img
+    except Exception as viton_error:
+        print(f"⚠ VITON-HD failed, falling back to mesh warping: {viton_error}")
+        return None
+
+
+def tryon_stages(user_img_source: str, cloth_img_source: str, cloth_type: str = "shirt",
+                 source_url: str = None, cleaning_backend: str = None, warp_mode: str = None,
+                 blend_mode: str = None, outputs=None, quality: int = None, preview: bool = True,
+                 preview_outputs=None, viton: bool = False, use_cache: bool = True, garment: dict = None,
+                 encode_async: bool = False):
     """
-    Main virtual try-on function. Accepts either local paths or URLs for images.
+    Staged virtual try-on: yields a result dict per stage, each with "stage"
+    and "elapsed_ms" (since the call) besides the fields of tryon_process().
+
+    "preview" comes as soon as pose and the cleaned garment are ready: an
+    improved_overlay() on the original photo, encoded as preview_outputs
+    (default VTRY_PREVIEW_OUTPUTS). It is skipped with preview=False or if
+    it fails. "final" is always last, also on errors. With viton, VITON-HD
+    is tried first for the final render, whatever the pose result, as in
+    process_tryon(); the masks, pose checks and mesh warp only run when it
+    is unavailable or fails. use_cache is passed on to load_garment() and
+    analyze_person_image(). garment is a garment store asset the caller
+    already holds; it is used instead of loading cloth_img_source.
+    With encode_async and outputs, stages are yielded as soon as their
+    encodes are submitted: "outputs" holds futures (see encode_output(
+    wait=False)), so the caller's thread is free while the pool encodes.
     """
     print("🟢 Starting virtual try-on process...")
+    start = time.perf_counter()
     
     # Initialize variables
     user_img = None
     cloth_img = None
     cloth_segmenter = None
     clothing_mask = None
+    person_mask = None
     body_bbox = None
     final = None
     preferred_size = None
@@ -745,180 +975,193 @@ def tryon_process(user_img_source: str, cloth_img_source: str, cloth_type: str =
     MIN_IMAGE_SIZE = 256   # Minimum dimension required
 
     try:
+        warp_mode = warp_mesh.resolve_warp_mode(warp_mode)
+        blend_mode = blend_utils.resolve_blend_mode(blend_mode)
+        if outputs is not None:
+            outputs = result_encoder.resolve_outputs(outputs)
+            preview_outputs = result_encoder.resolve_outputs(preview_outputs or PREVIEW_OUTPUTS)
+        else:
+            preview_outputs = None
+
         # Step 1: Get local image paths (downloads from URL if necessary)
         user_img_path = get_image_path(user_img_source, "user")
-        cloth_img_path = get_image_path(cloth_img_source, "cloth")
 
-        print(f"📥 Loading images: user='{user_img_path}', cloth='{cloth_img_path}'")
+        print(f"📥 Loading images: user='{user_img_path}', cloth='{cloth_img_source or source_url}'")
         
         # Load and validate images
-        from . import image_utils
         try:
             user_img = Image.open(user_img_path)
             user_img = image_utils.validate_and_preprocess_image(user_img, MIN_IMAGE_SIZE, MAX_IMAGE_SIZE)
             
-            cloth_img = Image.open(cloth_img_path)
-            cloth_img = image_utils.validate_and_preprocess_image(cloth_img, MIN_IMAGE_SIZE, MAX_IMAGE_SIZE)
-            
-            print(f"✅ Images loaded and validated - User: {user_img.size}, Cloth: {cloth_img.size}")
+            # Decode the user image once; every analysis stage below works on this array
+            user_rgb = image_utils.to_rgb_array(user_img)
+
+            print(f"✅ Images loaded and validated - User: {user_img.size}")
         except Exception as e:
             raise RuntimeError(f"Image validation failed: {str(e)}")
 
-        # Step 1.5: Segment and remove existing clothing
-        print("🔍 Segmenting existing clothing...")
-        from . import segmentation
-        cloth_segmenter = segmentation.ClothSegmentation()
-        
-        # Convert to OpenCV format for processing
-        user_cv = cv2.cvtColor(np.array(user_img), cv2.COLOR_RGBA2BGR)
-        
-        # Get clothing mask and body region
-        clothing_mask, body_bbox = cloth_segmenter.segment_clothing(user_img_path)
-        if clothing_mask is None:
-            print("⚠ Warning: Could not detect clothing region, falling back to basic processing")
-            clothing_mask = np.ones((user_cv.shape[0], user_cv.shape[1]), dtype=np.uint8) * 255
-            
-            # Remove existing clothing with more robust error handling
-            try:
-                user_no_cloth = cloth_segmenter.remove_existing_clothing(user_cv, clothing_mask)
-                user_img = Image.fromarray(cv2.cvtColor(user_no_cloth, cv2.COLOR_BGR2RGBA))
-                save_debug_image(user_img, "user_no_clothing.png")
-            except Exception as e:
-                print(f"⚠ Warning: Error removing existing clothing: {e}")
-                user_img = Image.fromarray(cv2.cvtColor(user_cv, cv2.COLOR_BGR2RGBA))
-            
-            # Get person segmentation for fitting
+        # Step 1.5: Pose and measurements (cached per photo); all the preview needs
+        analysis = analyze_person_image(user_img, user_rgb, include_masks=False, use_cache=use_cache)
+        person_img = user_img
+
+        # Step 2: Clean cloth image (served from the garment store when seen before)
+        print("🧹 Cleaning cloth...")
+        try:
+            if garment is None:
+                garment = load_garment(
+                    cloth_img_source, cloth_type, source_url,
+                    preprocess=lambda img: image_utils.validate_and_preprocess_image(img, MIN_IMAGE_SIZE, MAX_IMAGE_SIZE),
+                    cleaning_backend=cleaning_backend, use_cache=use_cache,
+                )
+        except Exception as e:
+            raise RuntimeError(f"Image validation failed: {str(e)}")
+        cloth_clean = Image.fromarray(garment["cloth_rgba"])
+
+        # Preview stage: a quick overlay on the original photo while the full render runs
+        if preview:
             try:
-                from . import human_parsing
-                person_mask = human_parsing.infer_person_mask(user_img_path, thresh=0.6)
+                measurements = analysis["measurements"]
+                stage = {"stage": "preview", **encode_output(
+                    improved_overlay(person_img, cloth_clean, cloth_type, measurements), preview_outputs, quality,
+                    wait=not encode_async)}
+                if measurements is not None:
+                    stage["preferred_size"] = recommend_size(measurements)
+                stage["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                print(f"👀 Preview ready after {stage['elapsed_ms']:.0f}ms")
+                yield stage
             except Exception as e:
-                print(f"⚠ Warning: Error getting person mask: {e}")
-                person_mask = None        # Step 2: Clean cloth image
-        print("🧹 Cleaning cloth...")
-        cloth_clean = clean_cloth(cloth_img, cloth_type)
+                print(f"⚠ Warning: Preview failed: {e}")
 
-        preferred_size = None
-        final = None
+        # Step 2.2: VITON-HD first, whatever the pose result; masks, the pose checks and
+        # the mesh warp below only run when it is unavailable or fails
+        if viton:
+            final = _viton_render(person_img, cloth_clean)
+            if final is not None and analysis["measurements"] is not None:
+                preferred_size = recommend_size(analysis["measurements"])
 
-        # Step 3: Process pose, measurements, and warping
-        pose_result = None
-        try:
-            print("🔍 Detecting pose and processing measurements...")
-            pose_result = person_pose.infer_keypoints(user_img_path)
-            
-            if not pose_result or "kps" not in pose_result or len(pose_result["kps"]) < 5:
-                print("⚠ Warning: Insufficient pose keypoints detected")
-                raise RuntimeError("Insufficient keypoints for advanced processing")
-                
-            kps, idx_map = pose_result["kps"], pose_result["index_map"]
-            print(f"✅ Detected {len(kps)} keypoints")
-            
-            # Calculate measurements and get size recommendation
-            measurements = get_body_measurements(kps, idx_map)
-            preferred_size = recommend_size(measurements)
-            print(f"📏 Recommended size: {preferred_size}")
-            
-            # Create warping polygon
-            dst_poly = create_realistic_polygon(measurements, cloth_type, np.array(user_img).shape)
-            
-            # Debug visualization
-            debug_user = np.array(user_img.copy())
-            for i, (x, y) in enumerate(dst_poly.astype(int)):
-                color = (0, 255, 0) if i < 2 else (255, 0, 0) if i < 4 else (0, 0, 255)
-                cv2.circle(debug_user, (int(x), int(y)), 8, color, -1)
-                cv2.putText(debug_user, str(i), (int(x)+10, int(y)-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-            cv2.polylines(debug_user, [dst_poly.astype(int)], isClosed=True, color=(255, 255, 0), thickness=2)
-            save_debug_image(Image.fromarray(debug_user), "polygon_debug.png")            # Step 4: Calculate measurements and polygons
-            measurements = get_body_measurements(kps, idx_map)
-            preferred_size = recommend_size(measurements)
-            dst_poly = create_realistic_polygon(measurements, cloth_type, np.array(user_img).shape)
-            
-            # Create comprehensive debug visualization
-            create_debug_visualization(user_img, cloth_clean, kps, idx_map, measurements, dst_poly, cloth_type)
-            
-            # Debug: Save polygon visualization
-            debug_user = np.array(user_img.copy())
-            for i, (x, y) in enumerate(dst_poly.astype(int)):
-                color = (0, 255, 0) if i < 2 else (255, 0, 0) if i < 4 else (0, 0, 255)
-                cv2.circle(debug_user, (int(x), int(y)), 8, color, -1)
-                cv2.putText(debug_user, str(i), (int(x)+10, int(y)-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-            cv2.polylines(debug_user, [dst_poly.astype(int)], isClosed=True, color=(255, 255, 0), thickness=2)
-            save_debug_image(Image.fromarray(debug_user), "polygon_debug.png")
-            
-            Hc, Wc = np.array(cloth_clean).shape[:2]
+        if final is None:
+            # Step 2.5: Masks and the clothing-free base image (the pose above is reused)
+            analysis = analyze_person_image(user_img, user_rgb, use_cache=use_cache)
+            clothing_mask = analysis["clothing_mask"]
+            body_bbox = analysis["body_bbox"]
+            person_mask = analysis["person_mask"]
+            if analysis["base_rgba"] is not None:
+                user_img = Image.fromarray(analysis["base_rgba"])
 
-            # Build a reasonable source polygon based on the cloth image and resample
-            # it to have the same number of points as the destination polygon to avoid
-            # index errors during triangulation/warping.
+            # Step 3: Process pose, measurements, and warping
+            pose_result = analysis["pose"]
             try:
-                num_dst = int(dst_poly.shape[0]) if dst_poly is not None else 4
-            except Exception:
-                num_dst = 4
+                if not pose_result or "kps" not in pose_result or len(pose_result["kps"]) < 5:
+                    print("⚠ Warning: Insufficient pose keypoints detected")
+                    raise RuntimeError("Insufficient keypoints for advanced processing")
+            
+                kps, idx_map = pose_result["kps"], pose_result["index_map"]
+                print(f"✅ Detected {len(kps)} keypoints")
+        
+                # Measurements come with the person analysis; get size recommendation
+                measurements = analysis["measurements"]
+                if measurements is None:
+                    raise RuntimeError("Body measurements unavailable")
+                preferred_size = recommend_size(measurements)
+                print(f"📏 Recommended size: {preferred_size}")
+        
+                # Create warping polygon
+                dst_poly = create_realistic_polygon(measurements, cloth_type, np.array(user_img).shape)
+        
+                # Debug visualization
+                debug_user = np.array(user_img.copy())
+                for i, (x, y) in enumerate(dst_poly.astype(int)):
+                    color = (0, 255, 0) if i < 2 else (255, 0, 0) if i < 4 else (0, 0, 255)
+                    cv2.circle(debug_user, (int(x), int(y)), 8, color, -1)
+                    cv2.putText(debug_user, str(i), (int(x)+10, int(y)-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+                cv2.polylines(debug_user, [dst_poly.astype(int)], isClosed=True, color=(255, 255, 0), thickness=2)
+                save_debug_image(Image.fromarray(debug_user), "polygon_debug.png")            # Step 4: Calculate polygons
+                dst_poly = create_realistic_polygon(measurements, cloth_type, np.array(user_img).shape)
+        
+                # Create comprehensive debug visualization
+                create_debug_visualization(user_img, cloth_clean, kps, idx_map, measurements, dst_poly, cloth_type)
+        
+                # Debug: Save polygon visualization
+                debug_user = np.array(user_img.copy())
+                for i, (x, y) in enumerate(dst_poly.astype(int)):
+                    color = (0, 255, 0) if i < 2 else (255, 0, 0) if i < 4 else (0, 0, 255)
+                    cv2.circle(debug_user, (int(x), int(y)), 8, color, -1)
+                    cv2.putText(debug_user, str(i), (int(x)+10, int(y)-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+                cv2.polylines(debug_user, [dst_poly.astype(int)], isClosed=True, color=(255, 255, 0), thickness=2)
+                save_debug_image(Image.fromarray(debug_user), "polygon_debug.png")
+        
+                Hc, Wc = np.array(cloth_clean).shape[:2]
 
-            try:
-                src_pts = fit_polygons.get_source_points(cloth_clean, n_points=num_dst)
-                if src_pts is None or len(src_pts) < 3:
-                    # fallback rectangle corners
+                # Build a reasonable source polygon based on the cloth image and resample
+                # it to have the same number of points as the destination polygon to avoid
+                # index errors during triangulation/warping.
+                try:
+                    num_dst = int(dst_poly.shape[0]) if dst_poly is not None else 4
+                except Exception:
+                    num_dst = 4
+
+                triangles = None
+                try:
+                    mesh = garment.get("mesh")
+                    if mesh is not None and len(mesh["src_pts"]) == num_dst:
+                        # Stored mesh: skips resampling and triangulation
+                        src_pts, triangles = mesh["src_pts"], mesh["triangles"]
+                    else:
+                        src_pts = fit_polygons.resample_source_points(garment["contour"], num_dst)
+                    if src_pts is None or len(src_pts) < 3:
+                        # fallback rectangle corners
+                        src_pts = np.array([[0, 0], [Wc - 1, 0], [Wc - 1, Hc - 1], [0, Hc - 1]], dtype=np.float32)
+                except Exception as e:
+                    print(f"⚠ Warning: get_source_points failed: {e}")
                     src_pts = np.array([[0, 0], [Wc - 1, 0], [Wc - 1, Hc - 1], [0, Hc - 1]], dtype=np.float32)
-            except Exception as e:
-                print(f"⚠ Warning: get_source_points failed: {e}")
-                src_pts = np.array([[0, 0], [Wc - 1, 0], [Wc - 1, Hc - 1], [0, Hc - 1]], dtype=np.float32)
 
-            # Step 5: Warp and blend
-            print("🌊 Performing mesh warping...")
-            # Perform warping with error handling
-            try:
-                warped = advanced_mesh_warp(cloth_clean, src_pts, dst_poly, (user_img.height, user_img.width))
-                save_debug_image(Image.fromarray(warped), "cloth_warped.png")
+                # Step 5: Warp and blend
+                print("🌊 Performing mesh warping...")
+                # Perform warping with error handling
+                try:
+                    warped, offset = advanced_mesh_warp(cloth_clean, src_pts, dst_poly, user_img.size, warp_mode,
+                                                        triangles)
+                    save_debug_image(Image.fromarray(warped), "cloth_warped.png")
 
-                print("🎨 Applying enhanced blending with segmentation masks...")
-                final = enhanced_blend(user_img, warped, person_mask, clothing_mask)
-                save_debug_image(final, "final_blended.png")
-            except Exception as e:
-                print(f"⚠ Warning: Error in warping/blending: {e}")
-                print("Falling back to basic overlay...")
-                final = improved_overlay(user_img, cloth_clean, cloth_type, measurements)
+                    print(f"🎨 Applying {blend_mode} blending with segmentation masks...")
+                    final = Image.fromarray(blend_utils.blend_garment(
+                        np.array(user_img.convert("RGBA")), warped, offset, person_mask, clothing_mask, blend_mode))
+                    save_debug_image(final, "final_blended.png")
+                except Exception as e:
+                    print(f"⚠ Warning: Error in warping/blending: {e}")
+                    print("Falling back to basic overlay...")
+                    final = improved_overlay(user_img, cloth_clean, cloth_type, measurements)
 
-        except Exception as pose_e:
-            print(f"⚠ Advanced pipeline failed: {pose_e}. Using improved fallback overlay.")
-            # Try to get measurements even if pose detection partially failed
-            measurements = None
-            try:
-                if 'measurements' in locals():
-                    measurements = measurements
-                elif 'kps' in locals() and 'idx_map' in locals():
-                    measurements = get_body_measurements(kps, idx_map)
-            except:
-                pass
-            
-            final = improved_overlay(user_img, cloth_clean, cloth_type, measurements)
-            if preferred_size is None:
-                preferred_size = "M"  # Default size on fallback
+            except Exception as pose_e:
+                print(f"⚠ Advanced pipeline failed: {pose_e}. Using improved fallback overlay.")
+                # Try to get measurements even if pose detection partially failed
+                measurements = None
+                try:
+                    if 'measurements' in locals():
+                        measurements = measurements
+                    elif 'kps' in locals() and 'idx_map' in locals():
+                        measurements = get_body_measurements(kps, idx_map)
+                except:
+                    pass
+        
+                final = improved_overlay(user_img, cloth_clean, cloth_type, measurements)
+                if preferred_size is None:
+                    preferred_size = "M"  # Default size on fallback
 
-        # Step 6: Encode final image to Base64
+        # Step 6: Encode the final image once per requested output
         print("💾 Encoding final image...")
         try:
             # Ensure we have a valid image to encode
             if final is None:
                 raise ValueError("No image to encode")
-                
-            # Convert to RGB to ensure compatibility
-            final = final.convert('RGB')
-            
-            # Create a buffer and save the image
-            buf = io.BytesIO()
-            final.save(buf, format="PNG", quality=95)
-            buf.seek(0)  # Reset buffer position
-            
-            # Encode to base64 with proper formatting
-            img_str = base64.b64encode(buf.getvalue()).decode('utf-8')
-            result = {
-                "output_image_base64": f"data:image/png;base64,{img_str}",
-                "preferred_size": preferred_size or "M"
-            }
-            
+
+            result = {"stage": "final", **encode_output(final, outputs, quality, wait=not encode_async)}
+            result["preferred_size"] = preferred_size or "M"
+            result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
             print("✅ Try-on process completed successfully!")
-            return result
+            yield result
+            return
             
         except Exception as e:
             print(f"❌ Error during image encoding: {e}")
@@ -937,22 +1180,40 @@ def tryon_process(user_img_source: str, cloth_img_source: str, cloth_type: str =
             d = ImageDraw.Draw(error_img)
             d.text((10, 10), f"Error: {error_msg}", fill='black')
             
-            # Convert error image to base64
-            buf = io.BytesIO()
-            error_img.save(buf, format="PNG")
-            buf.seek(0)
-            error_img_str = base64.b64encode(buf.getvalue()).decode('utf-8')
-            
-            return {
-                "output_image_base64": f"data:image/png;base64,{error_img_str}",
-                "error": error_msg
-            }
+            # Encode the error image like a result
+            result = {"stage": "final", **encode_output(error_img, outputs, quality, wait=not encode_async)}
+            result["error"] = error_msg
         except:
             # If even creating error image fails, return minimal response
-            return {
+            result = {
+                "stage": "final",
                 "output_image_base64": "",
                 "error": error_msg
             }
+        result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        yield result
+
+
+def tryon_process(user_img_source: str, cloth_img_source: str, cloth_type: str = "shirt",
+                  source_url: str = None, cleaning_backend: str = None, warp_mode: str = None,
+                  blend_mode: str = None, outputs=None, quality: int = None, use_cache: bool = True):
+    """
+    Main virtual try-on function. Accepts either local paths or URLs for images.
+    source_url is the product page the cloth came from and cleaning_backend
+    the cloth_cleaner backend to use; see load_garment(). warp_mode picks the
+    garment warp ("mesh" or "tps", default VTRY_WARP_MODE) and blend_mode the
+    compositing ("feather" or "multiband", default VTRY_BLEND_MODE). outputs
+    names the result encodings (e.g. ["webp", "preview"]) at WebP/JPEG
+    quality; see encode_output(). use_cache=False bypasses the garment
+    store and person analysis cache, as warm-up needs.
+
+    This is the final stage of tryon_stages(), without a preview.
+    """
+    result = None
+    for result in tryon_stages(user_img_source, cloth_img_source, cloth_type, source_url, cleaning_backend,
+                               warp_mode, blend_mode, outputs, quality, preview=False, use_cache=use_cache):
+        pass
+    return result
 
 # --- Module Sanity Check ---
 try:
@@ -163,11 +163,7 @@ These are proprietary model files that need to be obtained from the project main
             traceback.print_exc()
             raise
 
-# Initialize as singleton
-viton_model = None
-
 def get_viton_model():
-    global viton_model
-    if viton_model is None:
-        viton_model = VITONHD()
-    return viton_model
\ No newline at end of file
+    """Return the shared VITON-HD instance owned by the model registry."""
+    from .model_registry import registry
+    return registry.get("viton_hd")
\ No newline at end of file
@@ -0,0 +1,63 @@
+# backend/ai_engine/warmup.py
+"""
+Start-up warm-up for the try-on engine.
+
+The first real job after a deploy used to pay for creating the rembg ONNX
+sessions, building the MediaPipe graphs and JIT-initialising OpenCV kernels.
+run_warmup() pays that cost up front by loading every registered model and
+pushing the bundled test images through both try-on pipelines. The runs
+bypass the person-analysis cache and the garment store, which persist
+across restarts, and the flat-backdrop cleaning fast path: a warm-up
+served from them would leave the models loaded but never run.
+"""
+import os
+import time
+from typing import Any, Dict
+
+TEST_IMAGES_DIR = os.path.join(os.path.dirname(__file__), "test_images")
+WARMUP_PERSON = os.path.join(TEST_IMAGES_DIR, "person.png")
+WARMUP_CLOTH = os.path.join(TEST_IMAGES_DIR, "cloth.png")
+
+
+def _timed(report: Dict[str, Any], stage: str, fn):
+    start = time.perf_counter()
+    try:
+        fn()
+        report["stages"][stage] = {"ok": True, "seconds": round(time.perf_counter() - start, 3)}
+    except Exception as e:
+        report["stages"][stage] = {"ok": False, "seconds": round(time.perf_counter() - start, 3), "error": str(e)}
+        report["errors"].append(f"{stage}: {e}")
+        print(f"⚠️ Warm-up stage '{stage}' failed: {e}")
+
+
+def run_warmup(person_path: str = WARMUP_PERSON, cloth_path: str = WARMUP_CLOTH,
+               cloth_type: str = "shirt") -> Dict[str, Any]:
+    """
+    Load every model and run a synthetic person/cloth pair through each stage.
+
+    Individual stage failures are recorded rather than raised: a missing
+    optional model (e.g. VITON-HD weights) must not keep a worker from
+    becoming ready, since the pipeline falls back without it.
+    """
+    from .model_registry import registry as model_registry
+    from . import tryon_processor
+
+    print("🔥 Warming up try-on engine...")
+    start = time.perf_counter()
+    report: Dict[str, Any] = {"stages": {}, "errors": []}
+
+    for name in model_registry.names():
+        _timed(report, f"load:{name}", lambda name=name: model_registry.load(name))
+
+    _timed(report, "process_tryon",
+           lambda: tryon_processor.process_tryon(person_path, cloth_path, cloth_type, use_cache=False))
+
+    def _geometric():
+        result = tryon_processor.tryon_process(person_path, cloth_path, cloth_type, use_cache=False)
+        if result.get("error"):
+            raise RuntimeError(result["error"])
+    _timed(report, "tryon_process", _geometric)
+
+    report["seconds"] = round(time.perf_counter() - start, 3)
+    print(f"✅ Warm-up finished in {report['seconds']:.1f}s ({len(report['errors'])} stage errors)")
+    return report
@@ -1,10 +1,39 @@
 # backend/ai_engine/warp_mesh.py
+import os
 import cv2, numpy as np
-from scipy.spatial import Delaunay
-from typing import Tuple
+from typing import Optional, Tuple
 import warnings
 
+from . import cache_store
+
+# Pixels this far outside the destination mesh still sample the nearest triangle,
+# so the garment edge is antialiased instead of cut at the hull.
+MESH_MARGIN = 2
+
+# "mesh": piecewise-affine over the Delaunay mesh of the destination points.
+# "tps": thin-plate spline through the points, evaluated on a coarse grid.
+WARP_MODES = ("mesh", "tps")
+WARP_MODE = os.getenv("VTRY_WARP_MODE", "mesh")
+
+# TPS grid spacing in pixels, extra border mapped around the destination points
+# (a spline can bulge past them) and smoothing (0 interpolates the points exactly)
+TPS_GRID_STEP = int(os.getenv("VTRY_TPS_GRID_STEP", "16"))
+TPS_MARGIN = 16
+TPS_REGULARIZATION = float(os.getenv("VTRY_TPS_REGULARIZATION", "0"))
+
+# Destination points are snapped to this grid (pixels) before the map lookup, so a
+# near-identical body pose reuses the maps of the previous try-on. 0 disables snapping.
+WARP_QUANTUM = float(os.getenv("VTRY_WARP_QUANTUM", "2"))
+
+# Fixed-point maps (CV_16SC2 + CV_16UC1) take ~7 bytes per mapped pixel
+warp_map_cache = cache_store.LRUCache(int(os.getenv("VTRY_WARP_CACHE_ITEMS", "16")))
+# (garment points, canvas) -> recent [(snapped dst_pts, map key)], for poses that
+# snap to a neighbouring grid cell
+_warp_poses = cache_store.LRUCache(256)
+_POSES_PER_GARMENT = 8
+
 def _triangulate(points: np.ndarray) -> np.ndarray:
+    from scipy.spatial import Delaunay  # deferred: scipy.spatial costs ~0.5s at import
     tri = Delaunay(points)
     return tri.simplices  # (T,3) indices
 
@@ -106,16 +135,8 @@ def _warp_triangle(src, dst, img_src, img_dst):
         blended = img_dst_section * (1 - alpha) + warped_section * alpha
         img_dst[y_start:y_end, x_start:x_end] = blended.astype(np.uint8)
 
-def warp_rgba_mesh(src_rgba: np.ndarray, src_pts: np.ndarray, dst_pts: np.ndarray, out_wh: Tuple[int,int]) -> np.ndarray:
-    """
-    src_rgba: HxWx4 uint8
-    src_pts, dst_pts: Nx2 float32 correspondences (N>=8 recommended)
-    out_wh: (W,H) of destination canvas
-    """
-    W, H = out_wh
-    out = np.zeros((H, W, 4), dtype=np.uint8)
-
-    # ensure inputs are numpy arrays of correct dtype
+def _mesh_points(src_pts: np.ndarray, dst_pts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """float32 correspondences, with src resampled to the destination point count."""
     src_pts = np.asarray(src_pts, dtype=np.float32)
     dst_pts = np.asarray(dst_pts, dtype=np.float32)
 
@@ -125,6 +146,302 @@ def warp_rgba_mesh(src_rgba: np.ndarray, src_pts: np.ndarray, dst_pts: np.ndarra
             src_pts = _resample_polygon(src_pts, dst_pts.shape[0])
         except Exception as e:
             warnings.warn(f"Failed to resample source polygon: {e}")
+    return src_pts, dst_pts
+
+
+def _valid_triangles(tris: np.ndarray, n_points: int) -> np.ndarray:
+    tris = np.asarray(tris).reshape(-1, 3).astype(np.int64)
+    bad = (tris >= n_points).any(axis=1) | (tris < 0).any(axis=1)
+    if bad.any():
+        warnings.warn(f"Skipping {int(bad.sum())} triangles with out-of-bounds indices")
+    return tris[~bad]
+
+
+def build_mesh_maps(src_pts: np.ndarray, dst_pts: np.ndarray, out_wh: Tuple[int, int],
+                    triangles: Optional[np.ndarray] = None, margin: int = MESH_MARGIN):
+    """
+    Dense inverse map of the piecewise-affine warp taking src_pts onto dst_pts.
+
+    Only the destination mesh bounding box (plus margin, clipped to the W x H
+    canvas) is mapped. Each pixel is labelled with the triangle that covers it,
+    and map_x/map_y come from that triangle's dst -> src affine, i.e. its
+    barycentric coordinates applied to the source corners. Pixels within margin
+    of the mesh use their nearest triangle; everything else is marked outside.
+
+    Returns (map_x, map_y, inside, (x0, y0)) with float32 maps and a bool
+    inside mask of the box size, or None when the mesh misses the canvas.
+    triangles defaults to the Delaunay triangulation of dst_pts.
+    """
+    src_pts, dst_pts = _mesh_points(src_pts, dst_pts)
+    W, H = out_wh
+    x0 = max(0, int(np.floor(dst_pts[:, 0].min())) - margin)
+    y0 = max(0, int(np.floor(dst_pts[:, 1].min())) - margin)
+    x1 = min(W, int(np.ceil(dst_pts[:, 0].max())) + margin + 1)
+    y1 = min(H, int(np.ceil(dst_pts[:, 1].max())) + margin + 1)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    w, h = x1 - x0, y1 - y0
+
+    tris = _valid_triangles(_triangulate(dst_pts) if triangles is None else triangles, min(len(src_pts), len(dst_pts)))
+    dst_local = dst_pts - np.float32([x0, y0])
+
+    # Label image: triangle index + 1, 0 outside the mesh (sub-pixel vertices, 4 fractional bits)
+    labels = np.zeros((h, w), dtype=np.int32)
+    corners = np.round(dst_local[tris] * 16).astype(np.int32)
+    for i, tri in enumerate(corners):
+        cv2.fillConvexPoly(labels, tri, i + 1, lineType=cv2.LINE_8, shift=4)
+
+    if margin > 0:
+        outside = (labels == 0).astype(np.uint8)
+        if outside.any() and not outside.all():
+            dist, nearest = cv2.distanceTransformWithLabels(outside, cv2.DIST_L2, 5, labelType=cv2.DIST_LABEL_PIXEL)
+            # DIST_LABEL_PIXEL numbers the zero (labelled) pixels in row-major order
+            covered = labels[outside == 0]
+            grow = (outside == 1) & (dist <= margin)
+            labels[grow] = covered[nearest[grow] - 1]
+
+    # Per-triangle dst -> src affine, [x, y, 1] @ coef -> (sx, sy); row 0 marks outside
+    A = np.concatenate([dst_local[tris], np.ones((len(tris), 3, 1), np.float32)], axis=2).astype(np.float64)
+    B = src_pts[tris].astype(np.float64)
+    coef = np.zeros((len(tris) + 1, 3, 2), dtype=np.float64)
+    coef[0, 2] = -1.0
+    solvable = np.abs(np.linalg.det(A)) > 1e-6 if len(tris) else np.zeros(0, dtype=bool)
+    if solvable.any():
+        coef[1:][solvable] = np.linalg.solve(A[solvable], B[solvable])
+    coef[1:][~solvable, 2] = -1.0
+    coef = coef.astype(np.float32)
+
+    xs = np.arange(w, dtype=np.float32)[None, :]
+    ys = np.arange(h, dtype=np.float32)[:, None]
+    map_x = coef[labels, 0, 0] * xs + coef[labels, 1, 0] * ys + coef[labels, 2, 0]
+    map_y = coef[labels, 0, 1] * xs + coef[labels, 1, 1] * ys + coef[labels, 2, 1]
+    inside = labels != 0
+    inside[inside] = solvable[labels[inside] - 1]
+    return map_x, map_y, inside, (x0, y0)
+
+
+def _tps_kernel(d2: np.ndarray) -> np.ndarray:
+    """U(r) = r^2 log r^2 from squared distances, with U(0) = 0."""
+    return d2 * np.log(np.maximum(d2, 1e-20))
+
+
+def _sq_dist(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    d2 = (a * a).sum(axis=1)[:, None] + (b * b).sum(axis=1)[None, :] - 2.0 * (a @ b.T)
+    return np.maximum(d2, 0.0, out=d2)
+
+
+def solve_tps(ctrl: np.ndarray, target: np.ndarray, regularization: float = 0.0) -> dict:
+    """
+    Thin-plate spline f with f(ctrl[i]) = target[i] (Nx2 each).
+
+    Coordinates are centred and scaled by the control point extent so the
+    system stays well conditioned. Degenerate point sets (duplicates,
+    collinear points) fall back to a least-squares solution.
+    """
+    ctrl = np.asarray(ctrl, dtype=np.float64)
+    target = np.asarray(target, dtype=np.float64)
+    n = len(ctrl)
+    center = ctrl.mean(axis=0)
+    scale = max(float(np.ptp(ctrl, axis=0).max()), 1.0)
+    c = (ctrl - center) / scale
+
+    L = np.zeros((n + 3, n + 3))
+    L[:n, :n] = _tps_kernel(_sq_dist(c, c)) + regularization * np.eye(n)
+    L[:n, n] = 1.0
+    L[:n, n + 1:] = c
+    L[n:, :n] = L[:n, n:].T
+    rhs = np.zeros((n + 3, 2))
+    rhs[:n] = target
+    try:
+        sol = np.linalg.solve(L, rhs)
+    except np.linalg.LinAlgError:
+        sol = np.linalg.lstsq(L, rhs, rcond=None)[0]
+    return {"ctrl": c, "center": center, "scale": scale, "weights": sol[:n], "affine": sol[n:]}
+
+
+def eval_tps(tps: dict, pts: np.ndarray, chunk: int = 16384) -> np.ndarray:
+    """Evaluate a solve_tps() spline at Mx2 points, returning Mx2 float32."""
+    p = (np.asarray(pts, dtype=np.float64) - tps["center"]) / tps["scale"]
+    out = np.empty((len(p), 2), dtype=np.float32)
+    for i in range(0, len(p), chunk):
+        q = p[i:i + chunk]
+        out[i:i + chunk] = (_tps_kernel(_sq_dist(q, tps["ctrl"])) @ tps["weights"]
+                            + tps["affine"][0] + q @ tps["affine"][1:])
+    return out
+
+
+def build_tps_maps(src_pts: np.ndarray, dst_pts: np.ndarray, out_wh: Tuple[int, int],
+                   step: int = TPS_GRID_STEP, margin: int = TPS_MARGIN,
+                   regularization: float = TPS_REGULARIZATION):
+    """
+    Dense inverse map of the thin-plate spline taking dst_pts back to src_pts.
+
+    The spline is solved once, evaluated on a grid every step pixels over the
+    destination bounding box (plus margin, clipped to the W x H canvas) and
+    bilinearly upsampled with cv2.resize, so the cost depends on the box size
+    rather than the point count. The grid is offset by half a cell and padded
+    by one node so the upsampled map is exact bilinear interpolation up to the
+    box edges. Same return value as build_mesh_maps() with inside=None: the
+    whole box is mapped and the garment alpha decides what shows.
+    """
+    src_pts, dst_pts = _mesh_points(src_pts, dst_pts)
+    W, H = out_wh
+    x0 = max(0, int(np.floor(dst_pts[:, 0].min())) - margin)
+    y0 = max(0, int(np.floor(dst_pts[:, 1].min())) - margin)
+    x1 = min(W, int(np.ceil(dst_pts[:, 0].max())) + margin + 1)
+    y1 = min(H, int(np.ceil(dst_pts[:, 1].max())) + margin + 1)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    w, h = x1 - x0, y1 - y0
+    step = max(1, int(step))
+
+    tps = solve_tps(dst_pts, src_pts, regularization)
+    nx, ny = -(-w // step) + 2, -(-h // step) + 2
+    # cv2.resize samples node j at output pixel j*step + (step-1)/2
+    offset = (step - 1) / 2.0
+    gx = x0 + (np.arange(nx) - 1) * step + offset
+    gy = y0 + (np.arange(ny) - 1) * step + offset
+    nodes = np.stack(np.meshgrid(gx, gy), axis=-1).reshape(-1, 2)
+    grid = eval_tps(tps, nodes).reshape(ny, nx, 2)
+
+    dense = cv2.resize(grid, (nx * step, ny * step), interpolation=cv2.INTER_LINEAR)[step:step + h, step:step + w]
+    return np.ascontiguousarray(dense[:, :, 0]), np.ascontiguousarray(dense[:, :, 1]), None, (x0, y0)
+
+
+_MAP_BUILDERS = {"mesh": build_mesh_maps, "tps": build_tps_maps}
+
+
+def resolve_warp_mode(mode: Optional[str] = None) -> str:
+    """mode lower-cased, or WARP_MODE when None; ValueError if it is not in WARP_MODES."""
+    mode = (mode or WARP_MODE).lower()
+    if mode not in WARP_MODES:
+        raise ValueError(f"Unknown warp mode {mode!r}; expected one of {WARP_MODES}")
+    return mode
+
+
+def cached_warp_maps(src_pts: np.ndarray, dst_pts: np.ndarray, out_wh: Tuple[int, int], mode: str = None,
+                     triangles: Optional[np.ndarray] = None):
+    """
+    build_mesh_maps() or build_tps_maps() (by mode, default WARP_MODE) through
+    warp_map_cache, as compact fixed-point maps. triangles is passed on to
+    build_mesh_maps() and ignored by "tps".
+
+    dst_pts are snapped to WARP_QUANTUM first and the maps are built from the
+    snapped points, so a cached entry is exactly what a rebuild would give.
+    A pose whose points all lie within WARP_QUANTUM of a recent pose for the
+    same garment reuses that pose's maps, even if some points snapped to a
+    different cell. Returns (xy, frac, inside, (x0, y0)) for
+    cv2.remap(src, xy, frac, ...) or None when the mesh misses the canvas.
+    """
+    mode = resolve_warp_mode(mode)
+    src_pts, dst_pts = _mesh_points(src_pts, dst_pts)
+    if WARP_QUANTUM > 0:
+        dst_pts = (np.round(dst_pts / WARP_QUANTUM) * WARP_QUANTUM).astype(np.float32)
+    if mode == "mesh":
+        params = (MESH_MARGIN,)
+        triangles = None if triangles is None else np.ascontiguousarray(triangles, dtype=np.int64).reshape(-1, 3)
+    else:
+        params = (TPS_GRID_STEP, TPS_MARGIN, TPS_REGULARIZATION)
+        triangles = None
+    garment_key = cache_store.content_key("warp-garment", mode, params, tuple(out_wh), src_pts, triangles)
+    key = cache_store.content_key(garment_key, dst_pts)
+    maps = warp_map_cache.get(key)
+    if maps is not None:
+        return maps
+
+    poses = _warp_poses.get(garment_key, [])
+    if WARP_QUANTUM > 0:
+        for pose, pose_key in reversed(poses):
+            if pose.shape == dst_pts.shape and np.abs(pose - dst_pts).max() <= WARP_QUANTUM:
+                maps = warp_map_cache.get(pose_key)
+                if maps is not None:
+                    return maps
+
+    built = (build_mesh_maps(src_pts, dst_pts, out_wh, triangles) if mode == "mesh"
+             else _MAP_BUILDERS[mode](src_pts, dst_pts, out_wh))
+    if built is None:
+        return None
+    map_x, map_y, inside, origin = built
+    xy, frac = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+    maps = (xy, frac, inside, origin)
+    warp_map_cache.put(key, maps)
+    _warp_poses.put(garment_key, (poses + [(dst_pts, key)])[-_POSES_PER_GARMENT:])
+    return maps
+
+
+def warp_rgba_patch(src_rgba: np.ndarray, src_pts: np.ndarray, dst_pts: np.ndarray, out_wh: Tuple[int,int],
+                    interpolation: int = cv2.INTER_LINEAR, cache: bool = True,
+                    mode: str = None, triangles: Optional[np.ndarray] = None
+                    ) -> Tuple[Optional[np.ndarray], Tuple[int, int]]:
+    """
+    src_rgba: HxWx4 uint8
+    src_pts, dst_pts: Nx2 float32 correspondences (N>=8 recommended)
+    out_wh: (W,H) of destination canvas
+    mode: "mesh" or "tps" (see WARP_MODES), default WARP_MODE
+    triangles: (T,3) point indices for "mesh", e.g. the garment store's
+        precomputed triangulation of src_pts; default Delaunay of dst_pts
+
+    Warps only the bounding box of dst_pts (plus the mode's margin, clipped to
+    the canvas) and returns (patch, (x0, y0)): an hxwx4 uint8 garment patch and
+    its top-left corner on the canvas. patch is None when the mesh misses the
+    canvas or the maps could not be built.
+
+    Either mode is a single cv2.remap, so there are no seams between triangles.
+    "mesh" is piecewise-affine over the Delaunay mesh of dst_pts
+    (build_mesh_maps), "tps" a thin-plate spline through the points
+    (build_tps_maps). With cache, the maps come from cached_warp_maps() and a
+    repeat garment/pose pair skips triangulation and map building.
+    """
+    mode = resolve_warp_mode(mode)
+    try:
+        if cache:
+            maps = cached_warp_maps(src_pts, dst_pts, out_wh, mode, triangles)
+        elif mode == "mesh":
+            maps = build_mesh_maps(src_pts, dst_pts, out_wh, triangles)
+        else:
+            maps = _MAP_BUILDERS[mode](src_pts, dst_pts, out_wh)
+    except Exception as e:
+        warnings.warn(f"Building {mode} warp maps failed: {e}")
+        return None, (0, 0)
+    if maps is None:
+        return None, (0, 0)
+
+    map1, map2, inside, origin = maps
+    if inside is None:
+        patch = cv2.remap(src_rgba, map1, map2, interpolation, borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+    else:
+        patch = cv2.remap(src_rgba, map1, map2, interpolation, borderMode=cv2.BORDER_REPLICATE)
+        patch[~inside] = 0
+    return patch, origin
+
+
+def warp_rgba_mesh(src_rgba: np.ndarray, src_pts: np.ndarray, dst_pts: np.ndarray, out_wh: Tuple[int,int],
+                   interpolation: int = cv2.INTER_LINEAR, cache: bool = True, mode: str = None,
+                   triangles: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    warp_rgba_patch() pasted onto a blank (H,W,4) canvas; same arguments.
+
+    Prefer warp_rgba_patch() when the caller can work on the garment box.
+    """
+    W, H = out_wh
+    out = np.zeros((H, W, 4), dtype=np.uint8)
+    patch, (x0, y0) = warp_rgba_patch(src_rgba, src_pts, dst_pts, out_wh, interpolation, cache, mode, triangles)
+    if patch is not None:
+        h, w = patch.shape[:2]
+        out[y0:y0 + h, x0:x0 + w] = patch
+    return out
+
+
+def warp_rgba_mesh_triangles(src_rgba: np.ndarray, src_pts: np.ndarray, dst_pts: np.ndarray,
+                             out_wh: Tuple[int,int]) -> np.ndarray:
+    """
+    Previous warp_rgba_mesh: one feathered warpAffine per triangle.
+
+    Kept as the reference for run_benchmark.py warp; same arguments.
+    """
+    W, H = out_wh
+    out = np.zeros((H, W, 4), dtype=np.uint8)
+    src_pts, dst_pts = _mesh_points(src_pts, dst_pts)
 
     # triangulate destination polygon
     try:
@@ -1,10 +1,11 @@
 # backend/main.py
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, EmailStr
 from pymongo import MongoClient
 from dotenv import load_dotenv
-import os, bcrypt, jwt, datetime
+import os, bcrypt, jwt, datetime, threading, time
 
 # Load environment variables
 load_dotenv()
@@ -12,6 +13,8 @@ MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
 JWT_SECRET = os.getenv("JWT_SECRET", "mysecretjwtkey")
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", "8000"))
+# Run the try-on engine warm-up at startup; /ready reports 503 until it finishes
+WARMUP_ENABLED = os.getenv("VTRY_WARMUP", "0").lower() in ("1", "true", "yes")
 
 def find_available_port(start_port=8000, max_port=8100):
     """Find an available port in the given range."""
@@ -154,6 +157,42 @@ from routes import tryon as tryon
 
 app.include_router(tryon.router)
 
+# ----------------- WARM-UP & READINESS -----------------
+warmup_state = {"status": "pending" if WARMUP_ENABLED else "disabled"}
+
+def _run_warmup():
+    """Warm the try-on engine in a background thread so health checks keep answering."""
+    warmup_state.update({"status": "running", "started_at": time.time()})
+    try:
+        from ai_engine.warmup import run_warmup
+        report = run_warmup()
+        warmup_state.update({"status": "ready", "finished_at": time.time(), "report": report})
+    except Exception as e:
+        print(f"❌ Warm-up failed: {e}")
+        warmup_state.update({"status": "failed", "finished_at": time.time(), "error": str(e)})
+
+@app.on_event("startup")
+async def start_warmup():
+    if WARMUP_ENABLED:
+        threading.Thread(target=_run_warmup, name="tryon-warmup", daemon=True).start()
+
+@app.on_event("shutdown")
+def release_models():
+    """Stop the try-on workers and free the native memory held by loaded models."""
+    tryon.tryon_executor.shutdown(wait=False)
+    from ai_engine import result_encoder
+    result_encoder.shutdown()
+    from ai_engine.model_registry import registry as model_registry
+    model_registry.close_all()
+    print("✅ Released try-on models")
+
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once the try-on engine is warm (or warm-up is disabled), 503 before."""
+    if warmup_state["status"] in ("ready", "disabled"):
+        return {"ready": True, **warmup_state}
+    return JSONResponse(status_code=503, content={"ready": False, **warmup_state})
+
 # ----------------- START SERVER -----------------
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Startup import profiler.
+
+Imports an app (default main:app) with every module load timed, and prints
+a per-module breakdown of import time and resident memory growth, plus a
+per-package summary. Run it from the backend directory:
+
+    python profile_startup.py [main:app] [--top 30]
+"""
+import argparse
+import importlib
+import importlib.abc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def _rss_bytes():
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+class _Record:
+    __slots__ = ("name", "total", "self_time", "rss", "self_rss", "parent")
+
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+        self.total = 0.0
+        self.self_time = 0.0
+        self.rss = 0
+        self.self_rss = 0
+
+
+class _ProfilingLoader(importlib.abc.Loader):
+    """Wraps a real loader and times exec_module for the profiler."""
+
+    def __init__(self, profiler, loader):
+        self._profiler = profiler
+        self._loader = loader
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._profiler._enter(module.__name__)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._leave()
+
+    def __getattr__(self, item):
+        return getattr(self._loader, item)
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """Meta path hook recording inclusive/self import time and RSS per module."""
+
+    def __init__(self):
+        self.records = []
+        self._stack = []
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _ProfilingLoader(self, spec.loader)
+                return spec
+        return None
+
+    def _enter(self, name):
+        parent = self._stack[-1][0] if self._stack else None
+        record = _Record(name, parent)
+        self.records.append(record)
+        self._stack.append((record, time.perf_counter(), _rss_bytes()))
+
+    def _leave(self):
+        record, start, rss_start = self._stack.pop()
+        record.total = time.perf_counter() - start
+        record.rss = _rss_bytes() - rss_start
+        record.self_time += record.total
+        record.self_rss += record.rss
+        if record.parent is not None:
+            record.parent.self_time -= record.total
+            record.parent.self_rss -= record.rss
+
+    def __enter__(self):
+        sys.meta_path.insert(0, self)
+        return self
+
+    def __exit__(self, *exc):
+        sys.meta_path.remove(self)
+        return False
+
+
+def _mb(n):
+    return n / (1024 * 1024)
+
+
+def print_report(profiler, total_seconds, total_rss, top):
+    records = profiler.records
+    print(f"\n📊 Imported {len(records)} modules in {total_seconds:.2f}s, RSS +{_mb(total_rss):.1f} MB")
+
+    print(f"\nTop {top} modules by cumulative import time:")
+    print(f"{'module':50s} {'cum ms':>9s} {'self ms':>9s} {'cum MB':>8s} {'self MB':>8s}")
+    for r in sorted(records, key=lambda r: r.total, reverse=True)[:top]:
+        print(f"{r.name[:50]:50s} {r.total * 1000:9.1f} {r.self_time * 1000:9.1f} {_mb(r.rss):8.1f} {_mb(r.self_rss):8.1f}")
+
+    packages = {}
+    for r in records:
+        pkg = r.name.split(".")[0]
+        t, m, n = packages.get(pkg, (0.0, 0, 0))
+        packages[pkg] = (t + r.self_time, m + r.self_rss, n + 1)
+    print(f"\nTop {top} top-level packages by self import time:")
+    print(f"{'package':30s} {'modules':>8s} {'ms':>9s} {'MB':>8s}")
+    for pkg, (t, m, n) in sorted(packages.items(), key=lambda kv: kv[1][0], reverse=True)[:top]:
+        print(f"{pkg[:30]:30s} {n:8d} {t * 1000:9.1f} {_mb(m):8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile import time and memory of an app")
+    parser.add_argument("target", nargs="?", default="main:app", help="module[:attribute] to import")
+    parser.add_argument("--top", type=int, default=30, help="number of rows to print")
+    args = parser.parse_args()
+
+    module_name, _, attr = args.target.partition(":")
+    rss_start = _rss_bytes()
+    start = time.perf_counter()
+    with ImportProfiler() as profiler:
+        module = importlib.import_module(module_name)
+        if attr:
+            getattr(module, attr)
+    print_report(profiler, time.perf_counter() - start, _rss_bytes() - rss_start, args.top)
+
+
+if __name__ == "__main__":
+    main()
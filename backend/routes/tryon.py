@@ -1,10 +1,11 @@
 # backend/routes/tryon.py
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks
-import os, shutil, base64, uuid, sys, asyncio, time, requests
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks, Request, Response
+import os, shutil, base64, uuid, sys, asyncio, time, requests, hashlib
 from PIL import Image
 from io import BytesIO
 from urllib.parse import urlparse
 from typing import Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 
 # Add the backend directory to Python path to ensure imports work
 backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -13,6 +14,40 @@ if backend_dir not in sys.path:
 
 # Simple in-memory job store (small scale). For production, use Redis or DB.
 job_statuses: Dict[str, Dict] = {}
+# Result images per job, kept out of job_statuses so status polls stay small:
+# job_id -> {"preview" | "final" stage: {"full" | "preview" size: {media type: (bytes, ETag)}}},
+# starting with the outputs tryon_stages encoded
+job_results: Dict[str, Dict[str, Dict[str, Dict[str, Tuple[bytes, str]]]]] = {}
+# Finished jobs keep their images for VTRY_RESULT_TTL seconds, and at most
+# VTRY_RESULT_JOBS finished jobs keep them at all (oldest dropped first)
+RESULT_TTL = float(os.getenv("VTRY_RESULT_TTL", "900"))
+RESULT_JOBS = int(os.getenv("VTRY_RESULT_JOBS", "32"))
+
+
+def evict_job_results(now: Optional[float] = None) -> int:
+    """Drop the images of expired finished jobs, then of the oldest beyond RESULT_JOBS.
+
+    Jobs still running are never evicted. Their status stays, marked
+    results_expired so /job/{job_id}/result can answer 410. Returns the
+    number of jobs evicted.
+    """
+    now = time.time() if now is None else now
+    finished = sorted((job_statuses[jid]["completed_at"], jid) for jid in job_results
+                      if job_statuses.get(jid, {}).get("completed_at") is not None)
+    expired = [jid for done, jid in finished if now - done > RESULT_TTL]
+    kept = len(finished) - len(expired)
+    expired += [jid for _, jid in finished[len(expired):len(expired) + max(0, kept - RESULT_JOBS)]]
+    for jid in expired:
+        del job_results[jid]
+        job_statuses[jid]["results_expired"] = True
+    return len(expired)
+
+from ai_engine import result_encoder
+
+# Try-on jobs run on a dedicated executor whose size matches the model pools,
+# so every worker thread can hold its own MediaPipe/rembg instances.
+from ai_engine.model_pool import WORKER_THREADS
+tryon_executor = ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix="tryon")
 
 
 async def validate_and_save_image(image_data: bytes, save_path: str) -> bool:
@@ -343,8 +378,20 @@ async def playwright_fetch_image(url: str, save_path: str, timeout: int = 30000)
         return False, f'Playwright fetch error: {e}'
 
 
-async def process_tryon_job(job_id: str, user_img_path: str, cloth_img_path: str, cloth_type: str, timeout_seconds: int = 300):
-    """Background worker that runs the tryon process and stores result in job_statuses."""
+async def process_tryon_job(job_id: str, user_img_path: str, cloth_img_path: Optional[str], cloth_type: str,
+                            timeout_seconds: int = 300, source_url: Optional[str] = None,
+                            cleaning_backend: Optional[str] = None, blend_mode: Optional[str] = None,
+                            outputs: Optional[Tuple[str, ...]] = None, quality: Optional[int] = None,
+                            garment: Optional[dict] = None):
+    """Background worker that runs the tryon process and stores result in job_statuses.
+
+    cloth_img_path is None when source_url was already in the garment store;
+    garment is then that asset, held by the job so a store eviction before
+    the worker runs cannot lose it.
+    outputs and quality pick the result encodings (default VTRY_RESULT_OUTPUTS
+    and VTRY_RESULT_QUALITY); the bytes go to job_results. The quick preview
+    stage is published under "preview" while the final render runs.
+    """
     import traceback
 
     # Initialize job status and logs
@@ -357,15 +404,18 @@ async def process_tryon_job(job_id: str, user_img_path: str, cloth_img_path: str
         job_statuses[job_id]["status"] = "processing"
         log("Started processing")
 
-        # Validate that tryon_process is available
-        if not tryon_process:
-            err = "tryon_process function not available"
+        # Validate that tryon_stages is available
+        if not tryon_stages:
+            err = "tryon_stages function not available"
             log(err)
             job_statuses[job_id].update({"status": "failed", "error": err, "completed_at": time.time()})
             return
 
         # Check input files exist and report sizes
         for path_label, p in (("user_img", user_img_path), ("cloth_img", cloth_img_path)):
+            if p is None and path_label == "cloth_img" and garment is not None:
+                log(f"Using stored garment for {source_url}")
+                continue
             try:
                 if not p or not os.path.exists(p):
                     log(f"Missing file for {path_label}: {p}")
@@ -378,13 +428,43 @@ async def process_tryon_job(job_id: str, user_img_path: str, cloth_img_path: str
                 job_statuses[job_id].update({"status": "failed", "error": str(e), "completed_at": time.time()})
                 return
 
-        # Run the CPU-bound tryon_process in an executor with timeout
+        async def publish_preview(stage: dict):
+            try:
+                await _await_encodes(stage)
+            except Exception as e:
+                log(f"Preview encode failed: {e}")
+                return
+            job_results.setdefault(job_id, {})["preview"] = _store_outputs(stage.pop("outputs"))
+            stage.update(_result_urls(job_id, "preview", job_results[job_id]["preview"]), quality=quality)
+            job_statuses[job_id]["preview"] = stage
+            log(f"Preview ready after {stage['elapsed_ms']}ms")
+
+        # Run the CPU-bound try-on stages in an executor, one stage per call, under
+        # one overall timeout. Stages come back with their encodes submitted to the
+        # encode pool, so the try-on thread goes on while the preview is encoded
+        # and published, and is released before the final image is encoded.
         loop = asyncio.get_event_loop()
+        stages = tryon_stages(user_img_path, cloth_img_path, cloth_type, source_url=source_url,
+                              cleaning_backend=cleaning_backend, blend_mode=blend_mode,
+                              outputs=outputs or result_encoder.DEFAULT_OUTPUTS, quality=quality, viton=True,
+                              garment=garment, encode_async=True)
+        deadline = loop.time() + timeout_seconds
+        result = None
+        preview_task = None
         try:
-            result = await asyncio.wait_for(
-                loop.run_in_executor(None, lambda: tryon_process(user_img_path, cloth_img_path, cloth_type)),
-                timeout=timeout_seconds,
-            )
+            while True:
+                stage = await asyncio.wait_for(loop.run_in_executor(tryon_executor, next, stages, None),
+                                               timeout=max(deadline - loop.time(), 0))
+                if stage is None:
+                    break
+                if stage.get("stage") != "preview":
+                    result = stage
+                    continue
+                preview_task = asyncio.create_task(publish_preview(stage))
+            if preview_task is not None:
+                await preview_task
+            if result and result.get("outputs"):
+                await _await_encodes(result)
         except asyncio.TimeoutError:
             err = "Processing timed out"
             log(err)
@@ -392,23 +472,29 @@ async def process_tryon_job(job_id: str, user_img_path: str, cloth_img_path: str
             return
         except Exception as e:
             tb = traceback.format_exc()
-            log(f"Exception while running tryon_process: {e}\n{tb}")
+            log(f"Exception while running tryon_stages: {e}\n{tb}")
             job_statuses[job_id].update({"status": "failed", "error": str(e), "traceback": tb, "completed_at": time.time()})
             return
 
         # Validate result structure
         if not result or not isinstance(result, dict):
-            err = "Invalid result from tryon_process"
+            err = "Invalid result from tryon_stages"
             log(err)
             job_statuses[job_id].update({"status": "failed", "error": err, "result_raw": repr(result), "completed_at": time.time()})
             return
 
-        if "output_image_base64" not in result:
-            err = "Missing output_image_base64 in tryon result"
+        if not result.get("outputs"):
+            err = "Missing encoded outputs in tryon result"
             log(err)
             job_statuses[job_id].update({"status": "failed", "error": err, "result_keys": list(result.keys()), "completed_at": time.time()})
             return
 
+        # Keep the image out of the job record; /job/{job_id}/result serves the bytes
+        job_results.setdefault(job_id, {})["final"] = _store_outputs(result.pop("outputs"))
+        result.update(_result_urls(job_id, "final", job_results[job_id]["final"]), quality=quality)
+        log("Encoded " + ", ".join(f"{name} {r['bytes']} bytes in {r['encode_ms']}ms"
+                                   for name, r in result["encodings"].items()))
+
         # Store success result
         job_statuses[job_id].update({"status": "completed", "result": result, "completed_at": time.time()})
         log("Processing completed successfully")
@@ -426,15 +512,17 @@ async def process_tryon_job(job_id: str, user_img_path: str, cloth_img_path: str
                     log(f"Removed file {p}")
             except Exception as e:
                 log(f"Failed to remove file {p}: {e}")
+        evict_job_results()
 
 # Import AI modules
 try:
-    from ai_engine.tryon_processor import process_tryon
+    from ai_engine.tryon_processor import process_tryon, tryon_stages
     tryon_process = process_tryon
     print("✅ Successfully imported AI engine from tryon_processor")
 except ImportError as e:
     print(f"⚠️ AI modules import failed: {e}")
     tryon_process = None
+    tryon_stages = None
     print("⚠️ AI engine temporarily disabled due to import issues")
 
 router = APIRouter()
@@ -474,13 +562,190 @@ async def debug_get_job_logs(job_id: str):
         "result_keys": list(info.get("result", {}).keys()) if info.get("result") else None,
     }
 
+@router.get("/debug/models")
+async def debug_get_models():
+    """Report which AI models are loaded, how long they took and roughly how much memory each holds."""
+    from ai_engine.model_registry import registry as model_registry
+    return {"models": model_registry.status()}
+
+@router.get("/debug/metrics")
+async def debug_get_metrics():
+    """Engine counters and timings, including how long jobs waited for pooled models."""
+    from ai_engine.metrics import metrics
+    return metrics.snapshot()
+
 @router.get("/job/{job_id}")
 async def get_job_status(job_id: str):
-    """Get the status of a try-on job"""
+    """Get the status of a try-on job (metadata only; the image is at result["result_url"])"""
     if job_id not in job_statuses:
         raise HTTPException(status_code=404, detail="Job not found")
     return job_statuses[job_id]
 
+
+def _result_variant(data: bytes) -> Tuple[bytes, str]:
+    return data, '"' + hashlib.blake2b(data, digest_size=12).hexdigest() + '"'
+
+
+async def _await_encodes(stage: dict) -> dict:
+    """Replace a stage's encode futures with the encoded outputs and add its "encodings"."""
+    stage["outputs"] = {name: await asyncio.wrap_future(future) for name, future in stage["outputs"].items()}
+    stage["encodings"] = result_encoder.encode_report(stage["outputs"])
+    return stage
+
+
+def _store_outputs(outputs: Dict[str, dict]) -> Dict[str, Dict[str, Tuple[bytes, str]]]:
+    """Encoded outputs from a tryon_stages stage, by size ("preview" or "full") and media type."""
+    stored = {}
+    for name, out in outputs.items():
+        size = "preview" if name == "preview" else "full"
+        stored.setdefault(size, {})[out["media_type"]] = _result_variant(out["data"])
+    return stored
+
+
+def _result_urls(job_id: str, stage: str, stored: Dict[str, dict]) -> Dict[str, str]:
+    """result_url / preview_url (the thumbnail) for one stage's stored outputs."""
+    url = f"/job/{job_id}/result" + ("?stage=preview" if stage == "preview" else "")
+    urls = {"result_url": url} if "full" in stored else {}
+    if "preview" in stored:
+        urls["preview_url"] = url + ("&" if "?" in url else "?") + "size=preview"
+    return urls
+
+
+def negotiate_image_type(accept: Optional[str], stored=("image/png",)) -> Optional[str]:
+    """
+    Pick the result media type (one of result_encoder.RESULT_FORMATS) for an
+    Accept header, or None when none is acceptable.
+
+    Highest q wins. On a tie, types the client named explicitly beat wildcard
+    matches, then WebP beats JPEG beats PNG. A bare wildcard (or no header)
+    gets an already stored type, so nothing is re-encoded for clients that
+    do not ask.
+    """
+    from ai_engine.result_encoder import RESULT_FORMATS
+    prefs = {}
+    for item in (accept or "*/*").split(","):
+        parts = [part.strip() for part in item.split(";")]
+        if not parts[0]:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            if param.lower().startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        prefs[parts[0].lower()] = q
+
+    best, best_key = None, None
+    for rank, media_type in enumerate(RESULT_FORMATS):
+        if media_type in prefs:
+            q, explicit = prefs[media_type], True
+        elif "image/*" in prefs:
+            q, explicit = prefs["image/*"], False
+        elif "*/*" in prefs:
+            q, explicit = prefs["*/*"], False
+        else:
+            continue
+        if q <= 0:
+            continue
+        order = -rank if explicit or media_type not in stored else 1
+        key = (q, explicit, order)
+        if best_key is None or key > best_key:
+            best, best_key = media_type, key
+    return best
+
+
+def parse_byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end), inclusive, for a single "bytes=" Range header; None when the
+    header is absent, malformed or asks for several ranges (the whole body is
+    sent then). Raises ValueError when the range cannot be satisfied.
+    """
+    if not header or not header.strip().lower().startswith("bytes=") or "," in header:
+        return None
+    start_s, sep, end_s = header.strip()[6:].strip().partition("-")
+    start_s, end_s = start_s.strip(), end_s.strip()
+    if not sep or (start_s and not start_s.isdigit()) or (end_s and not end_s.isdigit()):
+        return None
+    if not start_s:
+        if not end_s:
+            return None
+        suffix = int(end_s)
+        if suffix == 0 or size == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - suffix), size - 1
+    start = int(start_s)
+    if end_s and int(end_s) < start:
+        return None
+    if start >= size:
+        raise ValueError(f"range starts past the end ({start} >= {size})")
+    return start, min(int(end_s), size - 1) if end_s else size - 1
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+@router.get("/job/{job_id}/result")
+async def get_job_result(job_id: str, request: Request, stage: str = "final", size: str = "full"):
+    """
+    The try-on image as raw bytes: the finished render, or with stage=preview
+    the quick overlay published while it runs; size=preview for the thumbnail.
+
+    The format is negotiated from Accept (WebP, JPEG or PNG; 406 if none
+    fits). Formats the job did not encode are converted from a stored one
+    on the encode pool, once per job. Responses carry an ETag
+    (If-None-Match -> 304) and honour single byte Ranges (206/416, with
+    If-Range). 409 while the job has no result for the stage yet, 410 once
+    evict_job_results dropped it.
+    """
+    info = job_statuses.get(job_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if stage not in ("preview", "final"):
+        raise HTTPException(status_code=404, detail=f"Unknown stage {stage!r}; expected preview or final")
+    if info.get("results_expired"):
+        raise HTTPException(status_code=410, detail="Job result expired; submit the try-on again")
+    stored = job_results.get(job_id, {}).get(stage)
+    if not stored:
+        raise HTTPException(status_code=409, detail=f"Job is {info.get('status')}; no {stage} result yet")
+    variants = stored.get(size)
+    if not variants:
+        raise HTTPException(status_code=404, detail=f"No {size} result for this job; available: {', '.join(stored)}")
+
+    media_type = negotiate_image_type(request.headers.get("accept"), tuple(variants))
+    if media_type is None:
+        raise HTTPException(status_code=406, detail=f"Result is available as {', '.join(result_encoder.RESULT_FORMATS)}")
+    if media_type not in variants:
+        # Lossless source when there is one
+        source = variants.get("image/png", next(iter(variants.values())))[0]
+        quality = (info.get("result" if stage == "final" else "preview") or {}).get("quality")
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(
+            result_encoder.get_encode_pool(),
+            lambda: result_encoder.encode_image(Image.open(BytesIO(source)), media_type, quality))
+        variants[media_type] = _result_variant(data)
+    data, etag = variants[media_type]
+
+    headers = {"ETag": etag, "Vary": "Accept", "Accept-Ranges": "bytes", "Cache-Control": "private, max-age=86400"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range.strip() == etag:
+        try:
+            byte_range = parse_byte_range(request.headers.get("range"), len(data))
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{len(data)}"})
+    if byte_range is None:
+        return Response(content=data, media_type=media_type, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+    return Response(content=data[start:end + 1], status_code=206, media_type=media_type, headers=headers)
+
 @router.post("/tryon")
 async def tryon_simple(
     user_image: str,
@@ -531,13 +796,28 @@ async def tryon_link(
     background_tasks: BackgroundTasks,
     link: str = Form(...),
     cloth_type: str = Form(...),
-    image: UploadFile = File(...)
+    image: UploadFile = File(...),
+    cleaning_backend: Optional[str] = Form(None),
+    blend_mode: Optional[str] = Form(None),
+    outputs: Optional[str] = Form(None),
+    quality: Optional[int] = Form(None)
 ):
     # Increase timeout for the route
     timeout_seconds = 120  # 2 minutes timeout
     print(f"\n🔵 Processing try-on request:")
     print(f"Link: {link}")
     print(f"Cloth type: {cloth_type}")
+
+    from ai_engine.blend_utils import resolve_blend_mode
+    from ai_engine.cloth_cleaner import resolve_backend
+    try:
+        cleaning_backend = resolve_backend(cloth_type, cleaning_backend)
+        blend_mode = resolve_blend_mode(blend_mode)
+        outputs = result_encoder.resolve_outputs(outputs)
+        if quality is not None and not 1 <= quality <= 100:
+            raise ValueError(f"quality must be between 1 and 100, got {quality}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     user_img_path = None
     cloth_img_path = None
@@ -575,14 +855,19 @@ async def tryon_link(
         if not await validate_and_save_image(contents, user_img_path):
             raise HTTPException(status_code=400, detail="Invalid user image format")
             
-        # Handle cloth image
-        cloth_img_path = f"uploads/cloth/cloth_{uuid.uuid4()}.png"
-
-        ok, msg = await capture_cloth_image(link, cloth_img_path)
-        if not ok:
-            raise HTTPException(status_code=400, detail=f"Failed to capture product image: {msg}")
-
-        if not tryon_process:
+        # Handle cloth image: a product link seen before is served from the garment store
+        from ai_engine.garment_store import get_garment_store
+        garment = get_garment_store().lookup_url(link, cloth_type, cleaning_backend)
+        if garment is not None:
+            print("⚡ Garment store hit, skipping product image download")
+        else:
+            cloth_img_path = f"uploads/cloth/cloth_{uuid.uuid4()}.png"
+
+            ok, msg = await capture_cloth_image(link, cloth_img_path)
+            if not ok:
+                raise HTTPException(status_code=400, detail=f"Failed to capture product image: {msg}")
+
+        if not tryon_stages:
             raise HTTPException(status_code=500, detail="Try-on processor not available")
 
         # Enqueue background job and return job_id immediately
@@ -590,7 +875,10 @@ async def tryon_link(
         job_statuses[job_id] = {"status": "created", "created_at": time.time()}
 
         # Start background processing task
-        asyncio.create_task(process_tryon_job(job_id, user_img_path, cloth_img_path, cloth_type, timeout_seconds))
+        asyncio.create_task(process_tryon_job(job_id, user_img_path, cloth_img_path, cloth_type, timeout_seconds,
+                                              source_url=link, cleaning_backend=cleaning_backend,
+                                              blend_mode=blend_mode, outputs=outputs, quality=quality,
+                                              garment=garment))
 
         return {"status": "accepted", "job_id": job_id}
             
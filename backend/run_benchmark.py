@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the try-on engine.
+
+Each benchmark is a subcommand; run them from the backend directory:
+
+    python run_benchmark.py segmenter [--repeat 20]
+    python run_benchmark.py matting [--batch-sizes 1,2,4,8] [--threads 1,2,4]
+    python run_benchmark.py enhance [--size 1024]
+    python run_benchmark.py lowres-matting [--sizes 512,1024,2048]
+    python run_benchmark.py cleaning [--fixtures DIR] [--backends u2net,classical]
+    python run_benchmark.py warp [--points 15,50,150,400] [--modes mesh,tps]
+    python run_benchmark.py blend [--coverage 0.1,0.3,0.6] [--levels 2,4,6]
+    python run_benchmark.py encode [--outputs webp,preview] [--quality 85]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+TEST_IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ai_engine", "test_images")
+DEFAULT_PERSON = os.path.join(TEST_IMAGES_DIR, "person.png")
+DEFAULT_CLOTH = os.path.join(TEST_IMAGES_DIR, "cloth.png")
+
+
+def _rss_mb():
+    from ai_engine.model_registry import _rss_bytes
+    rss = _rss_bytes()
+    return rss / (1024 * 1024) if rss is not None else float("nan")
+
+
+def time_it(fn, repeat=10, warmup=1):
+    """Run fn warmup + repeat times and return per-call timings in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "mean": statistics.mean(samples),
+        "p50": samples[len(samples) // 2],
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "min": samples[0],
+    }
+
+
+def print_table(rows, baseline=None):
+    """rows: list of (label, stats). Prints ms timings and speed-up against baseline."""
+    base = dict(rows).get(baseline) if baseline else None
+    print(f"{'variant':32s} {'mean ms':>9s} {'p50 ms':>9s} {'p95 ms':>9s} {'min ms':>9s} {'speed-up':>9s}")
+    for label, s in rows:
+        speedup = f"{base['mean'] / s['mean']:8.2f}x" if base else ""
+        print(f"{label[:32]:32s} {s['mean']:9.1f} {s['p50']:9.1f} {s['p95']:9.1f} {s['min']:9.1f} {speedup:>9s}")
+
+
+# --- segmenter ---
+
+def bench_segmenter(args):
+    """Fresh Pose graph per request (old behaviour) vs the shared, pooled segmenter."""
+    from ai_engine.image_utils import read_rgb
+    from ai_engine.model_registry import _load_mediapipe_pose_segmentation
+    from ai_engine.segmentation import ClothSegmentation, get_cloth_segmenter
+
+    rgb = read_rgb(args.person)
+    print(f"👤 {args.person} {rgb.shape[1]}x{rgb.shape[0]}, {args.repeat} runs per variant")
+
+    def per_request():
+        with ClothSegmentation(pose=_load_mediapipe_pose_segmentation()) as segmenter:
+            segmenter.segment_clothing_rgb(rgb)
+
+    shared = get_cloth_segmenter()
+
+    def pooled():
+        shared.segment_clothing_rgb(rgb)
+
+    rows = [
+        ("per-request Pose graph", time_it(per_request, args.repeat)),
+        ("shared pooled segmenter", time_it(pooled, args.repeat)),
+    ]
+    print_table(rows, baseline="per-request Pose graph")
+
+    # The old code never closed its graphs; show what that leaked per request.
+    rss_before = _rss_mb()
+    leaked = [_load_mediapipe_pose_segmentation() for _ in range(args.leak_runs)]
+    rss_after = _rss_mb()
+    print(f"\n📦 Unclosed Pose graphs: +{(rss_after - rss_before) / max(1, args.leak_runs):.1f} MB RSS each")
+    for pose in leaked:
+        pose.close()
+
+
+# --- matting ---
+
+def bench_matting(args):
+    """rembg.remove() one image at a time vs MattingEngine batches, in images/s per core."""
+    from PIL import Image
+    from ai_engine.matting import MattingEngine
+
+    cloth = Image.open(args.cloth).convert("RGBA")
+    images = [cloth] * args.images
+    print(f"👕 {args.cloth} {cloth.size[0]}x{cloth.size[1]}, {args.images} images per run, {args.repeat} runs")
+    cores_available = os.cpu_count() or 1
+
+    def report(label, stats, cores):
+        per_sec = args.images / (stats["mean"] / 1000)
+        print(f"{label[:36]:36s} {stats['mean']:10.1f} {per_sec:9.2f} {per_sec / cores:12.3f}")
+
+    print(f"{'variant':36s} {'run ms':>10s} {'img/s':>9s} {'img/s/core':>12s}")
+    try:
+        from rembg import new_session, remove
+        session = new_session(args.model)
+        report(f"rembg.remove ({args.model})", time_it(lambda: [remove(img, session=session) for img in images], args.repeat),
+               cores_available)
+    except ImportError:
+        print("rembg not installed; skipping baseline")
+
+    for threads in (int(t) for t in args.threads.split(",")):
+        for batch in (int(b) for b in args.batch_sizes.split(",")):
+            engine = MattingEngine(args.model, intra_op_threads=threads, inter_op_threads=1,
+                                   optimization_level=args.opt_level, batch_size=batch)
+            label = f"engine threads={threads} batch={batch}" + ("" if engine.batched else " (unbatched)")
+            report(label, time_it(lambda: engine.remove_batch(images), args.repeat), threads)
+
+
+def _matting_args(p):
+    p.add_argument("--model", default="u2net", help="u2net-family rembg model")
+    p.add_argument("--images", type=int, default=8, help="garments per run")
+    p.add_argument("--batch-sizes", default="1,2,4,8", help="comma-separated engine batch sizes")
+    p.add_argument("--threads", default="1,2,4", help="comma-separated intra-op thread counts")
+    p.add_argument("--opt-level", default="all", choices=["disable", "basic", "extended", "all"])
+
+
+def _segmenter_args(p):
+    p.add_argument("--leak-runs", type=int, default=3, help="unclosed graphs to build for the RSS estimate")
+
+
+# --- enhance ---
+
+def bench_enhance(args):
+    """Six chained ImageEnhance passes vs the fused enhance_garment() kernel."""
+    import numpy as np
+    from PIL import Image, ImageEnhance
+    from ai_engine.image_utils import enhance_garment
+    from ai_engine.tryon_processor import enhance_cloth_quality
+
+    cloth = Image.open(args.cloth).convert("RGBA")
+    scale = args.size / max(cloth.size)
+    cloth = cloth.resize((round(cloth.width * scale), round(cloth.height * scale)), Image.LANCZOS)
+    print(f"👕 {args.cloth} resized to {cloth.size[0]}x{cloth.size[1]}, {args.repeat} runs per variant")
+
+    def pil_chain():
+        img = enhance_cloth_quality(cloth)
+        img = ImageEnhance.Contrast(img).enhance(1.2)
+        return ImageEnhance.Brightness(img).enhance(1.1)
+
+    rows = [
+        ("PIL ImageEnhance chain", time_it(pil_chain, args.repeat)),
+        ("fused enhance_garment", time_it(lambda: enhance_garment(cloth), args.repeat)),
+    ]
+    print_table(rows, baseline="PIL ImageEnhance chain")
+
+    diff = np.abs(np.asarray(pil_chain()).astype(np.int16) - np.asarray(enhance_garment(cloth)).astype(np.int16))
+    print(f"\n🎯 |fused - PIL|: mean {diff[:, :, :3].mean():.3f}, max {diff[:, :, :3].max()}, "
+          f"{(diff[:, :, :3] > 2).mean() * 100:.2f}% of values off by more than 2, alpha max {diff[:, :, 3].max()}")
+
+
+def _enhance_args(p):
+    p.add_argument("--size", type=int, default=1024, help="longest side of the test garment")
+
+
+# --- lowres-matting ---
+
+def bench_lowres_matting(args):
+    """Full-resolution matting vs matting a model-sized copy with guided alpha upsampling."""
+    import numpy as np
+    from PIL import Image
+    from ai_engine.matting import MattingEngine
+
+    cloth = Image.open(args.cloth).convert("RGB")
+    engines = {mode: MattingEngine(args.model, batch_size=1, mode=mode, model_path=args.model_path)
+               for mode in ("full", "lowres")}
+    print(f"👕 {args.cloth}, model {args.model}, lowres side {engines['lowres'].lowres_side}px, {args.repeat} runs")
+
+    for size in (int(s) for s in args.sizes.split(",")):
+        scale = size / max(cloth.size)
+        img = cloth.resize((round(cloth.width * scale), round(cloth.height * scale)), Image.LANCZOS)
+        print(f"\n📐 {img.size[0]}x{img.size[1]}")
+        rows = [(f"{mode} ({size}px)", time_it(lambda: engine.predict_masks([img]), args.repeat))
+                for mode, engine in engines.items()]
+        print_table(rows, baseline=f"full ({size}px)")
+
+        full, low = (np.asarray(engine.predict_masks([img])[0], dtype=np.float32) / 255 for engine in engines.values())
+        inter = ((full > 0.5) & (low > 0.5)).sum()
+        union = max(1, ((full > 0.5) | (low > 0.5)).sum())
+        soft = lambda a: ((a > 0.04) & (a < 0.96)).mean() * 100
+        print(f"🎯 lowres vs full: IoU {inter / union:.4f}, mean |diff| {np.abs(full - low).mean():.4f}, "
+              f"soft-edge pixels {soft(full):.2f}% -> {soft(low):.2f}%")
+
+
+def _lowres_matting_args(p):
+    p.add_argument("--model", default="u2net", help="u2net-family rembg model")
+    p.add_argument("--model-path", default=None, help="ONNX file to use instead of rembg's download")
+    p.add_argument("--sizes", default="512,1024,2048", help="comma-separated longest sides of the test garment")
+
+
+# --- cleaning ---
+
+def bench_cleaning(args):
+    """
+    Latency and mask IoU of each cloth_cleaner backend over a fixture directory.
+
+    An image <name>.png/.jpg is scored against <name>_mask.png when that exists,
+    otherwise against the --reference backend's mask.
+    """
+    import glob
+    import numpy as np
+    from PIL import Image
+    from ai_engine import cloth_cleaner
+
+    names = args.backends.split(",") if args.backends else list(cloth_cleaner.available_backends())
+    fixtures = sorted(p for p in glob.glob(os.path.join(args.fixtures, "*"))
+                      if p.lower().endswith((".png", ".jpg", ".jpeg", ".webp")) and "_mask." not in p)
+    if args.no_fast_path:
+        cloth_cleaner.FAST_BACKGROUND = False
+    print(f"👕 {len(fixtures)} fixtures from {args.fixtures}, {args.repeat} runs each, "
+          f"fast path {'off' if args.no_fast_path else 'on'}")
+
+    def mask_of(rgba):
+        return np.asarray(rgba)[:, :, 3] > 127
+
+    results = {name: {"ms": [], "iou": []} for name in names}
+    for path in fixtures:
+        img = cloth_cleaner.prepare_garment(Image.open(path))
+        stem = os.path.splitext(path)[0]
+        truth = None
+        if os.path.exists(stem + "_mask.png"):
+            truth = np.asarray(Image.open(stem + "_mask.png").convert("L").resize(img.size, Image.NEAREST)) > 127
+        else:
+            try:
+                truth = mask_of(cloth_cleaner.get_backend(args.reference)(img))
+            except Exception as e:
+                print(f"⚠️ {os.path.basename(path)}: no ground truth and reference {args.reference} failed ({e})")
+
+        for name in names:
+            remove = cloth_cleaner.get_backend(name)
+            try:
+                fast = name in cloth_cleaner.FAST_PATH_BACKENDS
+                stats = time_it(lambda: cloth_cleaner.remove_background(img, remove, fast), args.repeat)
+            except Exception as e:
+                print(f"⚠️ {name} unavailable on {os.path.basename(path)}: {e}")
+                continue
+            results[name]["ms"].append(stats["mean"])
+            if truth is not None:
+                mask = mask_of(cloth_cleaner.remove_background(img, remove, fast))
+                results[name]["iou"].append((mask & truth).sum() / max(1, (mask | truth).sum()))
+
+    print(f"\n{'backend':20s} {'images':>7s} {'mean ms':>9s} {'max ms':>9s} {'mean IoU':>9s} {'min IoU':>9s}")
+    for name, r in results.items():
+        if not r["ms"]:
+            print(f"{name:20s} {0:7d} {'-':>9s} {'-':>9s} {'-':>9s} {'-':>9s}")
+            continue
+        iou = (f"{statistics.mean(r['iou']):9.4f} {min(r['iou']):9.4f}" if r["iou"] else f"{'-':>9s} {'-':>9s}")
+        print(f"{name:20s} {len(r['ms']):7d} {statistics.mean(r['ms']):9.1f} {max(r['ms']):9.1f} {iou}")
+
+
+def _cleaning_args(p):
+    p.add_argument("--fixtures", default=TEST_IMAGES_DIR, help="directory of garment images (and optional _mask.png files)")
+    p.add_argument("--backends", default=None, help="comma-separated backends (default: all)")
+    p.add_argument("--reference", default="u2net_cloth_seg", help="backend whose mask stands in for missing ground truth")
+    p.add_argument("--no-fast-path", action="store_true", help="always run the backend, even on clean backdrops")
+
+
+# --- warp ---
+
+def bench_warp(args):
+    """Per-triangle warpAffine loop vs the single-remap warp modes, built per call or from the map cache."""
+    import numpy as np
+    from PIL import Image
+    from ai_engine import cloth_cleaner, fit_polygons, warp_mesh
+
+    person = Image.open(args.person)
+    cloth = cloth_cleaner.prepare_garment(Image.open(args.cloth))
+    try:
+        cloth = cloth_cleaner.remove_background(cloth, cloth_cleaner.get_backend("classical")).convert("RGBA")
+    except Exception as e:
+        print(f"⚠️ Could not cut out the garment ({e}); warping it with its backdrop")
+    cloth_rgba = np.asarray(cloth.convert("RGBA"))
+    contour = fit_polygons.get_source_points(cloth)
+    W, H = person.size
+    modes = args.modes.split(",")
+    print(f"👕 {args.cloth} ({cloth.size[0]}x{cloth.size[1]}) onto a {W}x{H} canvas, {args.repeat} runs per variant")
+
+    # Destination: the garment scaled into the torso area with a smooth bend, like a fitted polygon
+    ch, cw = cloth_rgba.shape[:2]
+    scale = 0.5 * min(W / cw, H / ch)
+    for n in (int(v) for v in args.points.split(",")):
+        src = fit_polygons.resample_source_points(contour, n)
+        rel = (src - src.mean(axis=0)) * scale
+        bend = np.stack([0.06 * W * np.sin(rel[:, 1] / (0.15 * H)), 0.03 * H * np.cos(rel[:, 0] / (0.2 * W))], axis=1)
+        dst = (rel + bend + np.float32([W / 2, H * 0.45])).astype(np.float32)
+
+        print(f"\n📐 {n} mesh points, {len(warp_mesh._triangulate(dst))} triangles")
+        loop = lambda: warp_mesh.warp_rgba_mesh_triangles(cloth_rgba, src, dst, (W, H))
+        rows = [("triangle loop", time_it(loop, args.repeat))]
+        for mode in modes:
+            rows.append((f"{mode} remap", time_it(
+                lambda: warp_mesh.warp_rgba_mesh(cloth_rgba, src, dst, (W, H), cache=False, mode=mode), args.repeat)))
+            rows.append((f"{mode} remap, cached maps", time_it(
+                lambda: warp_mesh.warp_rgba_mesh(cloth_rgba, src, dst, (W, H), mode=mode), args.repeat)))
+        print_table(rows, baseline="triangle loop")
+
+        reference = loop().astype(np.int16)
+        for mode in modes:
+            remap = warp_mesh.warp_rgba_mesh(cloth_rgba, src, dst, (W, H), cache=False, mode=mode).astype(np.int16)
+            cached = warp_mesh.warp_rgba_mesh(cloth_rgba, src, dst, (W, H), mode=mode).astype(np.int16)
+            a, b = reference[:, :, 3] > 127, remap[:, :, 3] > 127
+            both = a & b
+            rgb = np.abs(reference - remap)[both][:, :3].mean() if both.any() else 0
+            print(f"🎯 {mode} vs loop: alpha IoU {both.sum() / max(1, (a | b).sum()):.4f}, "
+                  f"mean |RGB diff| where both opaque {rgb:.2f}; cached (fixed-point, "
+                  f"{warp_mesh.WARP_QUANTUM:g}px snapped) vs float maps: mean |diff| {np.abs(cached - remap).mean():.3f}")
+
+        # A re-analysed photo of the same pose moves keypoints by a fraction of a pixel
+        rng = np.random.default_rng(0)
+        near = dst + rng.uniform(-0.5, 0.5, dst.shape).astype(np.float32)
+        stats = time_it(lambda: warp_mesh.warp_rgba_mesh(cloth_rgba, src, near, (W, H), mode=modes[0]), args.repeat)
+        print(f"⚡ near-repeat pose (±0.5px jitter): {stats['mean']:.1f} ms, map cache {warp_mesh.warp_map_cache.stats()}")
+
+
+def _warp_args(p):
+    p.add_argument("--points", default="15,50,150,400", help="comma-separated mesh point counts")
+    p.add_argument("--modes", default="mesh,tps", help="comma-separated warp_mesh.WARP_MODES to compare")
+
+
+# --- blend ---
+
+def bench_blend(args):
+    """
+    enhanced_blend on the full frame and on the garment box vs the fused
+    blend_utils.composite_garment and the multi-band pyramid blend, in
+    megapixels of photo per second.
+
+    The garment is warped to cover roughly each --coverage fraction of the
+    photo. Person and clothing masks are synthetic (an ellipse and the middle
+    of the torso), so no segmentation model is needed.
+    """
+    import cv2
+    import numpy as np
+    from PIL import Image
+    from ai_engine import blend_utils, cloth_cleaner, fit_polygons, warp_mesh
+    from ai_engine.tryon_processor import enhanced_blend
+
+    person = Image.open(args.person).convert("RGBA")
+    W, H = person.size
+    user_rgba = np.asarray(person)
+    cloth = cloth_cleaner.prepare_garment(Image.open(args.cloth))
+    try:
+        cloth = cloth_cleaner.remove_background(cloth, cloth_cleaner.get_backend("classical")).convert("RGBA")
+    except Exception as e:
+        print(f"⚠️ Could not cut out the garment ({e}); blending it with its backdrop")
+    cloth_rgba = np.asarray(cloth.convert("RGBA"))
+    src = fit_polygons.get_source_points(cloth, 15)
+
+    person_mask = np.zeros((H, W), np.uint8)
+    cv2.ellipse(person_mask, (W // 2, H // 2), (W // 3, H // 2 - 10), 0, 0, 360, 255, -1)
+    clothing_mask = np.zeros((H, W), np.uint8)
+    cv2.rectangle(clothing_mask, (int(W * 0.3), int(H * 0.3)), (int(W * 0.7), int(H * 0.6)), 255, -1)
+    mp = W * H / 1e6
+    print(f"🧍 {args.person} ({W}x{H}, {mp:.2f} MP), {args.repeat} runs per variant")
+
+    ch, cw = cloth_rgba.shape[:2]
+    for coverage in (float(c) for c in args.coverage.split(",")):
+        scale = (coverage * W * H / (cw * ch)) ** 0.5
+        dst = ((src - src.mean(axis=0)) * scale + np.float32([W / 2, H / 2])).astype(np.float32)
+        patch, offset = warp_mesh.warp_rgba_patch(cloth_rgba, src, dst, (W, H))
+        canvas = warp_mesh.warp_rgba_mesh(cloth_rgba, src, dst, (W, H))
+        ph, pw = patch.shape[:2]
+        print(f"\n📐 garment box {pw}x{ph} ({pw * ph / (W * H) * 100:.0f}% of the photo)")
+
+        variants = {
+            "enhanced_blend, full frame": lambda: enhanced_blend(person, canvas, person_mask, clothing_mask),
+            "enhanced_blend, garment box": lambda: enhanced_blend(person, patch, person_mask, clothing_mask,
+                                                                  offset=offset),
+            "fused composite_garment": lambda: blend_utils.composite_garment(user_rgba.copy(), patch, offset,
+                                                                             person_mask, clothing_mask),
+        }
+        for levels in (int(v) for v in args.levels.split(",")):
+            variants[f"multiband, {levels} levels"] = (
+                lambda levels=levels: blend_utils.multiband_composite(user_rgba.copy(), patch, offset,
+                                                                      person_mask, clothing_mask, levels))
+
+        def fresh_buffers(levels=levels):
+            blend_utils._pyramid_buffers.key = None
+            return blend_utils.multiband_composite(user_rgba.copy(), patch, offset, person_mask, clothing_mask, levels)
+        variants[f"multiband, {levels} levels, no reuse"] = fresh_buffers
+        rows = [(label, time_it(fn, args.repeat)) for label, fn in variants.items()]
+        print_table(rows, baseline="enhanced_blend, full frame")
+        for label, stats in rows:
+            seconds = stats["mean"] / 1000
+            print(f"   {label:32s} {mp / seconds:7.1f} MP/s of photo, {pw * ph / 1e6 / seconds:7.1f} MP/s of garment box")
+
+        reference = np.asarray(variants["enhanced_blend, garment box"]()).astype(np.int16)
+        fused = variants["fused composite_garment"]().astype(np.int16)
+        diff = np.abs(reference - fused)
+        print(f"🎯 fused vs enhanced_blend (garment box): max |diff| {diff.max()}, mean {diff.mean():.4f}, "
+              f"{(diff > 1).mean() * 100:.3f}% of values off by more than 1")
+
+
+def _blend_args(p):
+    p.add_argument("--coverage", default="0.1,0.3,0.6", help="comma-separated fractions of the photo the garment covers")
+    p.add_argument("--levels", default="2,4,6", help="comma-separated multi-band pyramid depths; the last one is "
+                                                     "also timed with fresh buffers")
+
+
+# --- encode ---
+
+def bench_encode(args):
+    """
+    The old result step (PIL PNG with an ignored quality, encoded twice by
+    process_tryon) vs result_encoder.encode_result() for each output set,
+    with encode time and size per output.
+    """
+    import io
+    from PIL import Image
+    from ai_engine import result_encoder
+
+    result = Image.open(args.person).convert("RGB")
+    print(f"🧍 {args.person} ({result.size[0]}x{result.size[1]}), {args.repeat} runs per variant, "
+          f"{result_encoder.ENCODE_THREADS} encode threads")
+
+    def old_png():
+        for _ in range(2):
+            buf = io.BytesIO()
+            result.save(buf, format="PNG", quality=95)
+        return buf.getvalue()
+
+    variants = {"PIL PNG x2 (old)": old_png}
+    for outputs in args.outputs.split(";"):
+        variants[f"encode_result {outputs}"] = (
+            lambda outputs=outputs: result_encoder.encode_result(result, outputs.split(","), args.quality))
+    rows = [(label, time_it(fn, args.repeat)) for label, fn in variants.items()]
+    print_table(rows, baseline="PIL PNG x2 (old)")
+
+    print(f"\n🗜 old PNG: {len(old_png()) / 1024:.0f} KB")
+    for name, report in result_encoder.encode_report(
+            result_encoder.encode_result(result, list(result_encoder.OUTPUTS), args.quality)).items():
+        print(f"   {name:8s} {report['width']:5d}x{report['height']:<5d} {report['bytes'] / 1024:8.1f} KB "
+              f"{report['encode_ms']:7.1f} ms")
+
+
+def _encode_args(p):
+    p.add_argument("--outputs", default="png;webp;webp,preview;webp,jpeg,preview",
+                   help="semicolon-separated output sets, each a comma-separated list of result_encoder.OUTPUTS")
+    p.add_argument("--quality", type=int, default=None, help="WebP/JPEG quality (default VTRY_RESULT_QUALITY)")
+
+
+# name -> (function, help, extra-argument hook)
+BENCHMARKS = {
+    "segmenter": (bench_segmenter, "ClothSegmentation construction per request vs shared pooled instance", _segmenter_args),
+    "matting": (bench_matting, "rembg.remove vs the batched MattingEngine, images/s per core", _matting_args),
+    "enhance": (bench_enhance, "Chained ImageEnhance passes vs the fused garment enhancement kernel", _enhance_args),
+    "lowres-matting": (bench_lowres_matting, "Full-resolution matting vs low-resolution matting with guided upsampling",
+                       _lowres_matting_args),
+    "cleaning": (bench_cleaning, "Latency and mask IoU of each garment cleaning backend on a fixture set", _cleaning_args),
+    "warp": (bench_warp, "Per-triangle mesh warp loop vs the mesh and TPS remap warps at several densities", _warp_args),
+    "blend": (bench_blend, "enhanced_blend vs the fused float32 compositor and multi-band pyramid blending",
+              _blend_args),
+    "encode": (bench_encode, "Double PNG encode vs the pooled multi-format result encoder", _encode_args),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Try-on engine benchmarks")
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+    for name, (fn, help_text, add_args) in BENCHMARKS.items():
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--repeat", type=int, default=10, help="timed runs per variant")
+        p.add_argument("--person", default=DEFAULT_PERSON, help="person image")
+        p.add_argument("--cloth", default=DEFAULT_CLOTH, help="cloth image")
+        if add_args is not None:
+            add_args(p)
+        p.set_defaults(func=fn)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Offline catalog ingestion into the garment store.
+
+Reads a catalog file with one product link or local image path per line,
+optionally followed by a cloth type:
+
+    https://www.amazon.in/dp/B0ABC12345 shirt
+    /data/catalog/dress_0012.jpg dress
+    # comments and blank lines are ignored
+
+Links are fetched with the same logic as /tryon/link, then the garments are
+cleaned in batches in a process pool and written to the garment store
+(cleaned RGBA, contour and source mesh), where tryon_process picks them up.
+A batch goes to one worker, which mattes its u2net garments together on the
+MattingEngine (one inference per VTRY_MATTING_BATCH images). Each finished
+item is appended to a JSONL progress file, so an interrupted run resumes
+where it stopped:
+
+    python run_ingest_catalog.py catalog.txt [--workers 4] [--batch 4] [--retry-failed] [--backend classical]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_PROGRESS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads", "cache", "ingest_progress.jsonl")
+DOWNLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads", "cloth")
+BATCH_WAIT = 0.5  # seconds a partial batch waits for more fetched garments
+
+
+def _is_url(source: str) -> bool:
+    return source.startswith("http://") or source.startswith("https://")
+
+
+def read_catalog(path: str, default_cloth_type: str):
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split()
+            items.append((parts[0], parts[1].lower() if len(parts) > 1 else default_cloth_type))
+    return items
+
+
+def read_progress(path: str):
+    """Latest progress record per (source, cloth_type)."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                done[(record["source"], record["cloth_type"])] = record
+            except (ValueError, KeyError):
+                continue  # a torn last line from an interrupted run
+    return done
+
+
+# --- worker process ---
+
+def _init_worker():
+    # One job per process: a single model instance each, no oversubscribed thread pools
+    os.environ["VTRY_WORKER_THREADS"] = "1"
+    os.environ["VTRY_MODEL_POOL_SIZE"] = "1"
+    import cv2
+    cv2.setNumThreads(1)
+
+
+def _clean_batch(items, backend: str = None):
+    """(store key, None) or (None, error) for each (path, cloth_type, source_url), cleaned as one batch."""
+    from ai_engine.tryon_processor import load_garments
+    assets = load_garments([path for path, _, _ in items], [cloth_type for _, cloth_type, _ in items],
+                           [url for _, _, url in items], cleaning_backend=backend)
+    return [(None, str(asset)) if isinstance(asset, Exception) else (asset["key"], None) for asset in assets]
+
+
+# --- driver ---
+
+async def ingest(items, args):
+    from ai_engine.garment_store import get_garment_store
+    from routes.tryon import capture_cloth_image
+
+    store = get_garment_store()
+    loop = asyncio.get_running_loop()
+    fetch_slots = asyncio.Semaphore(args.fetch_concurrency)
+    # Bound fetched-but-not-yet-cleaned files on disk
+    inflight = asyncio.Semaphore(args.workers * args.batch * 2)
+    batch = []  # [(path, cloth_type, url, future)] waiting for a worker
+    flush_timer = None
+    counts = {"ok": 0, "cached": 0, "failed": 0}
+    os.makedirs(os.path.dirname(args.progress), exist_ok=True)
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool, \
+            open(args.progress, "a", encoding="utf-8") as progress:
+
+        def record(entry):
+            counts[entry["status"]] += 1
+            progress.write(json.dumps(entry) + "\n")
+            progress.flush()
+            os.fsync(progress.fileno())
+            done = sum(counts.values())
+            mark = "✅" if entry["status"] != "failed" else "❌"
+            print(f"{mark} [{done}/{len(items)}] {entry['status']:6s} {entry['seconds']:6.1f}s {entry['source'][:80]}"
+                  + (f" ({entry['error']})" if entry.get("error") else ""))
+
+        def flush():
+            nonlocal batch, flush_timer
+            if flush_timer is not None:
+                flush_timer.cancel()
+                flush_timer = None
+            if not batch:
+                return
+            items, batch = batch, []
+
+            def done(task):
+                try:
+                    outcomes = task.result()
+                except Exception as e:
+                    outcomes = [(None, str(e))] * len(items)
+                for (_, _, _, future), (key, error) in zip(items, outcomes):
+                    if error is not None:
+                        future.set_exception(RuntimeError(error))
+                    else:
+                        future.set_result(key)
+
+            loop.run_in_executor(pool, _clean_batch, [item[:3] for item in items], args.backend).add_done_callback(done)
+
+        async def clean(path, cloth_type, url):
+            """Store key of one garment, cleaned with the next batch."""
+            nonlocal flush_timer
+            future = loop.create_future()
+            batch.append((path, cloth_type, url, future))
+            if len(batch) >= args.batch:
+                flush()
+            elif flush_timer is None:
+                flush_timer = loop.call_later(BATCH_WAIT, flush)
+            return await future
+
+        async def handle(source, cloth_type):
+            async with inflight:
+                start = time.perf_counter()
+                entry = {"source": source, "cloth_type": cloth_type}
+                download = None
+                try:
+                    url = source if _is_url(source) else None
+                    if url and store.lookup_url(url, cloth_type, args.backend) is not None:
+                        entry["status"] = "cached"
+                        return
+                    if url:
+                        download = os.path.join(DOWNLOAD_DIR, f"ingest_{uuid.uuid4().hex}.png")
+                        async with fetch_slots:
+                            ok, msg = await capture_cloth_image(url, download)
+                        if not ok:
+                            raise RuntimeError(msg)
+                        path = download
+                    else:
+                        path = os.path.abspath(source)
+                        if not os.path.exists(path):
+                            raise FileNotFoundError(path)
+                    entry["key"] = await clean(path, cloth_type, url)
+                    entry["status"] = "ok"
+                except Exception as e:
+                    entry.update(status="failed", error=str(e))
+                finally:
+                    if download and os.path.exists(download):
+                        os.remove(download)
+                    entry["seconds"] = round(time.perf_counter() - start, 2)
+                    entry["finished_at"] = time.time()
+                    record(entry)
+
+        await asyncio.gather(*(handle(source, cloth_type) for source, cloth_type in items))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-clean a garment catalog into the garment store")
+    parser.add_argument("catalog", help="file with one product link or image path (and optional cloth type) per line")
+    parser.add_argument("--cloth-type", default="shirt", help="cloth type for lines that do not give one")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="cleaning processes")
+    parser.add_argument("--batch", type=int, default=int(os.getenv("VTRY_MATTING_BATCH", "4")),
+                        help="garments cleaned per worker call")
+    parser.add_argument("--fetch-concurrency", type=int, default=8, help="simultaneous product page downloads")
+    parser.add_argument("--progress", default=DEFAULT_PROGRESS, help="JSONL progress file used to resume")
+    parser.add_argument("--retry-failed", action="store_true", help="retry items that failed in a previous run")
+    parser.add_argument("--backend", default=None, help="cloth_cleaner backend; default picks one per cloth type")
+    args = parser.parse_args()
+    args.batch = max(1, args.batch)
+
+    catalog = read_catalog(args.catalog, args.cloth_type.lower())
+    previous = read_progress(args.progress)
+    skip = {"ok", "cached"} if args.retry_failed else {"ok", "cached", "failed"}
+    todo = [item for item in catalog if previous.get(item, {}).get("status") not in skip]
+    print(f"📦 {len(catalog)} catalog items, {len(catalog) - len(todo)} already done, {len(todo)} to ingest "
+          f"with {args.workers} workers in batches of {args.batch}")
+    if not todo:
+        return
+
+    start = time.perf_counter()
+    counts = asyncio.run(ingest(todo, args))
+    elapsed = time.perf_counter() - start
+    print(f"\n📊 Ingested {len(todo)} items in {elapsed:.1f}s ({len(todo) / elapsed:.2f} items/s): "
+          f"{counts['ok']} cleaned, {counts['cached']} already stored, {counts['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Checks the clean-backdrop fast path in cloth_cleaner against the garment
+segmentation model on ai_engine/test_images/cloth.png, a model wearing a
+dress on a white backdrop.
+
+    python test_cloth_cleaner.py
+"""
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ai_engine import cloth_cleaner
+
+CLOTH_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ai_engine", "test_images", "cloth.png")
+
+
+@contextmanager
+def scratch_storage():
+    """Point the garment store, person analysis cache and debug images at a temp dir."""
+    from ai_engine import cache_store, garment_store, tryon_processor
+
+    saved = garment_store._garment_store, tryon_processor.person_analysis_cache, tryon_processor.DEBUG_DIR
+    with tempfile.TemporaryDirectory(prefix="vtry_test_") as tmp:
+        garment_store._garment_store = garment_store.GarmentStore(os.path.join(tmp, "garments"))
+        tryon_processor.person_analysis_cache = cache_store.TieredCache(cache_store.LRUCache(8))
+        tryon_processor.DEBUG_DIR = tmp
+        try:
+            yield tmp
+        finally:
+            garment_store._garment_store, tryon_processor.person_analysis_cache, tryon_processor.DEBUG_DIR = saved
+
+
+def _alpha(img: Image.Image) -> np.ndarray:
+    return np.asarray(img.convert("RGBA"))[:, :, 3] > 127
+
+
+def _iou(a: np.ndarray, b: np.ndarray) -> float:
+    return (a & b).sum() / max(1, (a | b).sum())
+
+
+def test_garment_segmenter_skips_fast_path():
+    """cloth.png looks like a flat backdrop, yet u2net_cloth_seg must still run."""
+    cloth = cloth_cleaner.prepare_garment(Image.open(CLOTH_PATH))
+    assert cloth_cleaner.classify_background(cloth)["kind"] == "flat"
+    assert "u2net_cloth_seg" not in cloth_cleaner.FAST_PATH_BACKENDS
+
+    calls = []
+
+    def model(img):
+        calls.append(img)
+        return img
+
+    cloth_cleaner.remove_background(cloth, model, fast_path=False)
+    assert len(calls) == 1, "the garment segmenter was skipped"
+    cloth_cleaner.remove_background(cloth, model, fast_path=True)
+    assert len(calls) == 1, "a salient-object backend should take the fast path here"
+    print("✅ Fast path is only taken for salient-object backends")
+
+
+def test_fast_path_alpha_vs_garment_model():
+    """The threshold cutout keeps the whole person; the garment model keeps the dress."""
+    cloth = cloth_cleaner.prepare_garment(Image.open(CLOTH_PATH))
+    fast = _alpha(cloth_cleaner.threshold_cutout(cloth, cloth_cleaner.classify_background(cloth)))
+    with scratch_storage():
+        try:
+            model = _alpha(cloth_cleaner.get_backend("u2net_cloth_seg")(cloth))
+        except Exception as e:
+            print(f"⚠️ Skipping: u2net_cloth_seg unavailable ({e})")
+            return
+        cleaned = _alpha(cloth_cleaner.clean_cloth(Image.open(CLOTH_PATH), "dress"))
+
+    print(f"📊 fast-path alpha covers {fast.mean() * 100:.1f}% of the image, the model {model.mean() * 100:.1f}%; "
+          f"IoU {_iou(fast, model):.3f}")
+    assert fast.sum() > model.sum(), "the threshold cutout should include the wearer, not just the garment"
+    assert _iou(cleaned, model) > _iou(cleaned, fast), "clean_cloth('dress') kept the threshold cutout"
+    print("✅ clean_cloth uses the garment model on a worn garment")
+
+
+def test_clean_cloth_batch_mattes_once():
+    """u2net garments on busy backdrops go through one remove_batch call; flat ones take the fast path."""
+    rng = np.random.default_rng(0)
+    busy = [Image.fromarray(rng.integers(0, 256, (300, 200, 3), dtype=np.uint8)) for _ in range(3)]
+    flat = Image.new("RGB", (200, 300), "white")
+    flat.paste((30, 60, 120), (50, 60, 150, 240))
+
+    batches = []
+
+    def remove_batch(images):
+        batches.append(len(images))
+        return [img.convert("RGBA") for img in images]
+
+    real = cloth_cleaner._batch_backends["u2net"]
+    cloth_cleaner._batch_backends["u2net"] = remove_batch
+    try:
+        with scratch_storage():
+            cleaned = cloth_cleaner.clean_cloth_batch(busy + [flat], ["pant"] * 4, backend="u2net")
+    finally:
+        cloth_cleaner._batch_backends["u2net"] = real
+
+    assert batches == [3], f"expected one batch of the 3 busy garments, got {batches}"
+    assert len(cleaned) == 4 and all(img.mode == "RGBA" for img in cleaned)
+    assert np.asarray(cleaned[3])[0, 0, 3] == 0, "the flat backdrop was not cut out by the fast path"
+    print("✅ clean_cloth_batch mattes the batch in one call")
+
+
+if __name__ == "__main__":
+    test_garment_segmenter_skips_fast_path()
+    test_fast_path_alpha_vs_garment_model()
+    test_clean_cloth_batch_mattes_once()
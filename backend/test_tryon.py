@@ -6,6 +6,7 @@ import os
 import sys
 import json
 import base64
+import io
 from PIL import Image
 import requests
 
@@ -70,6 +71,73 @@ def test_tryon_with_files():
         import traceback
         traceback.print_exc()
 
+def test_stages_try_viton_first():
+    """With viton, the final render comes from VITON-HD before any mask or pose work"""
+    print("\n🧪 Testing VITON-HD ordering in tryon_stages")
+    print("=" * 50)
+
+    from ai_engine import tryon_processor
+    from test_cloth_cleaner import scratch_storage
+
+    registry = tryon_processor.model_registry
+    if registry.is_loaded("viton_hd"):
+        print("⚠️ Skipping: VITON-HD is already loaded and cannot be swapped out")
+        return
+
+    class MarkerViton:
+        def process(self, person_img, cloth_img):
+            return Image.new("RGB", person_img.size, (255, 0, 255))
+
+    analyses = []
+    analyze = tryon_processor.analyze_person_image
+
+    def recording_analyze(*args, include_masks=True, **kwargs):
+        analyses.append(include_masks)
+        return analyze(*args, include_masks=include_masks, **kwargs)
+
+    real = registry._entry("viton_hd")
+    registry.register("viton_hd", MarkerViton, "VITON-HD stand-in for test_tryon.py")
+    tryon_processor.analyze_person_image = recording_analyze
+    try:
+        with scratch_storage():
+            stages = list(tryon_processor.tryon_stages("ai_engine/test_images/person.png",
+                                                       "ai_engine/test_images/cloth.png", "dress", viton=True))
+    finally:
+        tryon_processor.analyze_person_image = analyze
+        registry.unload("viton_hd")
+        registry.register("viton_hd", real.loader, real.description, real.pool_size)
+
+    final = stages[-1]
+    assert final["stage"] == "final" and "error" not in final, final.get("error")
+    img = Image.open(io.BytesIO(base64.b64decode(final["output_image_base64"].split(",", 1)[1]))).convert("RGB")
+    assert img.getpixel((0, 0)) == (255, 0, 255), "the final render did not come from VITON-HD"
+    assert True not in analyses, "masks were computed although VITON-HD succeeded"
+    print("✅ VITON-HD is tried first, whatever the pose result")
+
+def test_inpaint_bbox_from_pose():
+    """Without a clothing mask, only the pose's shoulder-to-hip box is inpainted"""
+    print("\n🧪 Testing the pose-derived inpainting bbox")
+    print("=" * 50)
+
+    import numpy as np
+    from ai_engine import tryon_processor
+    from test_cloth_cleaner import scratch_storage
+
+    user_rgb = np.random.default_rng(0).integers(0, 256, (300, 200, 3), dtype=np.uint8)
+    names = ("left_shoulder", "right_shoulder", "left_hip", "right_hip")
+    pose = {"kps": np.array([[130, 80], [70, 80], [120, 180], [80, 180]], dtype=np.float32),
+            "index_map": {name: i for i, name in enumerate(names)}}
+
+    with scratch_storage():
+        result = tryon_processor._segment_user_image(user_rgb, None, None, pose)
+
+    assert result["body_bbox"] == (64, 74, 136, 186), result["body_bbox"]
+    changed = np.any(result["base_rgba"][:, :, :3] != user_rgb, axis=2)
+    ys, xs = np.nonzero(changed)
+    assert changed.any(), "nothing was inpainted"
+    assert xs.min() >= 64 and xs.max() < 136 and ys.min() >= 74 and ys.max() < 186, "inpainting left the pose bbox"
+    print("✅ Inpainting stays inside the pose's upper body")
+
 def test_api_endpoint():
     """Test the API endpoint"""
     print("\n🌐 Testing API Endpoint")
@@ -133,6 +201,12 @@ if __name__ == "__main__":
     # Test direct function call
     test_tryon_with_files()
     
+    # Test the staged pipeline's VITON-HD ordering
+    test_stages_try_viton_first()
+    
+    # Test the inpainting region when only the pose is known
+    test_inpaint_bbox_from_pose()
+    
     # Test API endpoint
     test_api_endpoint()
     
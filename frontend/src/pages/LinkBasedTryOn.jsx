@@ -1,9 +1,7 @@
-﻿import React, { useState, useRef } from 'react';
+﻿import React, { useState, useRef, useEffect } from 'react';
 import { Container, Form, Button, Image, Spinner, Alert } from 'react-bootstrap';
 import { Camera, Upload } from 'lucide-react';
-import axios from 'axios';
-
-const BACKEND_URL = import.meta.env.VITE_BACKEND_URL || 'http://localhost:8000';
+import { submitTryOn } from '../utils/api';
 
 const CLOTH_TYPES = ['shirt', 'pant', 'dress', 'saree']; // lowercase to match backend
 
@@ -17,6 +15,12 @@ const LinkBasedTryOn = () => {
     const [result, setResult] = useState(null);
     const fileInputRef = useRef(null);
 
+    // Results hold blob URLs; release each one once it is replaced or the page unmounts
+    const resultUrl = result?.output_image_url;
+    useEffect(() => () => {
+        if (resultUrl) URL.revokeObjectURL(resultUrl);
+    }, [resultUrl]);
+
     const handleFileChange = (e) => {
         const file = e.target.files[0];
         if (file) {
@@ -95,46 +99,26 @@ const LinkBasedTryOn = () => {
                 imageName: userImage.name 
             });
 
-            const response = await axios.post(`${BACKEND_URL}/tryon/link`, formData, {
-                headers: {
-                    'Content-Type': 'multipart/form-data',
-                },
-                timeout: 60000, // 60 second timeout
-                onUploadProgress: (progressEvent) => {
-                    const percentCompleted = Math.round((progressEvent.loaded * 100) / progressEvent.total);
-                    console.log(`Upload Progress: ${percentCompleted}%`);
-                }
-            });
+            // Submits the job and polls it; the image comes back as a blob URL.
+            // The quick preview is shown while the final render runs.
+            const data = await submitTryOn(formData, (preview) => setResult({ ...preview, isPreview: true }));
 
-            console.log('Response received:', response.data);
+            console.log('Result received:', data);
 
-            if (response.data.status === 'done') {
-                if (response.data.output_image_base64) {
-                    setResult(response.data);
-                } else {
-                    setError('Processing completed but no image was returned');
-                }
-            } else if (response.data.error) {
-                setError(response.data.error);
+            if (data.output_image_url) {
+                setResult(data);
             } else {
-                setError(response.data.detail || 'Processing failed');
+                setError(data.error || 'Processing completed but no image was returned');
             }
         } catch (error) {
             console.error('Request failed:', error);
-            
-            if (error.code === 'ECONNABORTED') {
+
+            if (error.name === 'TimeoutError') {
                 setError('Request timed out. Please try again with a smaller image.');
-            } else if (error.response) {
-                // Server responded with error status
-                const errorMessage = error.response.data?.error || 
-                                   error.response.data?.detail || 
-                                   `Server error: ${error.response.status}`;
-                setError(errorMessage);
-            } else if (error.request) {
-                // Request made but no response
+            } else if (error instanceof TypeError) {
+                // fetch rejects with a TypeError when no response arrives
                 setError('Unable to connect to server. Please check your connection.');
             } else {
-                // Other error
                 setError(`Request failed: ${error.message}`);
             }
         } finally {
@@ -154,13 +138,16 @@ const LinkBasedTryOn = () => {
         }
     };
 
-    const downloadResult = () => {
-        if (!result?.output_image_base64) return;
+    const downloadResult = async () => {
+        if (!result?.output_image_url) return;
         
         try {
+            // The result is served as WebP, JPEG or PNG depending on negotiation
+            const blob = await (await fetch(result.output_image_url)).blob();
+            const extension = blob.type.split('/')[1] || 'png';
             const link = document.createElement('a');
-            link.href = `data:image/png;base64,${result.output_image_base64}`;
-            link.download = `virtual-tryon-${Date.now()}.png`;
+            link.href = result.output_image_url;
+            link.download = `virtual-tryon-${Date.now()}.${extension.replace('jpeg', 'jpg')}`;
             document.body.appendChild(link);
             link.click();
             document.body.removeChild(link);
@@ -299,6 +286,12 @@ const LinkBasedTryOn = () => {
                     <div className="mt-5">
                         <div className="text-center mb-4">
                             <h3 style={{ color: 'var(--accent-2)' }}>🎉 Your Virtual Try-On Result</h3>
+                            {result.isPreview && (
+                                <p className="text-muted">
+                                    <Spinner animation="border" size="sm" className="me-2" />
+                                    Quick preview, the full render is on its way...
+                                </p>
+                            )}
                             {result.preferred_size && (
                                 <p className="text-muted">
                                     Recommended Size: <strong>{result.preferred_size}</strong>
@@ -308,7 +301,7 @@ const LinkBasedTryOn = () => {
                         <div className="d-flex flex-column align-items-center">
                             <div style={{ maxWidth: '500px', width: '100%' }}>
                                 <Image 
-                                    src={`data:image/png;base64,${result.output_image_base64}`}
+                                    src={result.output_image_url}
                                     alt="Virtual Try-On Result" 
                                     fluid 
                                     className="rounded-3 shadow-sm"
@@ -318,6 +311,7 @@ const LinkBasedTryOn = () => {
                             <div className="d-flex gap-2 mt-4">
                                 <Button 
                                     variant="success" 
+                                    disabled={result.isPreview} 
                                     className="d-flex align-items-center gap-2"
                                     style={{ 
                                         borderRadius: '50px',
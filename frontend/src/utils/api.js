@@ -1,7 +1,9 @@
 // src/utils/api.js
-const API_BASE_URL = 'http://localhost:8000/api';
+// The backend mounts its routes at the root, without an /api prefix
+const API_BASE_URL = import.meta.env.VITE_BACKEND_URL || 'http://localhost:8000';
 
-export async function submitTryOn(formData) {
+// onPreview(preview) is called once with the quick preview while the final render runs
+export async function submitTryOn(formData, onPreview) {
     try {
         // Submit the job
         const response = await fetch(`${API_BASE_URL}/tryon/link`, {
@@ -19,7 +21,7 @@ export async function submitTryOn(formData) {
         
         // If using job system
         if (data.job_id) {
-            return await pollJobStatus(data.job_id);
+            return await pollJobStatus(data.job_id, onPreview);
         }
         
         return data;
@@ -29,24 +31,49 @@ export async function submitTryOn(formData) {
     }
 }
 
-async function pollJobStatus(jobId) {
-    const maxAttempts = 120; // 10 minutes with 5-second intervals
-    let attempts = 0;
+// The status carries metadata only; the image itself is served as raw bytes.
+// Callers own the returned blob URL and release it with URL.revokeObjectURL.
+async function fetchResultImage(resultUrl) {
+    const image = await fetch(`${API_BASE_URL}${resultUrl}`, {
+        headers: { Accept: 'image/webp,image/jpeg;q=0.9,image/png;q=0.8' }
+    });
+    if (!image.ok) {
+        throw new Error(`HTTP error! status: ${image.status}`);
+    }
+    return URL.createObjectURL(await image.blob());
+}
 
-    while (attempts < maxAttempts) {
+async function pollJobStatus(jobId, onPreview) {
+    const deadline = Date.now() + 600000; // 10 minutes
+    let previewShown = false;
+
+    while (Date.now() < deadline) {
         const response = await fetch(`${API_BASE_URL}/job/${jobId}`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
         const status = await response.json();
 
         if (status.status === 'completed') {
-            return status.result;
+            return { ...status.result, output_image_url: await fetchResultImage(status.result.result_url) };
         }
         if (status.status === 'failed') {
             throw new Error(status.error || 'Processing failed');
         }
+        if (status.preview && !previewShown) {
+            previewShown = true;
+            if (onPreview) {
+                // The preview is best effort; the final result is still on its way if it fails
+                try {
+                    onPreview({ ...status.preview, output_image_url: await fetchResultImage(status.preview.result_url) });
+                } catch (error) {
+                    console.warn('Preview unavailable:', error);
+                }
+            }
+        }
 
-        // Wait 5 seconds before next poll
-        await new Promise(resolve => setTimeout(resolve, 5000));
-        attempts++;
+        // Poll quickly until the preview is in, then back off
+        await new Promise(resolve => setTimeout(resolve, previewShown ? 2000 : 250));
     }
 
     throw new Error('Operation timed out');